@@ -8,12 +8,84 @@ Description: A comprehensive hospital management system with modern UI and compl
 import streamlit as st
 import json
 import datetime
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import os
 from datetime import date, timedelta
 import uuid
+import sqlite3
+import sys
+import threading
+import argparse
+import time
+import re
+import contextlib
+import mmap
+import importlib
+import subprocess
+import collections
+import math
+import bisect
+import itertools
+import heapq
+import csv
+import io
+import hashlib
+import concurrent.futures
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Modules reported by `python app.py profile-imports`, eager ones first
+PROFILED_MODULES = ["streamlit", "sqlite3", "pandas", "plotly.express", "pyarrow.parquet"]
+
+# ----------------- DEFERRED IMPORTS ----------------------
+# pandas and plotly take most of a cold start but are only needed once a
+# table or chart is drawn, so they are imported on first use
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return getattr(self._module, attr)
+
+@st.cache_resource
+def get_import_timings():
+    """Seconds spent importing each deferred module in this process"""
+    return {}
+
+def timed_import(name):
+    """Import a module, recording how long the first import took"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    get_import_timings()[name] = time.perf_counter() - start
+    return module
+
+def profile_imports(modules=PROFILED_MODULES):
+    """Measure each module's cold import cost in a fresh interpreter (python -X importtime)"""
+    results = {}
+    for name in modules:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {name}"],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            results[name] = None
+            continue
+        # The last line reports the requested module with its cumulative time in microseconds
+        cumulative = completed.stderr.strip().splitlines()[-1].split("|")[1]
+        results[name] = int(cumulative) / 1_000_000
+    return results
+
+pd = LazyModule("pandas")
+px = LazyModule("plotly.express")
 
 # ----------------- PAGE CONFIGURATION ----------------------
 st.set_page_config(
@@ -28,46 +100,3583 @@ if 'current_page' not in st.session_state:
     st.session_state.current_page = 'Home'
 
 # ----------------- DATA MANAGEMENT ----------------------
+DATA_DIR = "data"
+DATA_TYPES = ["patients", "doctors", "appointments", "inventory", "billing"]
+
+# Fields of each record type as created by the add forms
+RECORD_FIELDS = {
+    "patients": ["id", "name", "age", "gender", "phone", "email", "address", "blood_group",
+                 "emergency_contact", "medical_history", "allergies", "admission_date",
+                 "discharge_date", "status", "assigned_doctor", "room_number", "created_date"],
+    "doctors": ["id", "name", "specialization", "department", "experience", "qualification",
+                "phone", "email", "consultation_fee", "schedule", "status", "created_date"],
+    "appointments": ["id", "patient_id", "patient_name", "doctor_id", "doctor_name",
+                     "appointment_date", "appointment_time", "type", "status", "notes", "created_date"],
+    "inventory": ["id", "name", "category", "type", "quantity", "unit", "price_per_unit", "supplier",
+                  "expiry_date", "minimum_stock", "status", "created_date"],
+    "billing": ["id", "patient_id", "patient_name", "bill_date", "items", "subtotal", "tax",
+                "discount", "total", "payment_status", "payment_method", "created_date"],
+}
+
+# Storage engine selection: "json" (default, one pretty-printed file per dataset),
+# "sqlite" (single indexed database file) or "jsonl" (one record per line with an
+# id -> offset index for point lookups)
+STORAGE_ENGINE = os.environ.get("HMS_STORAGE_ENGINE", "json").lower()
+SQLITE_PATH = os.environ.get("HMS_SQLITE_PATH", os.path.join(DATA_DIR, "hospital.db"))
+
+# JSON engine journal mode: inserts and updates are appended to a per-dataset
+# log that is compacted into the base file once it reaches the size threshold
+JSON_JOURNAL = os.environ.get("HMS_JSON_JOURNAL", "1") != "0"
+JOURNAL_COMPACT_BYTES = int(os.environ.get("HMS_JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+
+# Id sequences: prefix and minimum zero-padded width per entity type. The
+# counters live in data/sequences.json; see SequenceAllocator.
+SEQUENCE_PATH = os.path.join(DATA_DIR, "sequences.json")
+ID_SEQUENCES = {
+    "patients": {"prefix": "P", "width": 3},
+    "doctors": {"prefix": "D", "width": 3},
+    "appointments": {"prefix": "A", "width": 3},
+    "inventory": {"prefix": "I", "width": 3},
+    "billing": {"prefix": "B", "width": 3},
+}
+
+# Optional Parquet copies of each dataset (requires pyarrow) so reports can
+# read just the columns they chart instead of decoding every record
+COLUMNAR_ENABLED = os.environ.get("HMS_COLUMNAR", "0") == "1"
+COLUMNAR_DIR = os.path.join(DATA_DIR, "columnar")
+# A stale copy is rewritten in the background once its dataset has gone this
+# many seconds without a write; reports read the records until then
+COLUMNAR_IDLE_SECONDS = float(os.environ.get("HMS_COLUMNAR_IDLE_SECONDS", "5"))
+
+# Columns the report pages read, used by `python app.py benchmark`
+BENCHMARK_COLUMNS = {
+    "patients": ["status", "gender"],
+    "doctors": ["status", "department"],
+    "appointments": ["appointment_date", "status"],
+    "inventory": ["quantity", "price_per_unit", "minimum_stock"],
+    "billing": ["bill_date", "total", "payment_status"],
+}
+
+# Columns and dtypes of the cached analytics DataFrames (see dataset_frame):
+# categoricals for status-like fields, numeric dtypes for money and quantities,
+# "datetime" for dates
+FRAME_COLUMNS = {
+    "patients": {"id": "string", "age": "Int64", "gender": "category", "blood_group": "category",
+                 "status": "category", "admission_date": "datetime", "created_date": "datetime"},
+    "doctors": {"id": "string", "department": "category", "specialization": "category", "experience": "Int64",
+                "consultation_fee": "float64", "status": "category", "created_date": "datetime"},
+    "appointments": {"id": "string", "doctor_id": "category", "appointment_date": "datetime", "type": "category",
+                     "status": "category", "created_date": "datetime"},
+    "inventory": {"id": "string", "category": "category", "quantity": "float64", "price_per_unit": "float64",
+                  "minimum_stock": "float64", "status": "category", "expiry_date": "datetime", "created_date": "datetime"},
+    "billing": {"id": "string", "patient_id": "string", "bill_date": "datetime", "subtotal": "float64", "tax": "float64",
+                "discount": "float64", "total": "float64", "payment_status": "category", "payment_method": "category",
+                "created_date": "datetime"},
+}
+
+# Counters kept up to date on every write so metric cards never scan a dataset.
+# Each listed field gets a count per distinct value.
+AGGREGATES_PATH = os.path.join(DATA_DIR, "aggregates.json")
+REVENUE_ROLLUP_PATH = os.path.join(DATA_DIR, "revenue_rollup.json")
+AGGREGATE_COUNT_FIELDS = {
+    "patients": ["status", "gender"],
+    "doctors": ["status", "specialization"],
+    "appointments": ["status"],
+    "inventory": ["status"],
+    "billing": ["payment_status"],
+}
+
+# Secondary indexes kept next to the datasets, one file per dataset.
+# Text fields get a trigram index for substring search; categorical fields
+# get one bitmap per distinct value so filters combine with bitwise ANDs.
+INDEX_DIR = os.path.join(DATA_DIR, "indexes")
+NGRAM_INDEX_FIELDS = {
+    "patients": "name",
+}
+BITMAP_INDEX_FIELDS = {
+    "patients": ["status", "gender", "blood_group"],
+    "doctors": ["status", "department", "specialization"],
+    "appointments": ["status", "type"],
+    "inventory": ["category", "status"],
+    "billing": ["payment_status", "payment_method"],
+}
+# Date or datetime fields kept as a sorted (minutes, slot) list for range queries
+DATE_INDEX_FIELDS = {
+    "patients": "discharge_date",
+    "appointments": "appointment_at",
+}
+# Per-doctor, per-day bitmask of booked appointment slots; appointments with
+# one of FREE_SLOT_STATUSES do not hold their slot
+OCCUPANCY_INDEX_FIELDS = {
+    "appointments": "doctor_id",
+}
+FREE_SLOT_STATUSES = ["Cancelled"]
+# Fields whose exact-match keys (see lookup_keys) map to the slots filed
+# under them, for membership checks such as "is this charge billed yet"
+LOOKUP_INDEX_FIELDS = {
+    "billing": ["sources", "patient_id", "bill_date"],
+}
+NGRAM_SIZE = 3
+INDEX_FORMAT = 7
+INDEX_LOG_COMPACT_BYTES = int(os.environ.get("HMS_INDEX_LOG_COMPACT_BYTES", str(1024 * 1024)))
+SEARCH_RESULT_LIMIT = int(os.environ.get("HMS_SEARCH_RESULT_LIMIT", "50"))
+
+# Page sizes offered by paginated tables
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+
+# Display columns that sort by a different stored field
+SORT_FIELDS = {
+    "appointments": {"appointment_date": "appointment_at", "appointment_time": "appointment_at"},
+}
+
+# Number of sorted table orderings kept in memory for paging
+SORT_ORDER_CACHE_SIZE = int(os.environ.get("HMS_SORT_ORDER_CACHE_SIZE", "16"))
+
+# Number of built chart figures kept in memory across sessions
+FIGURE_CACHE_SIZE = int(os.environ.get("HMS_FIGURE_CACHE_SIZE", "32"))
+
+# Bulk import (Settings > Import Data, `python app.py import`): rows are
+# validated against the add-form record shapes and committed IMPORT_CHUNK_ROWS
+# at a time; progress and error reports live in data/imports/
+IMPORT_DIR = os.path.join(DATA_DIR, "imports")
+IMPORT_CHUNK_ROWS = int(os.environ.get("HMS_IMPORT_CHUNK_ROWS", "5000"))
+IMPORT_ERROR_FIELDS = ["row", "error", "data"]
+# Per-field rules; fields not listed are optional text stored as ""
+IMPORT_FIELDS = {
+    "patients": {
+        "name": {"type": "text", "required": True},
+        "age": {"type": "int", "required": True, "min": 0, "max": 150},
+        "gender": {"type": "choice", "required": True, "choices": ["Male", "Female", "Other"]},
+        "phone": {"type": "text", "required": True},
+        "blood_group": {"type": "choice", "choices": ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-", "Unknown"],
+                        "default": "Unknown"},
+        "admission_date": {"type": "date", "default": None},
+        "discharge_date": {"type": "date", "default": None},
+        "status": {"type": "choice", "choices": ["Admitted", "Discharged", "Transferred", "Emergency"],
+                   "default": "Admitted"},
+        "assigned_doctor": {"type": "text", "default": None},
+    },
+    "doctors": {
+        "name": {"type": "text", "required": True},
+        "specialization": {"type": "choice", "required": True, "choices": [
+            "Cardiology", "Neurology", "Orthopedics", "Pediatrics", "Dermatology",
+            "Psychiatry", "Radiology", "Anesthesiology", "Emergency Medicine",
+            "Internal Medicine", "Surgery", "Gynecology", "Ophthalmology",
+            "ENT", "Urology", "Oncology", "Other"]},
+        "department": {"type": "choice", "required": True, "choices": [
+            "Cardiology", "Neurology", "Orthopedics", "Pediatrics", "Dermatology",
+            "Psychiatry", "Radiology", "Anesthesiology", "Emergency",
+            "Internal Medicine", "Surgery", "Gynecology", "Ophthalmology",
+            "ENT", "Urology", "Oncology", "General"]},
+        "experience": {"type": "int", "required": True, "min": 0, "max": 50},
+        "qualification": {"type": "text", "required": True},
+        "phone": {"type": "text", "required": True},
+        "email": {"type": "text", "required": True},
+        "consultation_fee": {"type": "float", "required": True, "min": 0},
+        "schedule": {"type": "text", "default": "Mon-Fri: 9:00 AM - 5:00 PM"},
+        "status": {"type": "choice", "choices": ["Active", "Inactive", "On Leave"], "default": "Active"},
+    },
+    "inventory": {
+        "name": {"type": "text", "required": True},
+        "category": {"type": "choice", "required": True, "choices": ["Medicine", "Equipment", "Supplies", "Other"]},
+        "quantity": {"type": "int", "required": True, "min": 0},
+        "unit": {"type": "text", "required": True},
+        "price_per_unit": {"type": "float", "required": True, "min": 0},
+        "expiry_date": {"type": "date", "default": None},
+        "minimum_stock": {"type": "int", "min": 0, "default": 10},
+        "status": {"type": "choice", "choices": ["In Stock", "Out of Stock", "Low Stock"], "default": "In Stock"},
+    },
+}
+
+# Exports (Settings > Export Data, `python app.py export`) stream records to
+# CSV, JSON Lines or Parquet; the date filter applies to EXPORT_DATE_FIELDS
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+EXPORT_BATCH_ROWS = int(os.environ.get("HMS_EXPORT_BATCH_ROWS", "10000"))
+EXPORT_DATE_FIELDS = {
+    "patients": "admission_date",
+    "doctors": "created_date",
+    "appointments": "appointment_date",
+    "inventory": "created_date",
+    "billing": "bill_date",
+}
+
+# End-of-day billing (`python app.py billing-run`, Billing > End-of-Day Run):
+# room days are charged at BILLING_ROOM_RATE and bills are taxed at
+# BILLING_TAX_RATE percent. Pricing moves to BILLING_WORKERS processes (0: one
+# per CPU) once a run has BILLING_PARALLEL_MIN bills to price.
+BILLING_TAX_RATE = float(os.environ.get("HMS_BILLING_TAX_RATE", "10"))
+BILLING_ROOM_RATE = float(os.environ.get("HMS_BILLING_ROOM_RATE", "100"))
+BILLING_PAYMENT_METHOD = "Cash"
+BILLING_WORKERS = int(os.environ.get("HMS_BILLING_WORKERS", "0"))
+BILLING_PARALLEL_MIN = int(os.environ.get("HMS_BILLING_PARALLEL_MIN", "500"))
+
+# Stock movements (Inventory > Stock Ledger) are appended to
+# data/stock_ledger.jsonl; every STOCK_SNAPSHOT_INTERVAL movements the balances
+# of all items are saved in data/stock_snapshots/ for point-in-time stock
+STOCK_LEDGER_PATH = os.path.join(DATA_DIR, "stock_ledger.jsonl")
+STOCK_SNAPSHOT_DIR = os.path.join(DATA_DIR, "stock_snapshots")
+STOCK_SNAPSHOT_INTERVAL = int(os.environ.get("HMS_STOCK_SNAPSHOT_INTERVAL", "1000"))
+STOCK_MOVEMENT_KINDS = ["Receipt", "Dispense", "Adjustment", "Expiry Write-off"]
+
+# Seed demo records into empty datasets at startup; set to 0 in production
+SEED_SAMPLE_DATA = os.environ.get("HMS_SEED_SAMPLE_DATA", "1") != "0"
+
+# How long a cached dataset is trusted before its version is checked again.
+# Writes made by this process invalidate the cache immediately; the window
+# only delays noticing writes from other processes.
+CACHE_REVALIDATE_SECONDS = float(os.environ.get("HMS_CACHE_REVALIDATE_SECONDS", "1.0"))
+
+# Fields promoted to real SQLite columns so lookups and filters can use an index
+SQLITE_INDEXED_FIELDS = {
+    "patients": ["status"],
+    "doctors": ["status"],
+    "appointments": ["patient_id", "doctor_id", "appointment_date", "status"],
+    "inventory": ["status"],
+    "billing": ["patient_id", "bill_date", "payment_status"],
+}
+
 def ensure_data_directory():
     """Ensure data directory exists"""
-    if not os.path.exists("data"):
-        os.makedirs("data")
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on path, shared across processes where supported"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def drop_partial_line(f):
+    """Cut a half-written last line left by a crash off a file opened in 'a+b' mode; returns the new size"""
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return 0
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return end
+    position = end
+    while position > 0:
+        start = max(position - 64 * 1024, 0)
+        f.seek(start)
+        newline = f.read(position - start).rfind(b"\n")
+        if newline >= 0:
+            position = start + newline + 1
+            break
+        position = start
+    f.truncate(position)
+    return position
+
+def iter_json_array(f, chunk_size=1024 * 1024):
+    """Yield the objects of a JSON array file one at a time, holding about chunk_size characters"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    opened = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer = f.read(chunk_size)
+            position = 0
+            eof = not buffer
+            continue
+        if not opened:
+            if buffer[position] != "[":
+                raise ValueError("expected a JSON array")
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The object continues past the buffer: read on and decode it again
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield value
+
+class JSONStorage:
+    """Storage engine keeping each dataset in data/<type>.json
+
+    In journal mode single-record inserts and updates are appended to
+    data/<type>.journal.jsonl instead of rewriting the base file. Loads replay
+    the journal on top of the base file, and once the journal grows past
+    JOURNAL_COMPACT_BYTES a background thread folds it back into the base.
+    """
+
+    name = "json"
+
+    def __init__(self, data_dir=DATA_DIR, journal=JSON_JOURNAL):
+        self.data_dir = data_dir
+        self.journal = journal
+        self.on_compact = None
+        self.lock = threading.RLock()
+        self.compacting = set()
+
+    def path(self, data_type):
+        return os.path.join(self.data_dir, f"{data_type}.json")
+
+    def journal_path(self, data_type):
+        return os.path.join(self.data_dir, f"{data_type}.journal.jsonl")
+
+    def exists(self, data_type):
+        return os.path.exists(self.path(data_type)) or os.path.exists(self.journal_path(data_type))
+
+    def _base_version(self, data_type):
+        try:
+            stat = os.stat(self.path(data_type))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _journal_size(self, data_type):
+        try:
+            return os.path.getsize(self.journal_path(data_type))
+        except OSError:
+            return 0
+
+    def version(self, data_type):
+        return (self._base_version(data_type), self._journal_size(data_type))
+
+    @contextlib.contextmanager
+    def _locked(self, data_type):
+        """Serialize writers of one dataset across threads and processes"""
+        with self.lock, file_lock(os.path.join(self.data_dir, f".{data_type}.lock")):
+            yield
+
+    def _load_base(self, data_type):
+        try:
+            with open(self.path(data_type), 'r') as f:
+                return json.load(f)
+        except:
+            return []
+
+    def _read_journal(self, data_type, offset=0):
+        """Return journal records from offset on and the offset after the last complete line"""
+        try:
+            with open(self.journal_path(data_type), 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except OSError:
+            return [], offset
+
+        # A crash can leave a half-written last line; it is skipped until completed
+        end = chunk.rfind(b"\n") + 1
+        records = [json.loads(line)["record"] for line in chunk[:end].splitlines() if line.strip()]
+        return records, offset + end
+
+    def _replay(self, records, positions, entries):
+        # Every journal entry is an upsert by id, so replaying an entry that
+        # already reached the base file (e.g. after an interrupted compaction)
+        # is harmless
+        for record in entries:
+            record_id = record.get('id')
+            if record_id is not None and record_id in positions:
+                records[positions[record_id]] = record
+            else:
+                if record_id is not None:
+                    positions[record_id] = len(records)
+                records.append(record)
+
+    def snapshot(self, data_type):
+        """Load base plus journal along with the state needed to refresh it incrementally"""
+        base_version = self._base_version(data_type)
+        records = self._load_base(data_type)
+        entries, offset = self._read_journal(data_type)
+        positions = None
+        if entries:
+            positions = {record.get('id'): i for i, record in enumerate(records)}
+            self._replay(records, positions, entries)
+        return records, {"base": base_version, "offset": offset, "positions": positions}
+
+    def refresh(self, data_type, records, state, prepare=None):
+        """Apply journal entries appended since state, or return None if a full reload is needed
+
+        prepare, when given, is applied to each replayed entry before it
+        joins records.
+        """
+        if self._base_version(data_type) != state["base"] or self._journal_size(data_type) < state["offset"]:
+            return None
+        entries, offset = self._read_journal(data_type, state["offset"])
+        if not entries:
+            return records, dict(state, offset=offset)
+        if prepare:
+            entries = [prepare(record) for record in entries]
+        records = list(records)
+        if state["positions"] is None:
+            positions = {record.get('id'): i for i, record in enumerate(records)}
+        else:
+            positions = dict(state["positions"])
+        self._replay(records, positions, entries)
+        return records, {"base": state["base"], "offset": offset, "positions": positions}
+
+    def load(self, data_type):
+        return self.snapshot(data_type)[0]
+
+    def iter_records(self, data_type):
+        """Yield base plus journal records one at a time, parsing the base file incrementally"""
+        with self._locked(data_type):
+            # The journal is read before the base is opened: a compaction in
+            # between only folds entries into the base that are replayed anyway
+            pending = {}
+            for record in self._read_journal(data_type)[0]:
+                pending[record.get('id')] = record
+            try:
+                base = open(self.path(data_type), 'r')
+            except OSError:
+                base = None
+        if base is not None:
+            with base:
+                for record in iter_json_array(base):
+                    yield pending.pop(record.get('id'), record) if record.get('id') is not None else record
+        yield from pending.values()
+
+    def _write_base(self, data_type, data):
+        # Write to a temporary file first so readers never see a partial dataset
+        tmp_path = self.path(data_type) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path(data_type))
+
+    def save(self, data_type, data):
+        with self._locked(data_type):
+            self._write_base(data_type, data)
+            try:
+                os.remove(self.journal_path(data_type))
+            except FileNotFoundError:
+                pass
+
+    def _append(self, data_type, records):
+        lines = "".join(json.dumps({"op": "upsert", "record": record}) + "\n" for record in records)
+        with self._locked(data_type):
+            with open(self.journal_path(data_type), 'a+b') as f:
+                # Otherwise the first new entry would be glued to a torn line
+                drop_partial_line(f)
+                f.write(lines.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+        if size >= JOURNAL_COMPACT_BYTES:
+            self._compact_in_background(data_type)
+
+    def insert(self, data_type, record):
+        self.insert_many(data_type, [record])
+
+    def insert_many(self, data_type, records):
+        if self.journal:
+            self._append(data_type, records)
+            return
+        # Upserts by id, the same as replaying the journal would
+        data = self.load(data_type)
+        self._replay(data, {record.get('id'): i for i, record in enumerate(data)}, records)
+        self.save(data_type, data)
+
+    def update(self, data_type, record):
+        if self.journal:
+            self._append(data_type, [record])
+            return
+        data = self.load(data_type)
+        for i, existing in enumerate(data):
+            if existing.get('id') == record.get('id'):
+                data[i] = record
+                break
+        else:
+            data.append(record)
+        self.save(data_type, data)
+
+    def compact(self, data_type):
+        """Fold the journal into the base file"""
+        with self._locked(data_type):
+            if not os.path.exists(self.journal_path(data_type)):
+                return 0
+            before = self.version(data_type)
+            records = self.load(data_type)
+            self._write_base(data_type, records)
+            os.remove(self.journal_path(data_type))
+            if self.on_compact:
+                self.on_compact(data_type, before, self.version(data_type))
+            return len(records)
+
+    def _compact_in_background(self, data_type):
+        with self.lock:
+            if data_type in self.compacting:
+                return
+            self.compacting.add(data_type)
+
+        def run():
+            try:
+                self.compact(data_type)
+            finally:
+                with self.lock:
+                    self.compacting.discard(data_type)
+
+        threading.Thread(target=run, name=f"compact-{data_type}", daemon=True).start()
+
+class SQLiteStorage:
+    """Storage engine keeping every dataset as an indexed table in one SQLite file"""
+
+    name = "sqlite"
+    # insert_many returns the records it replaced
+    reports_replaced = True
+
+    def __init__(self, db_path=SQLITE_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # Streamlit serves sessions from several threads, so share one
+        # connection and serialize access to it
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dataset_versions (data_type TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            for data_type in DATA_TYPES:
+                self._create_table(data_type)
+
+    def _create_table(self, data_type):
+        fields = SQLITE_INDEXED_FIELDS.get(data_type, [])
+        columns = "".join(f", {field} TEXT" for field in fields)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {data_type} "
+            f"(seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT{columns}, data TEXT NOT NULL)"
+        )
+        for field in ["id"] + fields:
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{data_type}_{field} ON {data_type} ({field})"
+            )
+
+    def _row(self, data_type, record):
+        values = [record.get('id')]
+        for field in SQLITE_INDEXED_FIELDS.get(data_type, []):
+            value = record.get(field)
+            values.append(None if value is None else str(value))
+        values.append(json.dumps(record))
+        return values
+
+    def _bump_version(self, data_type):
+        self.conn.execute(
+            "INSERT INTO dataset_versions (data_type, version) VALUES (?, 1) "
+            "ON CONFLICT(data_type) DO UPDATE SET version = version + 1",
+            (data_type,)
+        )
+
+    def _insert_sql(self, data_type):
+        fields = ["id"] + SQLITE_INDEXED_FIELDS.get(data_type, []) + ["data"]
+        placeholders = ", ".join("?" for _ in fields)
+        return f"INSERT INTO {data_type} ({', '.join(fields)}) VALUES ({placeholders})"
+
+    def exists(self, data_type):
+        with self.lock:
+            return self.conn.execute(f"SELECT 1 FROM {data_type} LIMIT 1").fetchone() is not None
+
+    def version(self, data_type):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM dataset_versions WHERE data_type = ?", (data_type,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, data_type):
+        with self.lock:
+            rows = self.conn.execute(f"SELECT data FROM {data_type} ORDER BY seq").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_records(self, data_type):
+        """Yield records in insertion order from a read snapshot on a separate connection"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("BEGIN")
+            for row in conn.execute(f"SELECT data FROM {data_type} ORDER BY seq"):
+                yield json.loads(row[0])
+        finally:
+            conn.close()
+
+    def save(self, data_type, data):
+        sql = self._insert_sql(data_type)
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM {data_type}")
+            self.conn.executemany(sql, (self._row(data_type, record) for record in data))
+            self._bump_version(data_type)
+
+    def _update_sql(self, data_type):
+        fields = SQLITE_INDEXED_FIELDS.get(data_type, []) + ["data"]
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        return f"UPDATE {data_type} SET {assignments} WHERE id = ?"
+
+    def _stored(self, data_type, record_ids):
+        """{id: latest stored record} of those record_ids that exist"""
+        record_ids = list(dict.fromkeys(record_id for record_id in record_ids if record_id is not None))
+        stored = {}
+        # Stay well below SQLite's limit on bound parameters
+        for i in range(0, len(record_ids), 500):
+            chunk = record_ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT id, data FROM {data_type} WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY seq", chunk
+            )
+            for record_id, data in rows:
+                stored[record_id] = json.loads(data)
+        return stored
+
+    def insert(self, data_type, record):
+        return self.insert_many(data_type, [record])[0]
+
+    def insert_many(self, data_type, records):
+        """Insert records, replacing a stored record with the same id as the file engines do
+
+        Returns the replaced records in the order of records, None for new ids.
+        """
+        rows = [self._row(data_type, record) for record in records]
+        with self.lock, self.conn:
+            stored = self._stored(data_type, [row[0] for row in rows])
+            replaced, inserts, updates = [], [], []
+            for record, row in zip(records, rows):
+                old = stored.get(row[0])
+                replaced.append(old)
+                if old is None:
+                    inserts.append(row)
+                else:
+                    updates.append(row[1:] + [row[0]])
+                if row[0] is not None:
+                    stored[row[0]] = record
+            # Updates run last: one may replace a record inserted by this batch
+            self.conn.executemany(self._insert_sql(data_type), inserts)
+            self.conn.executemany(self._update_sql(data_type), updates)
+            self._bump_version(data_type)
+        return replaced
+
+    def update(self, data_type, record):
+        values = self._row(data_type, record)
+        with self.lock, self.conn:
+            cursor = self.conn.execute(self._update_sql(data_type), values[1:] + [values[0]])
+            if cursor.rowcount == 0:
+                self.conn.execute(self._insert_sql(data_type), values)
+            self._bump_version(data_type)
+
+    def get(self, data_type, record_id):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT data FROM {data_type} WHERE id = ? ORDER BY seq DESC LIMIT 1", (record_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(self, data_type, offset, limit, sort_by=None, descending=False):
+        order = "seq"
+        if sort_by:
+            if not re.fullmatch(r"\w+", sort_by):
+                raise ValueError(f"Invalid sort field '{sort_by}'")
+            direction = " DESC" if descending else ""
+            if sort_by == "id":
+                # Prefix, then the trailing number, as id_sort_key orders ids
+                prefix = "rtrim(id, '0123456789')"
+                order = f"{prefix}{direction}, CAST(substr(id, length({prefix}) + 1) AS INTEGER){direction}"
+            elif sort_by in SQLITE_INDEXED_FIELDS.get(data_type, []):
+                order = sort_by + direction
+            else:
+                order = f"json_extract(data, '$.{sort_by}')" + direction
+            # Rows with equal values keep insertion order, so pages neither overlap nor skip rows
+            order += ", seq"
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT data FROM {data_type} ORDER BY {order} LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find(self, data_type, field, value):
+        if field != "id" and field not in SQLITE_INDEXED_FIELDS.get(data_type, []):
+            return [record for record in self.load(data_type) if record.get(field) == value]
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT data FROM {data_type} WHERE {field} = ? ORDER BY seq", (str(value),)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+class JSONLStorage:
+    """Storage engine keeping each dataset as one JSON record per line in data/<type>.jsonl
+
+    A sidecar data/<type>.jsonl.idx maps record ids to byte offset and length,
+    so get() maps the file and decodes only the requested line. Inserts and
+    updates append a line to both files; the latest line for an id wins.
+    """
+
+    name = "jsonl"
+    # insert_many returns the records it replaced
+    reports_replaced = True
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.on_compact = None
+        self.lock = threading.RLock()
+        self.indexes = {}
+        self.maps = {}
+
+    def path(self, data_type):
+        return os.path.join(self.data_dir, f"{data_type}.jsonl")
+
+    def index_path(self, data_type):
+        return self.path(data_type) + ".idx"
+
+    def exists(self, data_type):
+        return os.path.exists(self.path(data_type))
+
+    def version(self, data_type):
+        try:
+            stat = os.stat(self.path(data_type))
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def _read_lines(self, data_type, offset=0):
+        """Return (record, offset, length) for complete lines from offset on, and the end offset"""
+        try:
+            with open(self.path(data_type), 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except OSError:
+            return [], offset
+
+        lines = []
+        position = 0
+        end = chunk.rfind(b"\n") + 1
+        while position < end:
+            newline = chunk.index(b"\n", position)
+            if newline > position:
+                lines.append((json.loads(chunk[position:newline]), offset + position, newline - position))
+            position = newline + 1
+        return lines, offset + end
+
+    def _apply(self, records, positions, lines):
+        for record, _, _ in lines:
+            record_id = record.get('id')
+            if record_id is not None and record_id in positions:
+                records[positions[record_id]] = record
+            else:
+                if record_id is not None:
+                    positions[record_id] = len(records)
+                records.append(record)
+
+    def snapshot(self, data_type):
+        version = self.version(data_type)
+        lines, offset = self._read_lines(data_type)
+        records, positions = [], {}
+        self._apply(records, positions, lines)
+        return records, {"version": version, "offset": offset, "positions": positions}
+
+    def refresh(self, data_type, records, state, prepare=None):
+        version = self.version(data_type)
+        if version is None or state["version"] is None or version[0] != state["version"][0] or version[1] < state["offset"]:
+            return None
+        lines, offset = self._read_lines(data_type, state["offset"])
+        if not lines:
+            return records, dict(state, version=version, offset=offset)
+        if prepare:
+            lines = [(prepare(record), position, length) for record, position, length in lines]
+        records = list(records)
+        positions = dict(state["positions"])
+        self._apply(records, positions, lines)
+        return records, {"version": version, "offset": offset, "positions": positions}
+
+    def load(self, data_type):
+        return self.snapshot(data_type)[0]
+
+    def iter_records(self, data_type):
+        """Yield the latest line of every record, reading the file line by line
+
+        A record updated since the last compaction comes at the position of its
+        latest line. Memory grows with the number of ids (a copy of the offset
+        index), not with the size of the records.
+        """
+        with self.lock:
+            try:
+                latest = dict(self._load_index(data_type))
+                f = open(self.path(data_type), 'rb')
+            except OSError:
+                return
+            end = self.indexes[data_type]["covered"]
+        with f:
+            offset = 0
+            for line in f:
+                if offset >= end:
+                    break
+                length = len(line.rstrip(b"\n"))
+                if length:
+                    record = json.loads(line)
+                    if record.get('id') is None or latest.get(record['id']) == (offset, length):
+                        yield record
+                offset += len(line)
+
+    def _write_files(self, data_type, data):
+        # Data and index are written to temporary files and renamed into place.
+        # The index header records the data file's inode so an index that
+        # belongs to an older data file is detected and rebuilt.
+        tmp_path = self.path(data_type) + ".tmp"
+        entries = []
+        with open(tmp_path, 'wb') as f:
+            for record in data:
+                line = json.dumps(record).encode()
+                entries.append((record.get('id'), f.tell(), len(line)))
+                f.write(line + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        inode = os.stat(tmp_path).st_ino
+        tmp_index = self.index_path(data_type) + ".tmp"
+        with open(tmp_index, 'w') as f:
+            f.write(f"#{inode}\n")
+            for record_id, offset, length in entries:
+                if record_id is not None:
+                    f.write(f"{record_id}\t{offset}\t{length}\n")
+        os.replace(tmp_path, self.path(data_type))
+        os.replace(tmp_index, self.index_path(data_type))
+
+    def save(self, data_type, data):
+        with self.lock, file_lock(os.path.join(self.data_dir, f".{data_type}.lock")):
+            self._write_files(data_type, data)
+            self.indexes.pop(data_type, None)
+
+    def _replaced(self, data_type, records):
+        """Records that appending records supersedes, None for new ids; call under the lock"""
+        offsets = self._load_index(data_type)
+        replaced = []
+        latest = {}
+        for record in records:
+            record_id = record.get('id')
+            if record_id in latest:
+                replaced.append(latest[record_id])
+            elif record_id is not None and record_id in offsets:
+                offset, length = offsets[record_id]
+                replaced.append(json.loads(self._map(data_type, offset + length)[offset:offset + length]))
+            else:
+                replaced.append(None)
+            if record_id is not None:
+                latest[record_id] = record
+        return replaced
+
+    def _append(self, data_type, records):
+        """Append records as the latest lines of their ids, returning the records they replaced"""
+        lines = [json.dumps(record).encode() for record in records]
+        with self.lock, file_lock(os.path.join(self.data_dir, f".{data_type}.lock")):
+            replaced = self._replaced(data_type, records)
+            with open(self.path(data_type), 'a+b') as f:
+                # A torn last line left by a crash is cut off, not appended to
+                offset = drop_partial_line(f)
+                f.write(b"".join(line + b"\n" for line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+                inode = os.fstat(f.fileno()).st_ino
+            if offset == 0:
+                # First record of a new data file starts a new index
+                with open(self.index_path(data_type), 'w') as f:
+                    f.write(f"#{inode}\n")
+            # A crash before these lines is repaired by _load_index, which
+            # indexes any tail of the data file the index does not cover
+            entries = []
+            for record, line in zip(records, lines):
+                if record.get('id') is not None:
+                    entries.append(f"{record['id']}\t{offset}\t{len(line)}\n")
+                offset += len(line) + 1
+            with open(self.index_path(data_type), 'a') as f:
+                f.write("".join(entries))
+        return replaced
+
+    def insert(self, data_type, record):
+        return self._append(data_type, [record])[0]
+
+    def insert_many(self, data_type, records):
+        return self._append(data_type, records)
+
+    def update(self, data_type, record):
+        self._append(data_type, [record])
+
+    def compact(self, data_type):
+        """Drop superseded lines left behind by updates"""
+        with self.lock, file_lock(os.path.join(self.data_dir, f".{data_type}.lock")):
+            if not self.exists(data_type):
+                return 0
+            before = self.version(data_type)
+            records = self.load(data_type)
+            self._write_files(data_type, records)
+            self.indexes.pop(data_type, None)
+            if self.on_compact:
+                self.on_compact(data_type, before, self.version(data_type))
+            return len(records)
+
+    def _rebuild_index(self, data_type):
+        with self.lock, file_lock(os.path.join(self.data_dir, f".{data_type}.lock")):
+            inode = os.stat(self.path(data_type)).st_ino
+            tmp_index = self.index_path(data_type) + ".tmp"
+            with open(tmp_index, 'w') as f:
+                f.write(f"#{inode}\n")
+                for record, offset, length in self._read_lines(data_type)[0]:
+                    if record.get('id') is not None:
+                        f.write(f"{record['id']}\t{offset}\t{length}\n")
+            os.replace(tmp_index, self.index_path(data_type))
+
+    def _load_index(self, data_type):
+        """Return the in-memory id -> (offset, length) map, reading only new index lines"""
+        try:
+            data_stat = os.stat(self.path(data_type))
+        except OSError:
+            return {}
+        try:
+            index_size = os.path.getsize(self.index_path(data_type))
+        except OSError:
+            index_size = 0
+
+        index = self.indexes.get(data_type)
+        if index is None or index["inode"] != data_stat.st_ino or index_size < index["read"]:
+            index = {"inode": None, "read": 0, "covered": 0, "offsets": {}}
+
+        if index_size > index["read"]:
+            with open(self.index_path(data_type), 'r') as f:
+                f.seek(index["read"])
+                chunk = f.read()
+            end = chunk.rfind("\n") + 1
+            for line in chunk[:end].splitlines():
+                if line.startswith("#"):
+                    index["inode"] = int(line[1:])
+                    continue
+                record_id, offset, length = line.split("\t")
+                offset, length = int(offset), int(length)
+                index["offsets"][record_id] = (offset, length)
+                index["covered"] = max(index["covered"], offset + length + 1)
+            index["read"] += len(chunk[:end].encode())
+
+        if index["inode"] != data_stat.st_ino:
+            # Index is missing or belongs to an older data file
+            self._rebuild_index(data_type)
+            self.indexes.pop(data_type, None)
+            return self._load_index(data_type)
+
+        if index["covered"] < data_stat.st_size:
+            for record, offset, length in self._read_lines(data_type, index["covered"])[0]:
+                if record.get('id') is not None:
+                    index["offsets"][record['id']] = (offset, length)
+                index["covered"] = offset + length + 1
+
+        self.indexes[data_type] = index
+        return index["offsets"]
+
+    def _map(self, data_type, end):
+        """Return a read-only mapping of the data file covering at least end bytes"""
+        mapped = self.maps.get(data_type)
+        if mapped is None or len(mapped[1]) < end or mapped[2] != os.stat(self.path(data_type)).st_ino:
+            if mapped is not None:
+                mapped[1].close()
+                mapped[0].close()
+            f = open(self.path(data_type), 'rb')
+            mapped = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), os.fstat(f.fileno()).st_ino)
+            self.maps[data_type] = mapped
+        return mapped[1]
+
+    def get(self, data_type, record_id):
+        with self.lock:
+            location = self._load_index(data_type).get(record_id)
+            if location is None:
+                return None
+            offset, length = location
+            return json.loads(self._map(data_type, offset + length)[offset:offset + length])
+
+STORAGE_ENGINES = {
+    "json": JSONStorage,
+    "sqlite": SQLiteStorage,
+    "jsonl": JSONLStorage,
+}
+
+@st.cache_resource
+def get_storage(engine=None):
+    """Return the process-wide storage engine instance"""
+    engine = engine or STORAGE_ENGINE
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine '{engine}', expected one of {sorted(STORAGE_ENGINES)}")
+    storage = STORAGE_ENGINES[engine]()
+    storage.on_compact = _dataset_compacted
+    return storage
+
+class DatasetCache:
+    """Parsed datasets shared by every session, keyed by storage version"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.serial = 0
+
+    def get(self, storage, data_type):
+        return self._lookup(storage, data_type)[0]
+
+    def get_versioned(self, storage, data_type):
+        """Return (records, serial); the serial changes whenever the cached list does"""
+        records, serial, _ = self._lookup(storage, data_type)
+        return records, serial
+
+    def get_current(self, storage, data_type):
+        """Return (records, version) checked against the storage now, ignoring the revalidation window
+
+        version is the storage version the records were read at, for
+        structures that are stamped with the version they were built from.
+        """
+        records, _, version = self._lookup(storage, data_type, revalidate=True)
+        return records, version
+
+    def _lookup(self, storage, data_type, revalidate=False):
+        key = (storage.name, data_type)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            generation = self.generations.get(key, 0)
+            # Within the revalidation window the entry is trusted as is
+            if (not revalidate and entry and entry["generation"] == generation
+                    and now - entry["checked"] < CACHE_REVALIDATE_SECONDS):
+                self.hits += 1
+                return entry["records"], entry["serial"], entry["version"]
+
+        version = storage.version(data_type)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry["generation"] == generation and entry["version"] == version:
+                entry["checked"] = now
+                self.hits += 1
+                return entry["records"], entry["serial"], entry["version"]
+            self.misses += 1
+
+        # Version and generation are captured before reading, so a write that
+        # races with the load leaves a stale key behind and forces a reload.
+        # Engines that can catch up incrementally (the JSON journal) refresh
+        # the previous entry instead of parsing the whole dataset again.
+        # Cached records are already upgraded; a refresh upgrades only the
+        # entries it replays, a full load upgrades everything once.
+        snapshot = None
+        if entry and hasattr(storage, "refresh"):
+            snapshot = storage.refresh(data_type, entry["records"], entry["state"],
+                                       lambda record: upgrade_record(data_type, record))
+            if snapshot is not None:
+                with self.lock:
+                    self.refreshes += 1
+        if snapshot is None:
+            if hasattr(storage, "snapshot"):
+                records, state = storage.snapshot(data_type)
+            else:
+                records, state = storage.load(data_type), None
+            snapshot = (upgrade_records(data_type, records), state)
+        records, state = snapshot
+        with self.lock:
+            self.serial += 1
+            self.entries[key] = {
+                "version": version,
+                "generation": generation,
+                "checked": now,
+                "records": records,
+                "state": state,
+                "serial": self.serial,
+            }
+            return records, self.serial, version
+
+    def invalidate(self, storage, data_type):
+        # The stale entry is kept so the next load can refresh it incrementally
+        key = (storage.name, data_type)
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+    def generation(self, storage, data_type):
+        """Counter bumped by every write this process makes to a dataset"""
+        with self.lock:
+            return self.generations.get((storage.name, data_type), 0)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "datasets": len(self.entries),
+                "records": sum(len(entry["records"]) for entry in self.entries.values()),
+            }
+
+@st.cache_resource
+def get_dataset_cache():
+    """Return the process-wide dataset cache"""
+    return DatasetCache()
+
+def get_cache_stats():
+    """Hit/miss counters of the dataset cache"""
+    return get_dataset_cache().stats()
 
 def load_data(data_type):
-    """Load data from JSON file"""
-    ensure_data_directory()
-    try:
-        with open(f"data/{data_type}.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    """Load all records of a dataset, served from the shared cache when unchanged"""
+    # Hand out a copy of the list so callers can append to it freely; the
+    # record dicts themselves are shared and must be treated as read-only
+    return list(get_dataset_cache().get(get_storage(), data_type))
+
+def get_derived_stores():
+    """Structures maintained alongside the datasets on every write"""
+    return [get_aggregate_store(), get_revenue_rollup_store(), get_index_store()]
+
+def _records_written(storage, data_type, before, changes):
+    # changes: (old, new) record pairs, old None for inserts
+    get_dataset_cache().invalidate(storage, data_type)
+    for store in get_derived_stores():
+        store.records_changed(storage, data_type, before, changes)
+
+def _dataset_compacted(data_type, before, after):
+    # Compaction changes the storage version but not the records
+    for store in get_derived_stores():
+        store.restamp(data_type, before, after)
 
 def save_data(data_type, data):
-    """Save data to JSON file"""
-    ensure_data_directory()
-    with open(f"data/{data_type}.json", 'w') as f:
-        json.dump(data, f, indent=4)
+    """Replace all records of a dataset in the active storage engine"""
+    storage = get_storage()
+    storage.save(data_type, data)
+    get_dataset_cache().invalidate(storage, data_type)
+    for store in get_derived_stores():
+        store.dataset_replaced(storage, data_type, data)
+
+def _stored_by_id(storage, data_type, record_ids):
+    """{id: stored record} of those record_ids that exist, checked against the storage now"""
+    wanted = {record_id for record_id in record_ids if record_id is not None}
+    if hasattr(storage, "get"):
+        found = (storage.get(data_type, record_id) for record_id in wanted)
+        return {record['id']: record for record in found if record is not None}
+    records, _ = get_dataset_cache().get_current(storage, data_type)
+    return {record.get('id'): record for record in records if record.get('id') in wanted}
+
+def insert_record(data_type, record):
+    """Add a single record without rewriting the rest of the dataset"""
+    insert_records(data_type, [record])
+
+def insert_records(data_type, records):
+    """Add several records to the storage engine in one write
+
+    Every engine upserts by id: a record whose id is already stored replaces
+    it, and the derived stores are told which record it replaced.
+    """
+    if not records:
+        return
+    storage = get_storage()
+    before = storage.version(data_type)
+    if getattr(storage, "reports_replaced", False):
+        replaced = storage.insert_many(data_type, records)
+    else:
+        stored = _stored_by_id(storage, data_type, [record.get('id') for record in records])
+        storage.insert_many(data_type, records)
+        replaced = []
+        for record in records:
+            replaced.append(stored.get(record.get('id')))
+            if record.get('id') is not None:
+                # A later record with the same id replaces this one
+                stored[record['id']] = record
+    changes = [(upgrade_record(data_type, old), record) for old, record in zip(replaced, records)]
+    _records_written(storage, data_type, before, changes)
+
+def update_record(data_type, record):
+    """Replace the stored record that has the same id"""
+    storage = get_storage()
+    old = get_record(data_type, record.get('id'))
+    before = storage.version(data_type)
+    storage.update(data_type, record)
+    _records_written(storage, data_type, before, [(old, record)])
+
+def compact_data(data_type):
+    """Fold any pending journal entries into the dataset's base file"""
+    storage = get_storage()
+    if not hasattr(storage, "compact"):
+        return 0
+    count = storage.compact(data_type)
+    get_dataset_cache().invalidate(storage, data_type)
+    return count
+
+def get_record(data_type, record_id):
+    """Fetch one record by id, or None if it does not exist"""
+    storage = get_storage()
+    if hasattr(storage, "get"):
+        return upgrade_record(data_type, storage.get(data_type, record_id))
+    for record in load_data(data_type):
+        if record.get('id') == record_id:
+            return record
+    return None
+
+def find_records(data_type, field, value):
+    """Fetch all records whose field equals value"""
+    storage = get_storage()
+    if hasattr(storage, "find"):
+        return upgrade_records(data_type, storage.find(data_type, field, value))
+    return [record for record in load_data(data_type) if record.get(field) == value]
+
+def sort_key(value):
+    """Key that orders mixed values: numbers, then text, then missing values"""
+    if value is None:
+        return (2, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    return (1, str(value))
+
+def id_sort_key(value):
+    """Key that orders record ids by prefix, then by number, so P999 comes before P1000"""
+    text = str(value or "")
+    match = re.fullmatch(r"(.*?)(\d+)", text)
+    if match:
+        return (match.group(1), int(match.group(2)), text)
+    return (text, -1, text)
+
+def field_sort_key(field):
+    """Sort key function for the values of a record field"""
+    return id_sort_key if field == "id" else sort_key
+
+class LRUCache:
+    """Mapping shared between session threads that keeps the size most recently used entries"""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        """Cached value of key (marking it recently used), or default"""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+@st.cache_resource
+def get_sort_orders():
+    """Recently used sort permutations of cached datasets"""
+    return LRUCache(SORT_ORDER_CACHE_SIZE)
+
+def sorted_order(records, cache_key, sort_by, descending=False):
+    """Row positions of records sorted by a field, cached per cached-list serial"""
+    orders = get_sort_orders()
+    key = cache_key + (sort_by, descending)
+    order = orders.get(key)
+    if order is None:
+        field_key = field_sort_key(sort_by)
+        order = sorted(range(len(records)), key=lambda i: field_key(records[i].get(sort_by)), reverse=descending)
+        orders.put(key, order)
+    return order
+
+def load_page(data_type, offset, limit, sort_by=None, descending=False):
+    """Fetch one page of a dataset, optionally sorted by a field
+
+    Engines that can page natively (SQLite) answer with a LIMIT/OFFSET query.
+    Otherwise the page is sliced from the cached dataset; a sort order is
+    computed once per dataset version and reused for every later page.
+    """
+    storage = get_storage()
+    sort_by = SORT_FIELDS.get(data_type, {}).get(sort_by, sort_by)
+    if hasattr(storage, "page"):
+        return upgrade_records(data_type, storage.page(data_type, offset, limit, sort_by, descending))
+
+    records, serial = get_dataset_cache().get_versioned(storage, data_type)
+    if not sort_by:
+        return records[offset:offset + limit]
+    order = sorted_order(records, (storage.name, data_type, serial), sort_by, descending)
+    return [records[i] for i in order[offset:offset + limit]]
+
+def migrate_from_json(target, data_dir=DATA_DIR):
+    """Copy every JSON dataset into another storage engine, replacing its contents"""
+    source = JSONStorage(data_dir)
+    counts = {}
+    for data_type in DATA_TYPES:
+        if source.exists(data_type):
+            records = source.load(data_type)
+            target.save(data_type, records)
+            counts[data_type] = len(records)
+    return counts
+
+def migrate_json_to_sqlite(data_dir=DATA_DIR, db_path=SQLITE_PATH):
+    """Copy every JSON dataset into the SQLite database, replacing its tables"""
+    target = SQLiteStorage(db_path)
+    counts = migrate_from_json(target, data_dir)
+    target.conn.close()
+    return counts
+
+def migrate_json_to_jsonl(data_dir=DATA_DIR):
+    """Copy every JSON dataset into data/<type>.jsonl with offset indexes"""
+    return migrate_from_json(JSONLStorage(data_dir), data_dir)
+
+class SequenceAllocator:
+    """Persistent per-entity id counters kept in data/sequences.json
+
+    Allocating an id reads and rewrites only this small file, so its cost
+    does not depend on how many records exist. The file is replaced
+    atomically before ids are handed out, so a crash can leave gaps but
+    never reuses an id.
+    """
+
+    def __init__(self, path=SEQUENCE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sequences):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sequences, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _seed(self, data_type):
+        """Start a sequence after the highest numeric id already stored"""
+        defaults = ID_SEQUENCES.get(data_type, {"prefix": data_type[0].upper(), "width": 3})
+        highest = 0
+        for record in load_data(data_type):
+            match = re.search(r"(\d+)$", str(record.get('id', '')))
+            if match:
+                highest = max(highest, int(match.group(1)))
+        return {"prefix": defaults["prefix"], "width": defaults["width"], "next": highest + 1}
+
+    def allocate(self, data_type, count=1):
+        """Reserve count consecutive ids and return them formatted"""
+        if count < 1:
+            return []
+        with self.lock, file_lock(self.path + ".lock"):
+            sequences = self._read()
+            sequence = sequences.get(data_type) or self._seed(data_type)
+            start = sequence["next"]
+            sequence["next"] = start + count
+            sequences[data_type] = sequence
+            self._write(sequences)
+        return [f"{sequence['prefix']}{number:0{sequence['width']}d}" for number in range(start, start + count)]
+
+    def configure(self, data_type, prefix=None, width=None):
+        """Change the prefix or zero-padded width used for new ids"""
+        with self.lock, file_lock(self.path + ".lock"):
+            sequences = self._read()
+            sequence = sequences.get(data_type) or self._seed(data_type)
+            if prefix is not None:
+                sequence["prefix"] = prefix
+            if width is not None:
+                sequence["width"] = width
+            sequences[data_type] = sequence
+            self._write(sequences)
+        return sequence
+
+    def current(self):
+        """Return the stored state of every sequence"""
+        return self._read()
+
+@st.cache_resource
+def get_sequence_allocator():
+    """Return the process-wide id sequence allocator"""
+    return SequenceAllocator(SEQUENCE_PATH)
+
+def allocate_ids(data_type, count):
+    """Reserve a block of ids, e.g. for bulk imports"""
+    return get_sequence_allocator().allocate(data_type, count)
 
 def generate_id(data_type):
     """Generate unique ID for new records"""
-    data = load_data(data_type)
-    if not data:
-        return f"{data_type[0].upper()}001"
-
-    # Extract numeric part and increment
-    ids = [item['id'] for item in data if 'id' in item]
-    if ids:
-        last_id = max(ids)
-        num = int(last_id[1:]) + 1
-        return f"{data_type[0].upper()}{num:03d}"
-    return f"{data_type[0].upper()}001"
+    return allocate_ids(data_type, 1)[0]
+
+# ----------------- COLUMNAR STORAGE ----------------------
+def _parquet():
+    """Import pyarrow on first use; columnar copies are optional"""
+    try:
+        return timed_import("pyarrow"), timed_import("pyarrow.parquet")
+    except ImportError:
+        return None, None
+
+def columnar_path(data_type):
+    return os.path.join(COLUMNAR_DIR, f"{data_type}.parquet")
+
+def columnar_enabled():
+    """Whether reports read from Parquet copies of the datasets"""
+    return COLUMNAR_ENABLED and _parquet()[0] is not None
+
+def _records_to_table(records):
+    """Build an Arrow table, storing columns with inconsistent types as strings"""
+    pa, _ = _parquet()
+    columns = {}
+    for record in records:
+        for key in record:
+            columns.setdefault(key, None)
+    arrays = []
+    for column in columns:
+        values = [record.get(column) for record in records]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else str(value) for value in values], pa.string()))
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+def convert_to_columnar(data_type, records=None):
+    """Write a Parquet copy of a dataset tagged with the storage version it reflects"""
+    pa, pq = _parquet()
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar storage: pip install pyarrow")
+    # Capture the version first so a concurrent write leaves the copy marked stale
+    version = get_storage().version(data_type)
+    if records is None:
+        records = load_data(data_type)
+    table = _records_to_table(records)
+    table = table.replace_schema_metadata({"hms_version": json.dumps(version)})
+    os.makedirs(COLUMNAR_DIR, exist_ok=True)
+    tmp_path = columnar_path(data_type) + ".tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, columnar_path(data_type))
+    return len(records)
+
+def _columnar_is_current(data_type):
+    _, pq = _parquet()
+    try:
+        metadata = pq.read_schema(columnar_path(data_type)).metadata or {}
+    except (OSError, ValueError):
+        return False
+    version = json.loads(metadata.get(b"hms_version", b"null"))
+    # JSON round trips tuples as lists
+    return version == json.loads(json.dumps(get_storage().version(data_type)))
+
+class ColumnarRefresher:
+    """Rewrites stale Parquet copies on a background thread, off the request path"""
+
+    def __init__(self, idle_seconds=COLUMNAR_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def request(self, data_type):
+        """Schedule a rewrite of the dataset's copy unless one is already waiting"""
+        with self.lock:
+            if data_type in self.pending:
+                return
+            self.pending.add(data_type)
+
+        def run():
+            try:
+                # Wait for a quiet spell so a burst of writes costs one rewrite
+                version = get_storage().version(data_type)
+                while True:
+                    time.sleep(self.idle_seconds)
+                    latest = get_storage().version(data_type)
+                    if latest == version:
+                        break
+                    version = latest
+                if not _columnar_is_current(data_type):
+                    convert_to_columnar(data_type)
+            finally:
+                with self.lock:
+                    self.pending.discard(data_type)
+
+        threading.Thread(target=run, name=f"columnar-{data_type}", daemon=True).start()
+
+@st.cache_resource
+def get_columnar_refresher():
+    """Return the process-wide background writer of Parquet copies"""
+    return ColumnarRefresher(COLUMNAR_IDLE_SECONDS)
+
+def _read_columnar(data_type, columns):
+    """({column: [values]}, storage version) read from the Parquet copy"""
+    _, pq = _parquet()
+    path = columnar_path(data_type)
+    available = set(pq.read_schema(path).names)
+    table = pq.read_table(path, columns=[column for column in columns if column in available])
+    data = table.to_pydict()
+    version = json.loads((table.schema.metadata or {}).get(b"hms_version", b"null"))
+    return {column: data.get(column, [None] * table.num_rows) for column in columns}, version
+
+def load_columns(data_type, columns):
+    """Load only the given columns of a dataset as {column: [values]}
+
+    Reads the Parquet copy when columnar storage is enabled and the copy is
+    current; otherwise projects the (cached) records and has the copy
+    rewritten in the background. Columns missing from the dataset come back
+    filled with None.
+    """
+    if columnar_enabled() and _columnar_is_current(data_type):
+        return _read_columnar(data_type, columns)[0]
+
+    records = load_data(data_type)
+    if columnar_enabled():
+        get_columnar_refresher().request(data_type)
+    return {column: [record.get(column) for record in records] for column in columns}
+
+def current_columns(data_type, columns):
+    """load_columns checked against the storage now, with the storage version the values were read at"""
+    if columnar_enabled() and _columnar_is_current(data_type):
+        return _read_columnar(data_type, columns)
+
+    records, version = get_dataset_cache().get_current(get_storage(), data_type)
+    if columnar_enabled():
+        get_columnar_refresher().request(data_type)
+    return {column: [record.get(column) for record in records] for column in columns}, version
+
+def run_benchmark(data_types=None):
+    """Compare JSON and Parquet sizes and load times for each dataset"""
+    storage = get_storage()
+    results = []
+    for data_type in data_types or DATA_TYPES:
+        result = {"dataset": data_type}
+
+        start = time.perf_counter()
+        records = storage.load(data_type)
+        result["records"] = len(records)
+        result["load_s"] = time.perf_counter() - start
+        if storage.name == "json":
+            result["size_bytes"] = sum(
+                os.path.getsize(path) for path in (storage.path(data_type), storage.journal_path(data_type))
+                if os.path.exists(path)
+            )
+
+        if _parquet()[0] is not None and records:
+            _, pq = _parquet()
+            convert_to_columnar(data_type, records)
+            path = columnar_path(data_type)
+            result["parquet_bytes"] = os.path.getsize(path)
+
+            start = time.perf_counter()
+            pq.read_table(path).to_pylist()
+            result["parquet_load_s"] = time.perf_counter() - start
+
+            report_columns = [column for column in BENCHMARK_COLUMNS.get(data_type, []) if column in pq.read_schema(path).names]
+            start = time.perf_counter()
+            pq.read_table(path, columns=report_columns).to_pydict()
+            result["parquet_columns_s"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+# ----------------- ANALYTICS FRAMES ----------------------
+class FrameCache:
+    """Typed DataFrames of the datasets shared by every session, keyed by storage version
+
+    Frames are shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, storage, data_type):
+        key = (storage.name, data_type)
+        version = version_key(storage.version(data_type))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version:
+                return entry[1]
+        # Keyed on the version the frame was built from; load_data may serve
+        # records from before another process's write within its window
+        frame, version = build_frame(data_type)
+        with self.lock:
+            self.entries[key] = (version_key(version), frame)
+        return frame
+
+@st.cache_resource
+def get_frame_cache():
+    """Return the process-wide analytics frame cache"""
+    return FrameCache()
+
+def build_frame(data_type):
+    """(DataFrame of a dataset's FRAME_COLUMNS with their dtypes, storage version it reflects)
+
+    Unparsable values become missing.
+    """
+    columns = FRAME_COLUMNS[data_type]
+    data, version = current_columns(data_type, list(columns))
+    frame = pd.DataFrame(data)
+    for column, dtype in columns.items():
+        if dtype == "datetime":
+            frame[column] = pd.to_datetime(frame[column], errors="coerce", format="ISO8601")
+        elif dtype == "category":
+            frame[column] = frame[column].astype("category")
+        elif dtype == "string":
+            frame[column] = frame[column].astype("string")
+        else:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(dtype)
+    return frame, version
+
+def dataset_frame(data_type):
+    """Cached typed DataFrame of a dataset for vectorized reports (read-only)"""
+    return get_frame_cache().get(get_storage(), data_type)
+
+def recent_records(data_type, field, count):
+    """The count records with the latest datetime in field, newest first"""
+    frame = dataset_frame(data_type)
+    return records_by_id(data_type, frame.nlargest(count, field)["id"].tolist())
+
+def low_stock_frame():
+    """Inventory rows at or below their minimum stock"""
+    frame = dataset_frame("inventory")
+    return frame[frame["quantity"].fillna(0) <= frame["minimum_stock"].fillna(0)]
+
+def inventory_by_category():
+    """Items, units, stock value and low-stock count per inventory category"""
+    frame = dataset_frame("inventory")
+    return (frame.assign(value=frame["quantity"].fillna(0) * frame["price_per_unit"].fillna(0),
+                         low_stock=frame["quantity"].fillna(0) <= frame["minimum_stock"].fillna(0))
+                 .groupby("category", observed=True)
+                 .agg(items=("id", "size"), quantity=("quantity", "sum"), value=("value", "sum"), low_stock=("low_stock", "sum"))
+                 .reset_index())
+
+# ----------------- AGGREGATES ----------------------
+def version_key(version):
+    """Normalize a storage version so it compares equal after a JSON round trip"""
+    return json.dumps(version)
+
+def record_aggregates(data_type, record):
+    """Counter contributions of a single record to its dataset's aggregates"""
+    counters = {"count": 1}
+    for field in AGGREGATE_COUNT_FIELDS.get(data_type, []):
+        value = record.get(field)
+        counters[f"{field}={'Unknown' if value is None else value}"] = 1
+
+    if data_type == "patients":
+        if 'emergency' in (record.get('medical_history') or '').lower():
+            counters["emergency"] = 1
+    elif data_type == "doctors":
+        counters["experience"] = record.get('experience') or 0
+    elif data_type == "inventory":
+        counters["value"] = (record.get('quantity') or 0) * (record.get('price_per_unit') or 0)
+        if (record.get('quantity') or 0) <= (record.get('minimum_stock') or 0):
+            counters["low_stock"] = 1
+    return counters
+
+class AggregateStore:
+    """Per-dataset counters kept in step with every write, persisted to data/aggregates.json
+
+    Each dataset's counters are stamped with the storage version they
+    describe. A write made by this process moves the stamp forward together
+    with the data; counters stamped with any other version (a write from
+    another process, a crash between the two writes) are rebuilt on the next
+    read.
+    """
+
+    def __init__(self, path=AGGREGATES_PATH, data_types=None):
+        self.path = path
+        self.data_types = data_types or DATA_TYPES
+        self.lock = threading.RLock()
+        self.state = {}
+        self.state_version = None
+        # (storage name, data_type) -> (checked at, dataset generation, entry)
+        self.checked = {}
+
+    def contributions(self, data_type, record):
+        return record_aggregates(data_type, record)
+
+    def prunable(self, key):
+        # Per-value counters are dropped once no record has that value
+        return "=" in key
+
+    def _apply(self, counters, data_type, record, sign):
+        for key, value in self.contributions(data_type, record).items():
+            counters[key] = counters.get(key, 0) + sign * value
+            if counters[key] == 0 and self.prunable(key):
+                del counters[key]
+
+    def compute(self, data_type, records):
+        counters = {}
+        for record in records:
+            self._apply(counters, data_type, record, 1)
+        return counters
+
+    def _read(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return {}
+        if (stat.st_mtime_ns, stat.st_size) != self.state_version:
+            try:
+                with open(self.path, 'r') as f:
+                    self.state = json.load(f)
+            except ValueError:
+                self.state = {}
+            self.state_version = (stat.st_mtime_ns, stat.st_size)
+        return self.state
+
+    def _write(self, state):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    @contextlib.contextmanager
+    def _updating(self):
+        with self.lock, file_lock(self.path + ".lock"):
+            # Re-read under the lock so other processes' datasets are kept
+            state = dict(self._read())
+            yield state
+            self._write(state)
+
+    def get(self, storage, data_type):
+        return self.get_versioned(storage, data_type)[0]
+
+    def get_versioned(self, storage, data_type):
+        """Return (counters, version key of the records they were computed from)"""
+        # Like DatasetCache, counters are trusted for CACHE_REVALIDATE_SECONDS
+        # unless this process wrote to the dataset, so a rerun checks the
+        # storage version and the aggregates file at most once
+        key = (storage.name, data_type)
+        now = time.monotonic()
+        generation = get_dataset_cache().generation(storage, data_type)
+        with self.lock:
+            checked = self.checked.get(key)
+            if checked and checked[1] == generation and now - checked[0] < CACHE_REVALIDATE_SECONDS:
+                return checked[2]["counters"], checked[2]["version"]
+        version = version_key(storage.version(data_type))
+        with self.lock:
+            entry = self._read().get(data_type)
+        if not entry or entry["version"] != version:
+            entry = self._rebuild(storage, data_type)
+        with self.lock:
+            self.checked[key] = (now, generation, entry)
+        return entry["counters"], entry["version"]
+
+    def rebuild(self, storage, data_type, records=None, version=None):
+        return self._rebuild(storage, data_type, records, version)["counters"]
+
+    def _rebuild(self, storage, data_type, records=None, version=None):
+        # Stamped with the version the records were read at; load_data could
+        # still be serving a copy from before another process's write
+        if records is None:
+            records, version = get_dataset_cache().get_current(storage, data_type)
+        elif version is None:
+            version = storage.version(data_type)
+        entry = {"version": version_key(version), "counters": self.compute(data_type, records)}
+        with self._updating() as state:
+            state[data_type] = entry
+            self.checked.pop((storage.name, data_type), None)
+        return entry
+
+    def records_changed(self, storage, data_type, before, changes):
+        if data_type not in self.data_types:
+            return
+        after = version_key(storage.version(data_type))
+        with self._updating() as state:
+            entry = state.get(data_type)
+            if not entry or entry["version"] != version_key(before):
+                return
+            counters = dict(entry["counters"])
+            for old, new in changes:
+                for record, sign in ((old, -1), (new, 1)):
+                    if record is not None:
+                        self._apply(counters, data_type, record, sign)
+            state[data_type] = {"version": after, "counters": counters}
+
+    def dataset_replaced(self, storage, data_type, records):
+        if data_type in self.data_types:
+            self.rebuild(storage, data_type, records)
+
+    def restamp(self, data_type, before, after):
+        if data_type not in self.data_types:
+            return
+        with self._updating() as state:
+            entry = state.get(data_type)
+            if entry and entry["version"] == version_key(before):
+                entry["version"] = version_key(after)
+
+@st.cache_resource
+def get_aggregate_store():
+    """Return the process-wide aggregate store"""
+    return AggregateStore(AGGREGATES_PATH)
+
+def get_aggregates(data_type):
+    """Counters of a dataset: count, field=value counts and sums (see record_aggregates)"""
+    return get_aggregate_store().get(get_storage(), data_type)
+
+def count_by(data_type, field):
+    """{value: count} for one of the AGGREGATE_COUNT_FIELDS of a dataset"""
+    prefix = f"{field}="
+    return {
+        key[len(prefix):]: count
+        for key, count in get_aggregates(data_type).items()
+        if key.startswith(prefix) and count
+    }
+
+def rebuild_aggregates(data_types=None):
+    """Recompute aggregates from the stored records, e.g. after manual data edits"""
+    storage = get_storage()
+    store = get_aggregate_store()
+    rebuilt = {}
+    for data_type in data_types or DATA_TYPES:
+        version = storage.version(data_type)
+        rebuilt[data_type] = store.rebuild(storage, data_type, storage.load(data_type), version)
+    return rebuilt
+
+# ----------------- REVENUE ROLLUP ----------------------
+# Billing totals pre-aggregated per (grain, period, payment_status,
+# payment_method) cell, grain being "day" (YYYY-MM-DD) or "month" (YYYY-MM).
+# Counters are named "count|<cell>" and "total|<cell>", totals in cents so
+# adding and removing bills stays exact.
+REVENUE_GRAINS = {"day": 10, "month": 7}
+REVENUE_FIELDS = ["payment_status", "payment_method"]
+
+def revenue_cells(record):
+    """Counter contributions of one bill to the revenue rollup"""
+    bill_date = str(record.get('bill_date') or "")
+    cents = round((record.get('total') or 0) * 100)
+    values = "|".join(str(record.get(field) or "Unknown") for field in REVENUE_FIELDS)
+    counters = {}
+    for grain, length in REVENUE_GRAINS.items():
+        cell = f"{grain}|{bill_date[:length] if len(bill_date) >= length else 'Unknown'}|{values}"
+        counters[f"count|{cell}"] = 1
+        if cents:
+            counters[f"total|{cell}"] = cents
+    return counters
+
+class RevenueRollupStore(AggregateStore):
+    """Billing revenue by day and month × payment status × method, persisted to data/revenue_rollup.json"""
+
+    def __init__(self, path=REVENUE_ROLLUP_PATH):
+        super().__init__(path, ["billing"])
+
+    def contributions(self, data_type, record):
+        return revenue_cells(record)
+
+    def prunable(self, key):
+        return True
+
+@st.cache_resource
+def get_revenue_rollup_store():
+    """Return the process-wide revenue rollup store"""
+    return RevenueRollupStore(REVENUE_ROLLUP_PATH)
+
+def revenue_cube(grain="month"):
+    """[(period, payment_status, payment_method, bill count, revenue)] at the given grain"""
+    cells = {}
+    for key, value in get_revenue_rollup_store().get(get_storage(), "billing").items():
+        measure, cell_grain, cell = key.split("|", 2)
+        if cell_grain == grain:
+            cells.setdefault(cell, {})[measure] = value
+    return [(*cell.split("|"), measures.get("count", 0), measures.get("total", 0) / 100)
+            for cell, measures in sorted(cells.items())]
+
+def revenue_series(grain="month", by=None, filters=None):
+    """Revenue per period in date order, {period: total}, or {period: {value: total}} split by one of REVENUE_FIELDS
+
+    Bills without a valid bill_date are left out.
+    """
+    series = {}
+    for period, *values, _, total in revenue_cube(grain):
+        cell = dict(zip(REVENUE_FIELDS, values))
+        if period == "Unknown" or any(cell[field] != value for field, value in (filters or {}).items()):
+            continue
+        if by is None:
+            series[period] = series.get(period, 0) + total
+        else:
+            split = series.setdefault(period, {})
+            split[cell[by]] = split.get(cell[by], 0) + total
+    return series
+
+def revenue_total(filters=None):
+    """Revenue of all bills, or of those matching {payment_status / payment_method: value}"""
+    return sum(total for _, *values, _, total in revenue_cube()
+               if all(dict(zip(REVENUE_FIELDS, values))[field] == value for field, value in (filters or {}).items()))
+
+def rebuild_revenue_rollup():
+    """Recompute the revenue rollup from the stored bills, e.g. after corrections"""
+    storage = get_storage()
+    version = storage.version("billing")
+    return get_revenue_rollup_store().rebuild(storage, "billing", storage.load("billing"), version)
+
+# ----------------- RECORD LAYOUT ----------------------
+# Appointment times are stored as appointment_at: minutes since 0001-01-01
+# 00:00, i.e. date ordinal * MINUTES_PER_DAY + minute of the day. Sorting and
+# comparing appointments is integer arithmetic; "10:00 AM" style strings are
+# only produced when rendering.
+MINUTES_PER_DAY = 24 * 60
+
+# Bookable times of day: 30-minute slots from 09:00 AM to 05:30 PM
+SLOT_MINUTES = 30
+APPOINTMENT_SLOTS = list(range(9 * 60, 18 * 60, SLOT_MINUTES))
+
+# How far ahead free-slot searches look
+AVAILABILITY_HORIZON_DAYS = int(os.environ.get("HMS_AVAILABILITY_HORIZON_DAYS", "60"))
+
+def date_ordinal(value):
+    """Day number of an ISO date string, or None if it is missing or malformed"""
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return None
+
+def parse_time_of_day(value):
+    """Minutes after midnight of a time such as '10:00 AM', '2:00 PM' or '14:30', or None"""
+    text = str(value or "").strip().upper()
+    for fmt in ("%I:%M %p", "%H:%M", "%I %p"):
+        try:
+            parsed = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.hour * 60 + parsed.minute
+    return None
+
+def appointment_minutes(appointment_date, appointment_time=None):
+    """appointment_at value of a date and optional time of day, or None without a valid date"""
+    ordinal = date_ordinal(appointment_date)
+    if ordinal is None:
+        return None
+    return ordinal * MINUTES_PER_DAY + (parse_time_of_day(appointment_time) or 0)
+
+def booking_slot(minutes):
+    """(date ordinal, slot number within the day) of an appointment_at value"""
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return day, minute // SLOT_MINUTES
+
+def format_time_of_day(minutes):
+    """Render the time part of an appointment_at value, e.g. '02:00 PM'"""
+    hours, minute = divmod(minutes % MINUTES_PER_DAY, 60)
+    return f"{(hours + 11) % 12 + 1:02d}:{minute:02d} {'AM' if hours < 12 else 'PM'}"
+
+def appointment_time_label(appointment):
+    """Display time of an appointment"""
+    minutes = appointment.get('appointment_at')
+    if minutes is None:
+        return appointment.get('appointment_time', 'N/A')
+    return format_time_of_day(minutes)
+
+def upgrade_record(data_type, record):
+    """Bring a record read from storage up to the current layout
+
+    Appointments written before appointment_at existed get it computed from
+    their date and time strings. The upgrade happens on every read until the
+    record is next saved, which writes the upgraded copy back.
+    """
+    if data_type == "appointments" and record is not None and 'appointment_at' not in record:
+        record = dict(record)
+        record['appointment_at'] = appointment_minutes(record.get('appointment_date'), record.get('appointment_time'))
+    return record
+
+def upgrade_records(data_type, records):
+    if data_type != "appointments":
+        return records
+    return [upgrade_record(data_type, record) for record in records]
+
+def persist_upgrades(data_types=None):
+    """Write back every record that is still upgraded on read; returns the count per dataset"""
+    storage = get_storage()
+    counts = {}
+    for data_type in data_types or DATA_TYPES:
+        records = storage.load(data_type)
+        upgraded = upgrade_records(data_type, records)
+        counts[data_type] = sum(1 for old, new in zip(records, upgraded) if old is not new)
+        if counts[data_type]:
+            save_data(data_type, upgraded)
+    return counts
+
+def display_record(data_type, record):
+    """Record with the display-only fields filled in, for tables"""
+    if data_type == "appointments" and record.get('appointment_at') is not None:
+        return dict(record, appointment_time=appointment_time_label(record))
+    return record
+
+# ----------------- SECONDARY INDEXES ----------------------
+def normalize_text(value):
+    """Lower-case text with runs of whitespace collapsed, as stored in the n-gram index"""
+    return " ".join(str(value or "").lower().split())
+
+def ngrams(text, size=NGRAM_SIZE):
+    """Distinct substrings of length size in already normalized text"""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def bitmap_value(value):
+    """Key of a categorical value in the bitmap index; missing values count as Unknown"""
+    return "Unknown" if value is None or value == "" else str(value)
+
+def bitmap_from_slots(slots):
+    """Bitmap with the bits of the given positions set"""
+    if not slots:
+        return 0
+    buffer = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, 'little')
+
+def bitmap_slots(bitmap):
+    """Positions of the set bits of a bitmap, lowest first"""
+    # Walking the binary string is linear; peeling off bits one at a time is not
+    bits = bin(bitmap)[:1:-1]
+    return [slot for slot, bit in enumerate(bits) if bit == "1"]
+
+def bitmap_count(bitmap):
+    """Number of set bits of a bitmap"""
+    return bin(bitmap).count("1")
+
+def encode_bitmap(bitmap):
+    """Compact JSON form of a bitmap: run lengths when runs are long, hex otherwise
+
+    Runs are stored as a flat [start, length, start, length, ...] list, which
+    suits clustered values such as statuses of records added in bulk; sparse
+    or well-mixed bitmaps stay hex strings.
+    """
+    bits = bin(bitmap)[:1:-1]
+    runs = []
+    for match in re.finditer("1+", bits):
+        runs.extend((match.start(), match.end() - match.start()))
+        if len(runs) * 4 > len(bits) // 4:
+            return format(bitmap, 'x')
+    return runs
+
+def decode_bitmap(encoded):
+    """Inverse of encode_bitmap"""
+    if isinstance(encoded, str):
+        return int(encoded, 16)
+    parts = []
+    end = 0
+    for i in range(0, len(encoded), 2):
+        start, length = encoded[i], encoded[i + 1]
+        parts.append("0" * (start - end) + "1" * length)
+        end = start + length
+    bits = "".join(parts)[::-1]
+    return int(bits, 2) if bits else 0
+
+def rank_match(key, text):
+    """Sort key of a search hit: exact, prefix, word prefix, then any substring"""
+    position = key.find(text)
+    if key == text:
+        kind = 0
+    elif position == 0:
+        kind = 1
+    elif f" {text}" in key:
+        kind = 2
+        position = key.find(f" {text}") + 1
+    else:
+        kind = 3
+    return (kind, position, len(key))
+
+def index_minutes(value):
+    """Sort position of a date index value: appointment_at style minutes, or the start of an ISO date"""
+    if isinstance(value, int):
+        return value
+    ordinal = date_ordinal(value)
+    return None if ordinal is None else ordinal * MINUTES_PER_DAY
+
+def lookup_keys(data_type, record):
+    """Exact-match keys a record is filed under in its dataset's lookup index
+
+    A bill made by the end-of-day run is filed under its sources; one made
+    by hand under "manual:<patient id>:<bill date>".
+    """
+    if data_type == "billing":
+        if record.get('sources'):
+            return list(record['sources'])
+        return [f"manual:{record.get('patient_id')}:{str(record.get('bill_date') or '')[:10]}"]
+    return []
+
+def is_indexed(data_type):
+    return (data_type in NGRAM_INDEX_FIELDS or data_type in BITMAP_INDEX_FIELDS or data_type in DATE_INDEX_FIELDS
+            or data_type in LOOKUP_INDEX_FIELDS)
+
+class IndexStore:
+    """Secondary indexes of each dataset, persisted under data/indexes/
+
+    Every record gets a slot number. The n-gram field maps each trigram to a
+    sorted posting list of slots, as the lookup index does each of a
+    record's lookup_keys, and every bitmap field keeps one integer
+    bitmap per value with the bits of the matching slots set (compressed on
+    disk, see encode_bitmap). A date field is kept as a list of
+    [minutes, slot] pairs in sorted order for range queries (see
+    index_minutes), and appointments keep a bitmask of booked slots per
+    doctor and day, with a count of any slot booked more than once. Indexes are
+    stamped with a storage version and kept current the same way as the
+    AggregateStore, except that each change is appended to
+    <dataset>.log.jsonl instead of rewriting the whole index; the log is
+    folded into <dataset>.json once it grows past INDEX_LOG_COMPACT_BYTES.
+    """
+
+    def __init__(self, directory=INDEX_DIR):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.entries = {}
+        # (storage name, data_type) -> (checked at, dataset generation)
+        self.checked = {}
+
+    def path(self, data_type):
+        return os.path.join(self.directory, f"{data_type}.json")
+
+    def log_path(self, data_type):
+        return os.path.join(self.directory, f"{data_type}.log.jsonl")
+
+    def _indexed(self, data_type, record):
+        """The fields of a record the indexes look at, as written to the log"""
+        if record is None:
+            return None
+        fields = [NGRAM_INDEX_FIELDS.get(data_type), DATE_INDEX_FIELDS.get(data_type), OCCUPANCY_INDEX_FIELDS.get(data_type)]
+        fields += BITMAP_INDEX_FIELDS.get(data_type, []) + LOOKUP_INDEX_FIELDS.get(data_type, [])
+        if data_type in OCCUPANCY_INDEX_FIELDS:
+            fields.append('status')
+        indexed = {"id": record.get('id')}
+        indexed.update({field: record.get(field) for field in fields if field})
+        return indexed
+
+    def _read(self, data_type):
+        try:
+            stat = os.stat(self.path(data_type))
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(data_type)
+        if not entry or entry["signature"] != signature:
+            try:
+                with open(self.path(data_type), 'r') as f:
+                    stored = json.load(f)
+            except ValueError:
+                return None
+            if stored.get("format") != INDEX_FORMAT:
+                # Written by an older release; get() rebuilds it
+                return None
+            entry = {
+                "version": stored["version"],
+                "ids": stored["ids"],
+                "keys": stored["keys"],
+                "grams": stored["grams"],
+                "lookup": stored["lookup"],
+                "dates": stored["dates"],
+                "occupancy": stored["occupancy"],
+                "overbooked": stored["overbooked"],
+                "bitmaps": {
+                    field: {value: decode_bitmap(bits) for value, bits in values.items()}
+                    for field, values in stored["bitmaps"].items()
+                },
+                "signature": signature,
+                "offset": 0,
+            }
+            entry["slots"] = {record_id: slot for slot, record_id in enumerate(entry["ids"]) if record_id is not None}
+            self.entries[data_type] = entry
+        self._replay(data_type, entry)
+        return entry
+
+    def _replay(self, data_type, entry):
+        """Apply log lines appended since the entry was last read"""
+        try:
+            with open(self.log_path(data_type), 'rb') as f:
+                f.seek(entry["offset"])
+                chunk = f.read()
+        except OSError:
+            return
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            change = json.loads(line)
+            # Lines that do not follow on from the entry's version predate
+            # the last rewrite of the base file
+            if change["before"] == entry["version"]:
+                for old, new in change["changes"]:
+                    self._apply(data_type, entry, old, new)
+                entry["version"] = change["after"]
+        entry["offset"] += end
+
+    def _write(self, data_type, entry):
+        stored = {
+            "format": INDEX_FORMAT,
+            "version": entry["version"],
+            "ids": entry["ids"],
+            "keys": entry["keys"],
+            "grams": entry["grams"],
+            "lookup": entry["lookup"],
+            "dates": entry["dates"],
+            "occupancy": entry["occupancy"],
+            "overbooked": entry["overbooked"],
+            "bitmaps": {
+                field: {value: encode_bitmap(bits) for value, bits in values.items()}
+                for field, values in entry["bitmaps"].items()
+            },
+        }
+        path = self.path(data_type)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, path)
+        try:
+            os.remove(self.log_path(data_type))
+        except FileNotFoundError:
+            pass
+        stat = os.stat(path)
+        entry["signature"] = (stat.st_mtime_ns, stat.st_size)
+        entry["offset"] = 0
+        self.entries[data_type] = entry
+
+    def _log(self, data_type, entry, change):
+        """Apply a change to the entry and append it to the log, folding the log in when large"""
+        for old, new in change["changes"]:
+            self._apply(data_type, entry, old, new)
+        entry["version"] = change["after"]
+        with open(self.log_path(data_type), 'a') as f:
+            f.write(json.dumps(change) + "\n")
+            entry["offset"] = f.tell()
+        if entry["offset"] >= INDEX_LOG_COMPACT_BYTES:
+            self._write(data_type, entry)
+
+    def _apply(self, data_type, entry, old, new):
+        if old is not None:
+            # An update keeps the record's slot
+            self._remove(data_type, entry, old, release=new is None or new.get('id') != old.get('id'))
+        if new is not None:
+            self._add(data_type, entry, new)
+
+    def _add(self, data_type, entry, record, bulk=False):
+        record = upgrade_record(data_type, record)
+        record_id = record.get('id')
+        slot = entry["slots"].get(record_id)
+        if slot is None:
+            slot = len(entry["ids"])
+            entry["ids"].append(record_id)
+            entry["keys"].append(None)
+            entry["slots"][record_id] = slot
+        field = NGRAM_INDEX_FIELDS.get(data_type)
+        if field:
+            key = normalize_text(record.get(field))
+            entry["keys"][slot] = key
+            for gram in ngrams(key):
+                bisect.insort(entry["grams"].setdefault(gram, []), slot)
+        if data_type in LOOKUP_INDEX_FIELDS:
+            for key in lookup_keys(data_type, record):
+                bisect.insort(entry["lookup"].setdefault(key, []), slot)
+        minutes = index_minutes(record.get(DATE_INDEX_FIELDS[data_type])) if data_type in DATE_INDEX_FIELDS else None
+        if minutes is not None:
+            if bulk:
+                entry["dates"].append([minutes, slot])
+            else:
+                bisect.insort(entry["dates"], [minutes, slot])
+        if not bulk:
+            for field in BITMAP_INDEX_FIELDS.get(data_type, []):
+                values = entry["bitmaps"].setdefault(field, {})
+                value = bitmap_value(record.get(field))
+                values[value] = values.get(value, 0) | (1 << slot)
+        self._occupy(data_type, entry, record, True)
+        return slot
+
+    def _occupy(self, data_type, entry, record, taking):
+        """Set or clear the record's bit in its owner's slot mask for the day"""
+        field = OCCUPANCY_INDEX_FIELDS.get(data_type)
+        minutes = index_minutes(record.get(DATE_INDEX_FIELDS.get(data_type))) if field else None
+        if minutes is None or record.get('status') in FREE_SLOT_STATUSES:
+            return
+        day, bit = booking_slot(minutes)
+        owner = str(record.get(field))
+        days = entry["occupancy"].setdefault(owner, {})
+        mask = days.get(str(day), 0)
+        key = f"{owner}/{day}/{bit}"
+        if taking:
+            if mask >> bit & 1:
+                # Double bookings made before the check existed are counted so
+                # cancelling one of them keeps the slot taken
+                entry["overbooked"][key] = entry["overbooked"].get(key, 0) + 1
+            days[str(day)] = mask | (1 << bit)
+        elif entry["overbooked"].get(key):
+            entry["overbooked"][key] -= 1
+            if not entry["overbooked"][key]:
+                del entry["overbooked"][key]
+        else:
+            mask &= ~(1 << bit)
+            if mask:
+                days[str(day)] = mask
+            else:
+                days.pop(str(day), None)
+                if not days:
+                    del entry["occupancy"][owner]
+
+    def _remove(self, data_type, entry, record, release=True):
+        record = upgrade_record(data_type, record)
+        slot = entry["slots"].get(record.get('id'))
+        if slot is None:
+            return
+        if release:
+            # Leave a hole rather than renumbering the slots after it
+            del entry["slots"][record.get('id')]
+            entry["ids"][slot] = None
+        key = entry["keys"][slot]
+        entry["keys"][slot] = None
+        for gram in ngrams(key or ""):
+            postings = entry["grams"].get(gram, [])
+            position = bisect.bisect_left(postings, slot)
+            if position < len(postings) and postings[position] == slot:
+                del postings[position]
+            if not postings:
+                entry["grams"].pop(gram, None)
+        if data_type in LOOKUP_INDEX_FIELDS:
+            for key in lookup_keys(data_type, record):
+                slots = entry["lookup"].get(key, [])
+                position = bisect.bisect_left(slots, slot)
+                if position < len(slots) and slots[position] == slot:
+                    del slots[position]
+                if not slots:
+                    entry["lookup"].pop(key, None)
+        minutes = index_minutes(record.get(DATE_INDEX_FIELDS[data_type])) if data_type in DATE_INDEX_FIELDS else None
+        if minutes is not None:
+            position = bisect.bisect_left(entry["dates"], [minutes, slot])
+            if position < len(entry["dates"]) and entry["dates"][position] == [minutes, slot]:
+                del entry["dates"][position]
+        for field in BITMAP_INDEX_FIELDS.get(data_type, []):
+            values = entry["bitmaps"].get(field, {})
+            value = bitmap_value(record.get(field))
+            bits = values.get(value, 0) & ~(1 << slot)
+            if bits:
+                values[value] = bits
+            else:
+                values.pop(value, None)
+        self._occupy(data_type, entry, record, False)
+
+    def get(self, storage, data_type, revalidate=False):
+        # Trusted for CACHE_REVALIDATE_SECONDS unless this process wrote to the
+        # dataset, like the AggregateStore; revalidate checks the storage now
+        key = (storage.name, data_type)
+        now = time.monotonic()
+        generation = get_dataset_cache().generation(storage, data_type)
+        with self.lock:
+            checked = self.checked.get(key)
+            entry = self.entries.get(data_type)
+            if (not revalidate and entry is not None and checked and checked[1] == generation
+                    and now - checked[0] < CACHE_REVALIDATE_SECONDS):
+                return entry
+        version = version_key(storage.version(data_type))
+        with self.lock:
+            entry = self._read(data_type)
+            if not entry or entry["version"] != version:
+                entry = None
+        if entry is None:
+            entry = self.rebuild(storage, data_type)
+        with self.lock:
+            self.checked[key] = (now, generation)
+        return entry
+
+    def get_versioned(self, storage, data_type):
+        """Return (entry, version key of the records it currently reflects)"""
+        entry = self.get(storage, data_type)
+        with self.lock:
+            return entry, entry["version"]
+
+    @contextlib.contextmanager
+    def reading(self, storage, data_type):
+        """Current entry of a dataset, held under the store's lock
+
+        Writers change entries in place, so readers iterate them inside this
+        block and copy out what they need.
+        """
+        entry = self.get(storage, data_type)
+        with self.lock:
+            # Re-read in case a writer swapped in a rebuilt entry meanwhile
+            yield self.entries.get(data_type, entry)
+
+    def rebuild(self, storage, data_type, records=None, version=None):
+        # Stamped with the version the records were read at, as in AggregateStore.rebuild
+        if records is None:
+            records, version = get_dataset_cache().get_current(storage, data_type)
+        elif version is None:
+            version = storage.version(data_type)
+        entry = {
+            "version": version_key(version), "ids": [], "keys": [], "grams": {}, "lookup": {}, "dates": [],
+            "occupancy": {}, "overbooked": {}, "bitmaps": {}, "slots": {},
+        }
+        # Collect slots per value and dates first; setting bits or inserting
+        # one record at a time would copy every bitmap and the date list once
+        # per record
+        value_slots = {field: {} for field in BITMAP_INDEX_FIELDS.get(data_type, [])}
+        for record in records:
+            slot = self._add(data_type, entry, record, bulk=True)
+            for field, values in value_slots.items():
+                values.setdefault(bitmap_value(record.get(field)), []).append(slot)
+        entry["dates"].sort()
+        entry["bitmaps"] = {
+            field: {value: bitmap_from_slots(slots) for value, slots in values.items()}
+            for field, values in value_slots.items()
+        }
+        with self.lock, file_lock(self.path(data_type) + ".lock"):
+            self._write(data_type, entry)
+        return entry
+
+    def records_changed(self, storage, data_type, before, changes):
+        if not is_indexed(data_type):
+            return
+        with self.lock, file_lock(self.path(data_type) + ".lock"):
+            entry = self._read(data_type)
+            if not entry or entry["version"] != version_key(before):
+                return
+            self._log(data_type, entry, {
+                "before": entry["version"],
+                "after": version_key(storage.version(data_type)),
+                "changes": [[self._indexed(data_type, old), self._indexed(data_type, new)] for old, new in changes],
+            })
+
+    def dataset_replaced(self, storage, data_type, records):
+        if is_indexed(data_type):
+            self.rebuild(storage, data_type, records)
+
+    def restamp(self, data_type, before, after):
+        with self.lock, file_lock(self.path(data_type) + ".lock"):
+            entry = self._read(data_type)
+            if entry and entry["version"] == version_key(before):
+                self._log(data_type, entry, {"before": entry["version"], "after": version_key(after), "changes": []})
+
+@st.cache_resource
+def get_index_store():
+    """Return the process-wide secondary index store"""
+    return IndexStore(INDEX_DIR)
+
+def rebuild_indexes(data_types=None):
+    """Rebuild the secondary indexes from the stored records"""
+    storage = get_storage()
+    store = get_index_store()
+    indexed = [data_type for data_type in DATA_TYPES if is_indexed(data_type)]
+    rebuilt = {}
+    for data_type in data_types or indexed:
+        version = storage.version(data_type)
+        rebuilt[data_type] = store.rebuild(storage, data_type, storage.load(data_type), version)
+    return rebuilt
+
+def records_by_id(data_type, record_ids):
+    """Fetch records in the order of record_ids, skipping ids that no longer exist"""
+    storage = get_storage()
+    if hasattr(storage, "get"):
+        records = [upgrade_record(data_type, storage.get(data_type, record_id)) for record_id in record_ids]
+        return [record for record in records if record is not None]
+    wanted = set(record_ids)
+    found = {record.get('id'): record for record in load_data(data_type) if record.get('id') in wanted}
+    return [found[record_id] for record_id in record_ids if record_id in found]
+
+def filter_bitmap(entry, filters):
+    """AND of the bitmaps selected by filters, or None when there are no filters"""
+    candidates = None
+    for field, value in (filters or {}).items():
+        bits = entry["bitmaps"].get(field, {}).get(bitmap_value(value), 0)
+        candidates = bits if candidates is None else candidates & bits
+    return candidates
+
+def index_counts(data_type, field, filters=None):
+    """{value: number of records} of a bitmap-indexed field, optionally within filters"""
+    counts = {}
+    with get_index_store().reading(get_storage(), data_type) as entry:
+        within = filter_bitmap(entry, filters)
+        for value, bits in entry["bitmaps"].get(field, {}).items():
+            count = bitmap_count(bits if within is None else bits & within)
+            if count:
+                counts[value] = count
+    return counts
+
+def index_values(data_type, field):
+    """Distinct values of a bitmap-indexed field, sorted"""
+    return sorted(index_counts(data_type, field))
+
+def filter_records(data_type, filters):
+    """All records matching every field=value pair in filters, in dataset order"""
+    return search_records(data_type, "", filters, limit=None)[1]
+
+def date_range_slots(entry, start=None, end=None):
+    """Slots whose indexed date lies on the days start..end (inclusive, open-ended when None), earliest first"""
+    dates = entry["dates"]
+    lo = 0 if start is None else bisect.bisect_left(dates, [start.toordinal() * MINUTES_PER_DAY])
+    hi = len(dates) if end is None else bisect.bisect_left(dates, [(end.toordinal() + 1) * MINUTES_PER_DAY])
+    return [slot for _, slot in dates[lo:hi]]
+
+def date_range_records(data_type, start=None, end=None, filters=None, limit=None):
+    """Records dated within start..end that match filters, earliest first, read from the date index"""
+    with get_index_store().reading(get_storage(), data_type) as entry:
+        slots = date_range_slots(entry, start, end)
+        within = filter_bitmap(entry, filters)
+        if within is not None:
+            if len(slots) * 64 > within.bit_length():
+                # Wide range: one pass over the bitmap beats a shift per slot
+                allowed = set(bitmap_slots(within))
+                matches = (slot for slot in slots if slot in allowed)
+            else:
+                matches = (slot for slot in slots if within >> slot & 1)
+            slots = list(itertools.islice(matches, limit))
+        else:
+            slots = slots[:limit]
+        record_ids = [entry["ids"][slot] for slot in slots]
+    return records_by_id(data_type, record_ids)
+
+def date_range_count(data_type, start=None, end=None):
+    """Number of records dated within start..end"""
+    with get_index_store().reading(get_storage(), data_type) as entry:
+        return len(date_range_slots(entry, start, end))
+
+def occupied_mask(doctor_id, day):
+    """Booked slots of a doctor on a date as a bitmask; bit n is the n-th SLOT_MINUTES slot of the day"""
+    with get_index_store().reading(get_storage(), "appointments") as entry:
+        return entry["occupancy"].get(str(doctor_id), {}).get(str(day.toordinal()), 0)
+
+def is_slot_free(doctor_id, minutes):
+    """Whether the doctor has no appointment in the slot holding appointment_at value minutes"""
+    day, bit = booking_slot(minutes)
+    with get_index_store().reading(get_storage(), "appointments") as entry:
+        return not entry["occupancy"].get(str(doctor_id), {}).get(str(day), 0) >> bit & 1
+
+@st.cache_resource
+def get_booking_lock():
+    """Serializes the check-then-insert of bookings made by this process"""
+    return threading.Lock()
+
+def book_appointment(appointment):
+    """Insert an appointment unless its doctor already has that slot; returns whether it was booked"""
+    with get_booking_lock(), file_lock(os.path.join(DATA_DIR, ".booking.lock")):
+        # Pick up bookings other processes made within the revalidation window
+        get_index_store().get(get_storage(), "appointments", revalidate=True)
+        if not is_slot_free(appointment.get('doctor_id'), appointment['appointment_at']):
+            return False
+        insert_record("appointments", appointment)
+    return True
+
+def search_records(data_type, text="", filters=None, limit=SEARCH_RESULT_LIMIT):
+    """Ranked substring search over the dataset's n-gram field, narrowed by exact-value filters
+
+    Returns (number of matches, best matching records up to limit). Filters
+    map bitmap-indexed fields to the required value.
+    """
+    text = normalize_text(text)
+    with get_index_store().reading(get_storage(), data_type) as entry:
+        candidates = filter_bitmap(entry, filters)
+
+        if not text:
+            if candidates is None:
+                slots = [slot for slot, record_id in enumerate(entry["ids"]) if record_id is not None]
+            else:
+                slots = bitmap_slots(candidates)
+            total, record_ids = len(slots), [entry["ids"][slot] for slot in slots[:limit]]
+        else:
+            grams = ngrams(text)
+            if grams:
+                # Intersect the shortest posting lists first
+                postings = sorted((entry["grams"].get(gram, []) for gram in grams), key=len)
+                slots = set(postings[0])
+                for posting in postings[1:]:
+                    if not slots:
+                        break
+                    slots.intersection_update(posting)
+            else:
+                # Shorter than one n-gram: scan the stored keys instead
+                slots = {slot for slot, key in enumerate(entry["keys"]) if key is not None}
+
+            if candidates is not None:
+                slots = slots.intersection(bitmap_slots(candidates))
+            keys = entry["keys"]
+            hits = [slot for slot in slots if text in keys[slot]]
+            hits.sort(key=lambda slot: rank_match(keys[slot], text) + (slot,))
+            total, record_ids = len(hits), [entry["ids"][slot] for slot in hits[:limit]]
+    return total, records_by_id(data_type, record_ids)
+
+# ----------------- DOCTOR AVAILABILITY ----------------------
+WEEKDAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+WEEKDAY_GROUPS = {
+    "daily": range(7),
+    "everyday": range(7),
+    "weekdays": range(5),
+    "weekends": range(5, 7),
+}
+CLOCK_PATTERN = r"\d{1,2}(?::\d{2})?\s*(?:[ap]\.?m\.?)?"
+TIME_RANGE_PATTERN = re.compile(rf"({CLOCK_PATTERN})\s*(?:-|–|\bto\b)\s*({CLOCK_PATTERN})", re.IGNORECASE)
+
+def slot_mask(minutes):
+    """Day mask with the slots starting at the given times of day set"""
+    mask = 0
+    for minute in minutes:
+        mask |= 1 << (minute // SLOT_MINUTES)
+    return mask
+
+def mask_minutes(mask):
+    """Start times (minutes after midnight) of the slots set in a day mask, earliest first"""
+    return [bit * SLOT_MINUTES for bit in bitmap_slots(mask)]
+
+# Doctors whose schedule cannot be read are bookable in every standard slot
+DEFAULT_DAY_MASK = slot_mask(APPOINTMENT_SLOTS)
+
+def _parse_weekdays(text):
+    """Weekday numbers (Monday = 0) named by text such as 'Mon-Fri', 'Mon, Wed' or 'Weekends', or None"""
+    days = set()
+    for part in re.split(r"\s*(?:,|&|/|\band\b)\s*", text.strip().lower()):
+        if not part:
+            continue
+        if part.replace(" ", "") in WEEKDAY_GROUPS:
+            days.update(WEEKDAY_GROUPS[part.replace(" ", "")])
+            continue
+        bounds = [bound.strip()[:3] for bound in re.split(r"\s*(?:-|–|\bto\b)\s*", part)]
+        if len(bounds) > 2 or not all(bound in WEEKDAY_NAMES for bound in bounds):
+            return None
+        first, last = WEEKDAY_NAMES.index(bounds[0]), WEEKDAY_NAMES.index(bounds[-1])
+        # Ranges may wrap around the weekend, e.g. Sat-Mon
+        days.update((first + i) % 7 for i in range((last - first) % 7 + 1))
+    return days
+
+def _parse_clock(text):
+    text = re.sub(r"\s*([ap])\.?m\.?$", r" \1M", text.strip(), flags=re.IGNORECASE)
+    if text.isdigit():
+        text += ":00"
+    return parse_time_of_day(text)
+
+def parse_schedule(text):
+    """Weekly availability described by a schedule string, or None if nothing in it is readable
+
+    The result holds seven day masks, Monday first, over the SLOT_MINUTES
+    grid. Each line or ';'-separated clause names days and then time ranges,
+    e.g. "Mon-Fri: 9:00 AM - 5:00 PM" or "Mon, Wed: 08:00-12:00, 14:00-18:00";
+    a clause without days applies to every day and unreadable clauses
+    (e.g. "Sun: Closed") are skipped.
+    """
+    week = [0] * 7
+    readable = False
+    for clause in re.split(r"[;\n]+", text or ""):
+        ranges = TIME_RANGE_PATTERN.findall(clause)
+        if not ranges:
+            continue
+        day_text = clause[:TIME_RANGE_PATTERN.search(clause).start()].strip().rstrip(":").strip()
+        days = _parse_weekdays(day_text) if day_text else set(range(7))
+        if not days:
+            continue
+        mask = 0
+        for start_text, end_text in ranges:
+            start, end = _parse_clock(start_text), _parse_clock(end_text)
+            if start is None or end is None:
+                continue
+            if end <= start:
+                # Ranges ending at or past midnight are cut at midnight
+                end = MINUTES_PER_DAY
+            first_slot = -(-start // SLOT_MINUTES)
+            last_slot = end // SLOT_MINUTES
+            mask |= ((1 << last_slot) - 1) & ~((1 << first_slot) - 1)
+        if mask:
+            readable = True
+            for day in days:
+                week[day] |= mask
+    return week if readable else None
+
+@st.cache_resource
+def get_availability_cache():
+    """Compiled weekly availability per doctor id, with the schedule it was compiled from"""
+    return {}
+
+def weekly_availability(doctor):
+    """Seven day masks of a doctor's working slots, recompiled only when the schedule changes"""
+    cache = get_availability_cache()
+    schedule = doctor.get('schedule') or ""
+    cached = cache.get(doctor.get('id'))
+    if cached is None or cached[0] != schedule:
+        week = parse_schedule(schedule)
+        cached = (schedule, week if week is not None else [DEFAULT_DAY_MASK] * 7)
+        cache[doctor.get('id')] = cached
+    return cached[1]
+
+def doctor_occupancy(doctor_id):
+    """{date ordinal: booked slot mask} of one doctor, keys as strings"""
+    with get_index_store().reading(get_storage(), "appointments") as entry:
+        return dict(entry["occupancy"].get(str(doctor_id), {}))
+
+def available_slots(doctor, day, occupancy=None):
+    """Start times (minutes after midnight) in which the doctor works and is free on a date"""
+    now = datetime.datetime.now()
+    if day < now.date():
+        return []
+    if occupancy is None:
+        occupancy = doctor_occupancy(doctor.get('id'))
+    minutes = mask_minutes(weekly_availability(doctor)[day.weekday()] & ~occupancy.get(str(day.toordinal()), 0))
+    if day == now.date():
+        minutes = [minute for minute in minutes if minute >= now.hour * 60 + now.minute]
+    return minutes
+
+def free_slot_stream(doctor, start, horizon=AVAILABILITY_HORIZON_DAYS):
+    """appointment_at values of the doctor's free slots from start on, earliest first"""
+    occupancy = doctor_occupancy(doctor.get('id'))
+    for offset in range(horizon):
+        day = start + timedelta(days=offset)
+        for minute in available_slots(doctor, day, occupancy):
+            yield day.toordinal() * MINUTES_PER_DAY + minute
+
+def next_free_slots(doctors, count, start=None, horizon=AVAILABILITY_HORIZON_DAYS):
+    """The count earliest free (appointment_at, doctor) pairs across doctors, from start (today) on"""
+    start = start or date.today()
+    streams = [zip(free_slot_stream(doctor, start, horizon), itertools.repeat(i)) for i, doctor in enumerate(doctors)]
+    return [(minutes, doctors[i]) for minutes, i in itertools.islice(heapq.merge(*streams), count)]
+
+def format_slot(minutes):
+    """Render an appointment_at value as e.g. 'Mon 2024-01-22 10:00 AM'"""
+    day = date.fromordinal(minutes // MINUTES_PER_DAY)
+    return f"{day.strftime('%a')} {day.isoformat()} {format_time_of_day(minutes)}"
+
+# ----------------- BATCH SCHEDULING ----------------------
+BATCH_REQUEST_FIELDS = ["patient_id", "department", "earliest_date", "type", "max_fee", "notes"]
+BATCH_REPORT_FIELDS = ["row", "patient_id", "department", "earliest_date", "reason"]
+
+def parse_batch_requests(text):
+    """Appointment requests from CSV text with a header row, or from JSON Lines"""
+    if text.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    requests = []
+    for row_number, row in enumerate(rows, 1):
+        request = {field: str(row.get(field) or "").strip() for field in BATCH_REQUEST_FIELDS}
+        request['row'] = row_number
+        requests.append(request)
+    return requests
+
+def load_batch_requests(path):
+    """Appointment requests from a .csv or .jsonl file"""
+    with open(path, encoding="utf-8-sig") as f:
+        return parse_batch_requests(f.read())
+
+def _department_heap(doctors, start, end):
+    # One (next free appointment_at, fee, doctor index, slot stream) entry per
+    # doctor: the heap top is the department's earliest slot, cheapest doctor first
+    heap = []
+    for i, doctor in enumerate(doctors):
+        stream = free_slot_stream(doctor, start, (end - start).days)
+        minutes = next(stream, None)
+        if minutes is not None:
+            heap.append((minutes, float(doctor.get('consultation_fee') or 0), i, stream))
+    heapq.heapify(heap)
+    return heap
+
+def _take_slot(heap, doctors, earliest, until, end, max_fee):
+    # Pop the earliest slot from earliest up to (not including) the day until
+    # from a doctor within max_fee; the streams run to end, the last window's
+    # end. A stream lagging behind earliest is restarted at earliest: every
+    # slot it already handed out lies before its head, so none is offered twice.
+    skipped = []
+    taken = None
+    while heap:
+        minutes, fee, i, stream = heapq.heappop(heap)
+        if max_fee is not None and fee > max_fee:
+            skipped.append((minutes, fee, i, stream))
+        elif minutes >= until.toordinal() * MINUTES_PER_DAY:
+            # The remaining slots all lie past the request's window
+            skipped.append((minutes, fee, i, stream))
+            break
+        elif minutes < earliest.toordinal() * MINUTES_PER_DAY:
+            stream = free_slot_stream(doctors[i], earliest, (end - earliest).days)
+            minutes = next(stream, None)
+            if minutes is not None:
+                heapq.heappush(heap, (minutes, fee, i, stream))
+        else:
+            taken = (minutes, doctors[i])
+            minutes = next(stream, None)
+            if minutes is not None:
+                heapq.heappush(heap, (minutes, fee, i, stream))
+            break
+    for entry in skipped:
+        heapq.heappush(heap, entry)
+    return taken
+
+def schedule_batch(requests, start=None, horizon=AVAILABILITY_HORIZON_DAYS):
+    """Book the earliest free slot of an active doctor in each request's department
+
+    Each request is placed within horizon days of its earliest_date (start,
+    today by default, when missing or earlier). Requests are served in
+    earliest_date order (file order within a date) and committed in a single
+    write. Returns (appointments, unplaced) where unplaced holds (request,
+    reason) pairs.
+    """
+    start = start or date.today()
+    appointments = []
+    unplaced = []
+
+    pending = []
+    for request in requests:
+        try:
+            earliest = max(date.fromisoformat(request['earliest_date']), start) if request.get('earliest_date') else start
+        except ValueError:
+            unplaced.append((request, "invalid earliest_date"))
+            continue
+        try:
+            max_fee = float(request['max_fee']) if request.get('max_fee') else None
+        except ValueError:
+            unplaced.append((request, "invalid max_fee"))
+            continue
+        pending.append((earliest, max_fee, request))
+    pending.sort(key=lambda item: item[0])
+    end = (pending[-1][0] if pending else start) + timedelta(days=horizon)
+
+    patient_ids = list(dict.fromkeys(request.get('patient_id') for _, _, request in pending))
+    patients = {patient.get('id'): patient for patient in records_by_id("patients", patient_ids)}
+    departments = {name.lower(): name for name in index_values("doctors", "department")}
+
+    with get_booking_lock(), file_lock(os.path.join(DATA_DIR, ".booking.lock")):
+        get_index_store().get(get_storage(), "appointments", revalidate=True)
+        heaps = {}
+        for earliest, max_fee, request in pending:
+            patient = patients.get(request.get('patient_id'))
+            if patient is None:
+                unplaced.append((request, "unknown patient"))
+                continue
+            department = departments.get(request.get('department', "").lower())
+            if department not in heaps:
+                doctors = filter_records("doctors", {'status': 'Active', 'department': department}) if department else []
+                # Requests come in earliest_date order, so no later one needs
+                # a slot before this one's earliest date
+                heaps[department] = (doctors, _department_heap(doctors, earliest, end))
+            doctors, heap = heaps[department]
+            if not doctors:
+                unplaced.append((request, "no active doctor in department"))
+                continue
+            if max_fee is not None and all(float(d.get('consultation_fee') or 0) > max_fee for d in doctors):
+                unplaced.append((request, "no doctor within max_fee"))
+                continue
+            taken = _take_slot(heap, doctors, earliest, earliest + timedelta(days=horizon), end, max_fee)
+            if taken is None:
+                unplaced.append((request, f"no free slot within {horizon} days"))
+                continue
+            minutes, doctor = taken
+            appointments.append({
+                "patient_id": patient.get('id'),
+                "patient_name": patient.get('name'),
+                "doctor_id": doctor.get('id'),
+                "doctor_name": doctor.get('name'),
+                "appointment_date": date.fromordinal(minutes // MINUTES_PER_DAY).isoformat(),
+                "appointment_at": minutes,
+                "type": request.get('type') or "Consultation",
+                "status": "Scheduled",
+                "notes": request.get('notes', ""),
+            })
+
+        created = datetime.datetime.now().isoformat()
+        appointments = [{"id": appointment_id, **appointment, "created_date": created}
+                        for appointment_id, appointment in zip(allocate_ids("appointments", len(appointments)), appointments)]
+        insert_records("appointments", appointments)
+
+    unplaced.sort(key=lambda item: item[0].get('row', 0))
+    return appointments, unplaced
+
+def unplaced_report(unplaced):
+    """CSV text listing the requests schedule_batch could not place and why"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=BATCH_REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for request, reason in unplaced:
+        writer.writerow({**request, 'reason': reason})
+    return out.getvalue()
+
+# ----------------- BULK IMPORT ----------------------
+def iter_import_rows(f, fmt):
+    """(row number, row dict or None, parse error) for each data row of a CSV or JSON Lines stream
+
+    Rows are numbered from 1 after the CSV header; JSON Lines rows by line.
+    """
+    if fmt == "jsonl":
+        for row_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(row, dict):
+                yield row_number, row, None
+            else:
+                yield row_number, None, "expected a JSON object"
+    else:
+        for row_number, row in enumerate(csv.DictReader(f), 1):
+            yield row_number, row, None
+
+def _import_value(field, rule, raw):
+    # Returns the stored value for one field or raises ValueError
+    text = "" if raw is None else str(raw).strip()
+    if not text:
+        if rule.get("required"):
+            raise ValueError(f"{field} is required")
+        return rule.get("default", "")
+    kind = rule["type"]
+    if kind == "choice":
+        for choice in rule["choices"]:
+            if choice.lower() == text.lower():
+                return choice
+        raise ValueError(f"{field} must be one of {', '.join(rule['choices'])}")
+    if kind == "date":
+        try:
+            return date.fromisoformat(text[:10]).isoformat()
+        except ValueError:
+            raise ValueError(f"{field} must be a YYYY-MM-DD date") from None
+    if kind in ("int", "float"):
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError(f"{field} must be a number") from None
+        if kind == "int":
+            if not value.is_integer():
+                raise ValueError(f"{field} must be a whole number")
+            value = int(value)
+        if "min" in rule and value < rule["min"] or "max" in rule and value > rule["max"]:
+            raise ValueError(f"{field} must be between {rule.get('min', '-')} and {rule.get('max', '-')}")
+        return value
+    return text
+
+def validate_import_row(data_type, row, created):
+    """(record without id, None) in the add-form shape, or (None, error) for an invalid row"""
+    rules = IMPORT_FIELDS[data_type]
+    record = {}
+    errors = []
+    for field in RECORD_FIELDS[data_type]:
+        if field == "id":
+            continue
+        if field == "created_date":
+            record[field] = str(row.get(field) or "").strip() or created
+            continue
+        try:
+            record[field] = _import_value(field, rules.get(field, {"type": "text"}), row.get(field))
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        return None, "; ".join(errors)
+    return record, None
+
+def import_job_id(data_type, name, size, head):
+    """Stable id of an import of one file, so the same file resumes where it stopped"""
+    digest = hashlib.sha1(f"{data_type}|{os.path.basename(name)}|{size}|".encode() + head).hexdigest()
+    return f"{data_type}-{digest[:12]}"
+
+def import_progress_path(job):
+    return os.path.join(IMPORT_DIR, f"{job}.json")
+
+def import_errors_path(job):
+    return os.path.join(IMPORT_DIR, f"{job}.errors.csv")
+
+def load_import_progress(job):
+    """Saved progress of an import job, or None if it never started"""
+    try:
+        with open(import_progress_path(job), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_import_progress(progress):
+    path = import_progress_path(progress["job"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+def import_records(data_type, f, fmt, job, chunk_rows=IMPORT_CHUNK_ROWS, restart=False, on_chunk=None):
+    """Stream rows from a text file into a dataset, validating and committing one chunk per write
+
+    Only one chunk is held in memory. Rejected rows go to the job's error
+    report. Progress is saved after every chunk, so calling again with the same
+    job skips rows that were already handled; a chunk interrupted mid-commit is
+    either found stored under its reserved ids or redone with them.
+    Returns the job's progress dict; on_chunk(progress) is called after each chunk.
+    """
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    with file_lock(import_progress_path(job) + ".lock"):
+        progress = None if restart else load_import_progress(job)
+        errors_path = import_errors_path(job)
+        if progress is None:
+            progress = {"job": job, "data_type": data_type, "rows_done": 0, "imported": 0,
+                        "failed": 0, "chunks": 0, "pending": None, "finished": False}
+        if progress["rows_done"] == 0 and not progress["pending"] or not os.path.exists(errors_path):
+            with open(errors_path, 'w', newline="") as errors_file:
+                csv.writer(errors_file).writerow(IMPORT_ERROR_FIELDS)
+
+        pending = progress["pending"]
+        if pending and pending["ids"] and get_record(data_type, pending["ids"][-1]) is not None:
+            # The crash came after the chunk was stored: count it as done
+            _finish_import_chunk(progress, pending)
+            pending = None
+            _save_import_progress(progress)
+
+        rows = itertools.dropwhile(lambda item: item[0] <= progress["rows_done"], iter_import_rows(f, fmt))
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                break
+            created = datetime.datetime.now().isoformat()
+            records = []
+            errors = []
+            for row_number, row, error in chunk:
+                record = None
+                if error is None:
+                    record, error = validate_import_row(data_type, row, created)
+                if error is None:
+                    records.append(record)
+                else:
+                    errors.append([row_number, error, json.dumps(row) if row is not None else ""])
+
+            # Errors of a redone chunk replace the ones written before the interruption
+            if pending and os.path.getsize(errors_path) > pending["errors_size"]:
+                os.truncate(errors_path, pending["errors_size"])
+            errors_size = os.path.getsize(errors_path)
+            with open(errors_path, 'a', newline="") as errors_file:
+                csv.writer(errors_file).writerows(errors)
+
+            ids = pending["ids"] if pending and len(pending["ids"]) == len(records) else allocate_ids(data_type, len(records))
+            pending = {"rows_end": chunk[-1][0], "ids": ids, "failed": len(errors), "errors_size": errors_size}
+            progress["pending"] = pending
+            _save_import_progress(progress)
+
+            insert_records(data_type, [{"id": record_id, **record} for record_id, record in zip(ids, records)])
+            _finish_import_chunk(progress, pending)
+            pending = None
+            _save_import_progress(progress)
+            if on_chunk:
+                on_chunk(progress)
+
+        progress["finished"] = True
+        _save_import_progress(progress)
+    return progress
+
+def _finish_import_chunk(progress, pending):
+    progress["rows_done"] = pending["rows_end"]
+    progress["imported"] += len(pending["ids"])
+    progress["failed"] += pending["failed"]
+    progress["chunks"] += 1
+    progress["pending"] = None
+
+def import_file(data_type, path, fmt=None, chunk_rows=IMPORT_CHUNK_ROWS, restart=False, on_chunk=None):
+    """Import a .csv or .jsonl file from disk; see import_records"""
+    fmt = fmt or ("jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, 'rb') as f:
+        head = f.read(65536)
+    job = import_job_id(data_type, path, os.path.getsize(path), head)
+    with open(path, 'r', encoding="utf-8-sig", newline="") as f:
+        return import_records(data_type, f, fmt, job, chunk_rows, restart, on_chunk)
+
+# ----------------- EXPORT ----------------------
+def iter_records(data_type):
+    """Stream a dataset's records from the storage engine without loading it whole"""
+    for record in get_storage().iter_records(data_type):
+        yield upgrade_record(data_type, record)
+
+def export_columns(data_type):
+    """Default export columns: the add-form fields, plus appointment_at for appointments"""
+    columns = list(RECORD_FIELDS[data_type])
+    if data_type == "appointments":
+        columns.insert(columns.index("appointment_time") + 1, "appointment_at")
+    return columns
+
+def export_rows(data_type, columns=None, start=None, end=None, date_field=None):
+    """Yield records projected to columns, keeping those dated within start..end when given"""
+    columns = columns or export_columns(data_type)
+    date_field = date_field or EXPORT_DATE_FIELDS[data_type]
+    start = start.isoformat() if start else None
+    end = end.isoformat() if end else None
+    for record in iter_records(data_type):
+        if start or end:
+            day = str(record.get(date_field) or "")[:10]
+            if not day or start and day < start or end and day > end:
+                continue
+        record = display_record(data_type, record)
+        yield {column: record.get(column) for column in columns}
+
+def _export_text(value):
+    # CSV cells and Parquet string columns: nested values as JSON, None stays empty
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict, bool)):
+        return json.dumps(value)
+    return str(value)
+
+def _export_arrow_type(data_type, column):
+    pa, _ = _parquet()
+    dtype = FRAME_COLUMNS.get(data_type, {}).get(column)
+    if dtype == "float64":
+        return pa.float64()
+    if dtype == "Int64" or column == "appointment_at":
+        return pa.int64()
+    return pa.string()
+
+def _arrow_batch(rows, schema):
+    pa, _ = _parquet()
+    arrays = []
+    for field in schema:
+        values = []
+        for row in rows:
+            value = row.get(field.name)
+            if field.type == pa.string():
+                value = _export_text(value)
+            else:
+                try:
+                    value = None if value in (None, "") else (float(value) if field.type == pa.float64() else int(value))
+                except (TypeError, ValueError):
+                    value = None
+            values.append(value)
+        arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_export(data_type, rows, columns, fmt, out):
+    """Write rows to the binary file object out as csv, jsonl or parquet; returns the row count"""
+    rows = iter(rows)
+    count = 0
+    if fmt == "parquet":
+        pa, pq = _parquet()
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Parquet exports: pip install pyarrow")
+        schema = pa.schema([(column, _export_arrow_type(data_type, column)) for column in columns])
+        with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+            for batch in iter(lambda: list(itertools.islice(rows, EXPORT_BATCH_ROWS)), []):
+                writer.write_batch(_arrow_batch(batch, schema))
+                count += len(batch)
+        return count
+
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([_export_text(row[column]) for column in columns])
+                count += 1
+        else:
+            for row in rows:
+                text.write(json.dumps(row) + "\n")
+                count += 1
+        text.flush()
+    finally:
+        text.detach()
+    return count
+
+def export_dataset(data_type, fmt="csv", path=None, columns=None, start=None, end=None, date_field=None):
+    """Stream a dataset into a file (default data/exports/<type>.<fmt>); returns (path, row count)"""
+    columns = columns or export_columns(data_type)
+    path = path or os.path.join(EXPORT_DIR, f"{data_type}.{fmt}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as out:
+        count = write_export(data_type, export_rows(data_type, columns, start, end, date_field), columns, fmt, out)
+    os.replace(tmp_path, path)
+    return path, count
+
+# ----------------- END-OF-DAY BILLING ----------------------
+# Bills made by the run list what they charge for in "sources":
+# "appointment:<id>" for a consultation and "stay:<patient id>:<discharge date>"
+# for a stay, so running the same day again only bills what is still unbilled.
+# Bills made by hand have no sources; one dated during a stay or on the day of
+# an appointment is taken to cover it. Both are looked up in the billing
+# lookup index (see lookup_keys) rather than by reading every bill.
+def billed_keys(keys):
+    """Those of keys that some bill is filed under in the billing lookup index"""
+    with get_index_store().reading(get_storage(), "billing") as entry:
+        return {key for key in keys if entry["lookup"].get(key)}
+
+def manual_keys(patient_id, start, end):
+    """Lookup keys of bills made by hand for the patient dated start..end (ISO dates, inclusive)"""
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    return [f"manual:{patient_id}:{(first + timedelta(days=offset)).isoformat()}"
+            for offset in range((last - first).days + 1)]
+
+def unbilled_charges(day):
+    """Pricing jobs, one per patient, for stays ending and appointments completed on day
+
+    Returns (jobs, already_billed) where already_billed counts charges skipped
+    because a bill covers them.
+    """
+    today = day.isoformat()
+    # Bills another process made within the revalidation window count too
+    get_index_store().get(get_storage(), "billing", revalidate=True)
+    jobs = {}
+    already_billed = 0
+
+    def job_for(patient_id, patient_name):
+        if patient_id not in jobs:
+            jobs[patient_id] = {"patient_id": patient_id, "patient_name": patient_name, "bill_date": today,
+                                "appointments": [], "stay": None, "sources": []}
+        return jobs[patient_id]
+
+    # (record, its source key, keys of bills made by hand that would cover it)
+    stays = []
+    for patient in date_range_records("patients", day, day, {'status': 'Discharged'}):
+        admitted = str(patient.get('admission_date') or "")[:10] or today
+        try:
+            keys = manual_keys(patient.get('id'), admitted, today)
+        except ValueError:
+            admitted, keys = today, manual_keys(patient.get('id'), today, today)
+        stays.append((dict(patient, admission_date=admitted), f"stay:{patient.get('id')}:{today}", keys))
+    completed = [(appointment, f"appointment:{appointment.get('id')}", manual_keys(appointment.get('patient_id'), today, today))
+                 for appointment in date_range_records("appointments", day, day, {'status': 'Completed'})]
+    billed = billed_keys([key for _, source, keys in stays + completed for key in [source, *keys]])
+
+    for patient, source, keys in stays:
+        if source in billed or billed.intersection(keys):
+            already_billed += 1
+            continue
+        job = job_for(patient.get('id'), patient.get('name'))
+        job["stay"] = {"admission_date": patient['admission_date'], "discharge_date": today}
+        job["sources"].append(source)
+
+    appointments = []
+    for appointment, source, keys in completed:
+        if source in billed or billed.intersection(keys):
+            already_billed += 1
+        else:
+            appointments.append(appointment)
+    doctor_ids = list(dict.fromkeys(appointment.get('doctor_id') for appointment in appointments))
+    doctors = {doctor.get('id'): doctor for doctor in records_by_id("doctors", doctor_ids)}
+    for appointment in appointments:
+        doctor = doctors.get(appointment.get('doctor_id'), {})
+        job = job_for(appointment.get('patient_id'), appointment.get('patient_name'))
+        job["appointments"].append({"id": appointment.get('id'),
+                                    "doctor_name": appointment.get('doctor_name') or doctor.get('name'),
+                                    "fee": float(doctor.get('consultation_fee') or 0)})
+        job["sources"].append(f"appointment:{appointment.get('id')}")
+
+    return list(jobs.values()), already_billed
+
+def price_bill(job, tax_rate=BILLING_TAX_RATE, room_rate=BILLING_ROOM_RATE):
+    """Itemized bill (without id) for one pricing job, or None when there is nothing to charge"""
+    items = []
+    for appointment in job["appointments"]:
+        if appointment["fee"] > 0:
+            items.append({"description": f"Consultation Fee - {appointment['doctor_name']} ({appointment['id']})",
+                          "quantity": 1, "rate": appointment["fee"], "amount": appointment["fee"]})
+    stay = job["stay"]
+    if stay and room_rate > 0:
+        days = max((date.fromisoformat(stay["discharge_date"]) - date.fromisoformat(stay["admission_date"])).days, 1)
+        items.append({"description": f"Room Charges ({days} days)", "quantity": days, "rate": room_rate,
+                      "amount": round(days * room_rate, 2)})
+    if not items:
+        return None
+    subtotal = round(sum(item["amount"] for item in items), 2)
+    tax = round(subtotal * tax_rate / 100, 2)
+    return {
+        "patient_id": job["patient_id"],
+        "patient_name": job["patient_name"],
+        "bill_date": job["bill_date"],
+        "items": items,
+        "subtotal": subtotal,
+        "tax": tax,
+        "discount": 0,
+        "total": round(subtotal + tax, 2),
+        "payment_status": "Pending",
+        "payment_method": BILLING_PAYMENT_METHOD,
+        "sources": job["sources"],
+    }
+
+def run_billing(day=None, workers=BILLING_WORKERS):
+    """Bill every unbilled stay and completed appointment of day (default today) in one write
+
+    Pricing runs in a pool of worker processes once there are at least
+    BILLING_PARALLEL_MIN bills to price. Returns a report with counts,
+    timings and throughput.
+    """
+    day = day or date.today()
+    started = time.perf_counter()
+    with file_lock(os.path.join(DATA_DIR, ".billing_run.lock")):
+        jobs, already_billed = unbilled_charges(day)
+        collected = time.perf_counter()
+
+        workers = workers or os.cpu_count() or 1
+        if len(jobs) >= BILLING_PARALLEL_MIN and workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                bills = list(pool.map(price_bill, jobs, chunksize=max(len(jobs) // (workers * 4), 1)))
+        else:
+            workers = 0
+            bills = [price_bill(job) for job in jobs]
+        bills = [bill for bill in bills if bill is not None]
+        priced = time.perf_counter()
+
+        created = datetime.datetime.now().isoformat()
+        bills = [{"id": bill_id, **bill, "created_date": created}
+                 for bill_id, bill in zip(allocate_ids("billing", len(bills)), bills)]
+        insert_records("billing", bills)
+    finished = time.perf_counter()
+
+    return {
+        "date": day.isoformat(),
+        "bills": len(bills),
+        "charges": sum(len(bill["sources"]) for bill in bills),
+        "already_billed": already_billed,
+        "skipped": len(jobs) - len(bills),
+        "total": round(sum(bill["total"] for bill in bills), 2),
+        "workers": workers,
+        "collect_s": collected - started,
+        "price_s": priced - collected,
+        "commit_s": finished - priced,
+        "elapsed_s": finished - started,
+        "bills_per_s": len(bills) / (finished - started) if finished > started else 0,
+    }
+
+# ----------------- STOCK LEDGER ----------------------
+class StockLedger:
+    """Append-only log of stock movements with a running balance per item
+
+    Each line of data/stock_ledger.jsonl is one movement carrying the item's
+    balance after it, so the current balances are kept in memory and read in
+    O(1). Every STOCK_SNAPSHOT_INTERVAL movements the balances of all items
+    are written to data/stock_snapshots/, and stock at a past time is the
+    latest snapshot before it plus the movements logged since.
+    """
+
+    def __init__(self, path=STOCK_LEDGER_PATH, snapshot_dir=STOCK_SNAPSHOT_DIR, interval=STOCK_SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.interval = max(interval, 1)
+        self.lock = threading.RLock()
+        self.balances = None
+        self.seq = 0
+        self.offset = 0
+        self.last_at = ""
+        self.snapshots = []
+        self.snapshots_offset = 0
+
+    @property
+    def snapshot_index_path(self):
+        return os.path.join(self.snapshot_dir, "index.jsonl")
+
+    def _read_movements(self, offset=0):
+        """Yield (movement, end offset) for the complete lines after offset"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A write cut short by a crash; dropped before the next append
+                    break
+                offset += len(line)
+                yield json.loads(line), offset
+
+    def _load_snapshots(self):
+        try:
+            with open(self.snapshot_index_path, 'rb') as f:
+                f.seek(self.snapshots_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self.snapshots_offset += len(line)
+                    header = json.loads(line)
+                    self.snapshots.append((header["at"], header["seq"], header["offset"]))
+        except FileNotFoundError:
+            pass
+
+    def _snapshot_balances(self, seq):
+        with open(os.path.join(self.snapshot_dir, f"{seq:012d}.json"), 'r') as f:
+            return json.load(f)["balances"]
+
+    def _sync(self):
+        """Catch up with movements appended since the last read, by this or another process"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if self.balances is not None and size == self.offset:
+            return
+        self._load_snapshots()
+        if self.balances is None or size < self.offset:
+            self.balances, self.seq, self.offset, self.last_at = {}, 0, 0, ""
+            usable = [snapshot for snapshot in self.snapshots if snapshot[2] <= size]
+            if usable:
+                self.last_at, self.seq, self.offset = usable[-1]
+                self.balances = self._snapshot_balances(self.seq)
+        for movement, offset in self._read_movements(self.offset):
+            self.balances[movement["item_id"]] = movement["balance"]
+            self.seq, self.offset, self.last_at = movement["seq"], offset, movement["at"]
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the ledger for a read-check-append sequence, across threads and processes"""
+        with self.lock, file_lock(self.path + ".lock"):
+            self._sync()
+            yield self
+
+    def balance(self, item_id):
+        """Current balance of an item, or None when it has no movements"""
+        with self.lock:
+            self._sync()
+            return self.balances.get(item_id)
+
+    def current(self):
+        """{item_id: current balance} of every item with movements"""
+        with self.lock:
+            self._sync()
+            return dict(self.balances)
+
+    def append(self, movements):
+        """Number, timestamp and append movements (which carry item_id, kind, quantity and balance); call inside locked()"""
+        if not movements:
+            return []
+        at = max(datetime.datetime.now().isoformat(timespec="microseconds"), self.last_at)
+        entries = []
+        for movement in movements:
+            self.seq += 1
+            entries.append({"seq": self.seq, "at": at, **movement})
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        with open(self.path, 'ab') as f:
+            # Drop a partial line left by an interrupted write
+            f.truncate(self.offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        first = self.seq - len(entries)
+        for entry in entries:
+            self.balances[entry["item_id"]] = entry["balance"]
+        self.offset += len(data)
+        self.last_at = at
+        if self.seq // self.interval > first // self.interval:
+            self.snapshot()
+        return entries
+
+    def snapshot(self):
+        """Write the current balances of all items as a snapshot; call inside locked()"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(self.snapshot_dir, f"{self.seq:012d}.json")
+        with open(path + ".tmp", 'w') as f:
+            json.dump({"seq": self.seq, "at": self.last_at, "offset": self.offset, "balances": self.balances}, f)
+        os.replace(path + ".tmp", path)
+        with open(self.snapshot_index_path, 'a') as f:
+            f.write(json.dumps({"seq": self.seq, "at": self.last_at, "offset": self.offset}) + "\n")
+        self._load_snapshots()
+
+    def balances_at(self, when):
+        """{item_id: balance} as of the ISO timestamp when, replaying at most one snapshot interval"""
+        with self.lock:
+            self._sync()
+            position = bisect.bisect_right(self.snapshots, (when, float("inf")))
+            balances, offset = {}, 0
+            if position:
+                _, seq, offset = self.snapshots[position - 1]
+                balances = self._snapshot_balances(seq)
+            end = self.offset
+        for movement, read_to in self._read_movements(offset):
+            if movement["at"] > when or read_to > end:
+                break
+            balances[movement["item_id"]] = movement["balance"]
+        return balances
+
+    def recent(self, limit=50, item_id=None):
+        """The latest movements, newest first, read backwards from the end of the log"""
+        with self.lock:
+            self._sync()
+            end = self.offset
+        found = []
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return found
+        with f:
+            tail = b""
+            while end > 0 and len(found) < limit:
+                start = max(end - 64 * 1024, 0)
+                f.seek(start)
+                lines = (f.read(end - start) + tail).split(b"\n")
+                # The first piece may be the end of a line that starts in an earlier block
+                tail = lines.pop(0) if start > 0 else b""
+                for line in reversed(lines):
+                    if line:
+                        movement = json.loads(line)
+                        if item_id is None or movement["item_id"] == item_id:
+                            found.append(movement)
+                end = start
+        return found[:limit]
+
+@st.cache_resource
+def get_stock_ledger():
+    """Return the process-wide stock ledger"""
+    return StockLedger(STOCK_LEDGER_PATH, STOCK_SNAPSHOT_DIR, STOCK_SNAPSHOT_INTERVAL)
+
+def stock_status(quantity, minimum_stock):
+    """Inventory status implied by a stock level"""
+    if quantity <= 0:
+        return "Out of Stock"
+    if quantity <= (minimum_stock or 0):
+        return "Low Stock"
+    return "In Stock"
+
+def _set_item_quantity(item, quantity):
+    if item.get('quantity') != quantity:
+        update_record("inventory", {**item, "quantity": quantity,
+                                    "status": stock_status(quantity, item.get('minimum_stock'))})
+
+def record_stock_movement(item_id, kind, quantity, reference=None, note=None):
+    """Log a receipt, dispense, expiry write-off or stocktake adjustment and update the item's quantity
+
+    quantity is the number of units received, dispensed or written off; for
+    an Adjustment it is the counted stock level. The first movement of an
+    item is preceded by an Opening entry with its stored quantity. Returns
+    the logged movement; raises ValueError when it cannot be applied.
+    """
+    if kind not in STOCK_MOVEMENT_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(STOCK_MOVEMENT_KINDS)}")
+    if quantity < 0 or (quantity == 0 and kind != "Adjustment"):
+        raise ValueError("quantity must be positive")
+    ledger = get_stock_ledger()
+    with ledger.locked():
+        item = get_record("inventory", item_id)
+        if item is None:
+            raise ValueError(f"Unknown inventory item '{item_id}'")
+        movements = []
+        balance = ledger.balances.get(item_id)
+        if balance is None:
+            balance = item.get('quantity') or 0
+            movements.append({"item_id": item_id, "kind": "Opening", "quantity": balance, "balance": balance})
+        change = {"Receipt": quantity, "Adjustment": quantity - balance}.get(kind, -quantity)
+        if balance + change < 0:
+            raise ValueError(f"Only {balance} {item.get('unit', 'units')} of {item.get('name', item_id)} in stock")
+        balance += change
+        movements.append({"item_id": item_id, "kind": kind, "quantity": change, "balance": balance,
+                          "reference": reference, "note": note})
+        # The item is updated first: a crash before the append leaves a
+        # quantity that reconcile_stock records as an adjustment
+        _set_item_quantity(item, balance)
+        return ledger.append(movements)[-1]
+
+def open_stock_item(item):
+    """Start the ledger of a new item with an Opening entry for its stored quantity"""
+    ledger = get_stock_ledger()
+    with ledger.locked():
+        if item.get('id') not in ledger.balances:
+            quantity = item.get('quantity') or 0
+            ledger.append([{"item_id": item.get('id'), "kind": "Opening", "quantity": quantity, "balance": quantity}])
+
+def reconcile_stock():
+    """Log Opening or Adjustment entries so the ledger matches every item's stored quantity
+
+    Covers items that have no movements yet and quantities changed outside
+    the ledger (imports, edits of the data files). Returns the movements logged.
+    """
+    ledger = get_stock_ledger()
+    with ledger.locked():
+        movements = []
+        for item in iter_records("inventory"):
+            quantity = item.get('quantity') or 0
+            balance = ledger.balances.get(item.get('id'))
+            if balance != quantity:
+                movements.append({"item_id": item.get('id'), "kind": "Opening" if balance is None else "Adjustment",
+                                  "quantity": quantity - (balance or 0), "balance": quantity,
+                                  "reference": None, "note": "Reconciled with stored quantity"})
+        return ledger.append(movements)
+
+def current_stock(item_id):
+    """Current balance of an item: its ledger balance, or the stored quantity before its first movement"""
+    balance = get_stock_ledger().balance(item_id)
+    if balance is None:
+        item = get_record("inventory", item_id)
+        balance = item.get('quantity') if item else None
+    return balance
+
+def stock_at(day):
+    """{item_id: balance} at the end of day, for items with movements by then"""
+    return get_stock_ledger().balances_at(datetime.datetime.combine(day, datetime.time.max).isoformat())
 
 def initialize_sample_data():
     """Initialize sample data if files don't exist"""
-    ensure_data_directory()
+    storage = get_storage()
 
     # Initialize patients
-    if not os.path.exists("data/patients.json"):
+    if not storage.exists("patients"):
         sample_patients = [
             {
                 "id": "P001",
@@ -111,7 +3720,7 @@ def initialize_sample_data():
         save_data("patients", sample_patients)
 
     # Initialize doctors
-    if not os.path.exists("data/doctors.json"):
+    if not storage.exists("doctors"):
         sample_doctors = [
             {
                 "id": "D001",
@@ -159,7 +3768,7 @@ def initialize_sample_data():
         save_data("doctors", sample_doctors)
 
     # Initialize appointments
-    if not os.path.exists("data/appointments.json"):
+    if not storage.exists("appointments"):
         sample_appointments = [
             {
                 "id": "A001",
@@ -168,7 +3777,7 @@ def initialize_sample_data():
                 "doctor_id": "D001",
                 "doctor_name": "Dr. John Smith",
                 "appointment_date": "2024-01-22",
-                "appointment_time": "10:00 AM",
+                "appointment_at": appointment_minutes("2024-01-22", "10:00 AM"),
                 "type": "Consultation",
                 "status": "Scheduled",
                 "notes": "Regular checkup",
@@ -181,7 +3790,7 @@ def initialize_sample_data():
                 "doctor_id": "D002",
                 "doctor_name": "Dr. Sarah Wilson",
                 "appointment_date": "2024-01-23",
-                "appointment_time": "2:00 PM",
+                "appointment_at": appointment_minutes("2024-01-23", "2:00 PM"),
                 "type": "Follow-up",
                 "status": "Completed",
                 "notes": "Post-surgery checkup",
@@ -191,7 +3800,7 @@ def initialize_sample_data():
         save_data("appointments", sample_appointments)
 
     # Initialize inventory
-    if not os.path.exists("data/inventory.json"):
+    if not storage.exists("inventory"):
         sample_inventory = [
             {
                 "id": "M001",
@@ -225,7 +3834,7 @@ def initialize_sample_data():
         save_data("inventory", sample_inventory)
 
     # Initialize billing
-    if not os.path.exists("data/billing.json"):
+    if not storage.exists("billing"):
         sample_billing = [
             {
                 "id": "B001",
@@ -248,6 +3857,33 @@ def initialize_sample_data():
         ]
         save_data("billing", sample_billing)
 
+def migrate_legacy_json(storage):
+    """Import data/<type>.json into a non-JSON engine that has no copy of that dataset yet"""
+    if storage.name == "json":
+        return {}
+    source = JSONStorage(DATA_DIR)
+    counts = {}
+    for data_type in DATA_TYPES:
+        if not storage.exists(data_type) and source.exists(data_type):
+            records = source.load(data_type)
+            save_data(data_type, records)
+            counts[data_type] = len(records)
+    return counts
+
+@st.cache_resource(show_spinner="Preparing hospital data...")
+def bootstrap(seed=SEED_SAMPLE_DATA):
+    """Prepare the data directory once per process
+
+    Everything that checks for files on disk happens here, so the code that
+    serves each rerun can assume the data directory and datasets exist.
+    """
+    ensure_data_directory()
+    storage = get_storage()
+    migrated = migrate_legacy_json(storage)
+    if seed:
+        initialize_sample_data()
+    return {"engine": storage.name, "migrated": migrated, "seeded": seed}
+
 # ----------------- AUTHENTICATION ----------------------
 USER_CREDENTIALS = {
     "admin": "admin123",
@@ -555,6 +4191,23 @@ def load_css():
         color: white;
     }
 
+    /* Lazy tab bar (horizontal radio rendered by lazy_tabs) */
+    div[class*="st-key-tab_"] div[role="radiogroup"] {
+        gap: 8px;
+    }
+
+    div[class*="st-key-tab_"] div[role="radiogroup"] > label {
+        background: var(--light-bg);
+        border-radius: 8px 8px 0 0;
+        padding: 0.75rem 1.5rem;
+        font-weight: 500;
+    }
+
+    div[class*="st-key-tab_"] div[role="radiogroup"] > label:has(input:checked) {
+        background: var(--primary-color);
+        color: white;
+    }
+
     /* Form styling */
     .stTextInput > div > div > input {
         border-radius: 8px;
@@ -682,6 +4335,184 @@ def status_badge(status):
     </span>
     """
 
+def lazy_tabs(key, tabs, select=None):
+    """Tab bar that runs only the selected section
+
+    st.tabs executes every tab body on each rerun. Here the selection is kept
+    in st.session_state[key] and only that section's function is called.
+    tabs is a list of (label, function); select switches to a label.
+    """
+    labels = [label for label, _ in tabs]
+    if select in labels:
+        st.session_state[key] = select
+    elif st.session_state.get(key) not in labels:
+        st.session_state[key] = labels[0]
+
+    selected = st.radio("Section", labels, key=key, horizontal=True, label_visibility="collapsed")
+    dict(tabs)[selected]()
+
+def paginated_table(key, data_type, default_columns, records=None):
+    """Display one page of a dataset with server-side sorting and column selection
+
+    Only the rows on the visible page are turned into a DataFrame, and the
+    row count comes from the aggregates instead of the dataset. Pass records
+    to page through an already filtered list instead.
+    """
+    available_columns = RECORD_FIELDS.get(data_type, default_columns)
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+
+    with col1:
+        columns = st.multiselect("Columns", available_columns, default=default_columns, key=f"{key}_columns")
+
+    with col2:
+        sort_by = st.selectbox("Sort by", ["Default order"] + available_columns, key=f"{key}_sort")
+
+    with col3:
+        descending = st.toggle("Descending", key=f"{key}_descending")
+
+    with col4:
+        page_size = st.selectbox("Rows per page", TABLE_PAGE_SIZES, key=f"{key}_page_size")
+
+    total = get_aggregates(data_type).get("count", 0) if records is None else len(records)
+    pages = max(1, math.ceil(total / page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+
+    offset = (page - 1) * page_size
+    sort_field = None if sort_by == "Default order" else sort_by
+    if records is None:
+        rows = load_page(data_type, offset, page_size, sort_field, descending)
+    elif sort_field:
+        sort_field = SORT_FIELDS.get(data_type, {}).get(sort_field, sort_field)
+        field_key = field_sort_key(sort_field)
+        rows = sorted(records, key=lambda r: field_key(r.get(sort_field)), reverse=descending)[offset:offset + page_size]
+    else:
+        rows = records[offset:offset + page_size]
+
+    rows = [display_record(data_type, row) for row in rows]
+    df = pd.DataFrame([{column: row.get(column) for column in columns} for row in rows], columns=columns)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    if rows:
+        st.caption(f"Showing {offset + 1:,}–{offset + len(rows):,} of {total:,}")
+
+# ----------------- CHARTS ----------------------
+@st.cache_resource
+def get_figure_cache():
+    """Recently drawn chart figures keyed by chart and dataset versions"""
+    return LRUCache(FIGURE_CACHE_SIZE)
+
+def cached_figure(chart_id, sources, build, *args):
+    """Figure from build(*args), reused until the data it is drawn from changes
+
+    sources are the (store, data_type) pairs build reads, an AggregateStore
+    or the IndexStore each. The key holds the version of the data those
+    stores serve rather than the storage's current version, so a figure
+    drawn from stale counters is never cached as current. Figures are
+    shared between sessions and must not be modified after building. build
+    may return None when there is nothing to chart.
+    """
+    storage = get_storage()
+    key = (chart_id, storage.name, args) + tuple(store.get_versioned(storage, data_type)[1] for store, data_type in sources)
+    figures = get_figure_cache()
+    # build may return None, so a miss is told apart with a sentinel
+    missing = object()
+    figure = figures.get(key, missing)
+    if figure is missing:
+        figure = build(*args)
+        figures.put(key, figure)
+    return figure
+
+def patient_status_pie():
+    """Pie of patients per status, sized for the dashboard"""
+    status_data = index_counts("patients", "status")
+    if not status_data:
+        return None
+    fig = px.pie(
+        values=list(status_data.values()),
+        names=list(status_data.keys()),
+        title="Patient Status Distribution",
+        color_discrete_sequence=['#2E86AB', '#A23B72', '#F18F01', '#28a745']
+    )
+    fig.update_layout(height=400)
+    return fig
+
+def patient_status_bar():
+    """Bar chart of patients per status"""
+    status_data = index_counts("patients", "status")
+    if not status_data:
+        return None
+    return px.bar(
+        x=list(status_data.keys()),
+        y=list(status_data.values()),
+        title="Patient Status Distribution",
+        color_discrete_sequence=['#2E86AB']
+    )
+
+def patient_gender_pie():
+    """Pie of patients per gender"""
+    gender_data = index_counts("patients", "gender")
+    if not gender_data:
+        return None
+    return px.pie(
+        values=list(gender_data.values()),
+        names=list(gender_data.keys()),
+        title="Patient Gender Distribution",
+        color_discrete_sequence=['#2E86AB', '#A23B72', '#F18F01']
+    )
+
+def monthly_revenue_bar():
+    """Bar chart of revenue per month, sized for the dashboard"""
+    monthly_revenue = revenue_series("month")
+    if not monthly_revenue:
+        return None
+    fig = px.bar(
+        x=list(monthly_revenue.keys()),
+        y=list(monthly_revenue.values()),
+        title="Monthly Revenue",
+        color_discrete_sequence=['#2E86AB']
+    )
+    fig.update_layout(
+        height=400,
+        xaxis_title="Month",
+        yaxis_title="Revenue ($)"
+    )
+    return fig
+
+def revenue_by_status_bar(grain):
+    """Revenue per "Month" or "Day", stacked by payment status"""
+    revenue = revenue_series(grain.lower(), by="payment_status")
+    if not revenue:
+        return None
+    rows = [(period, status, total) for period, split in revenue.items() for status, total in split.items()]
+    fig = px.bar(
+        x=[row[0] for row in rows],
+        y=[row[2] for row in rows],
+        color=[row[1] for row in rows],
+        title=f"{'Monthly' if grain == 'Month' else 'Daily'} Revenue",
+        color_discrete_sequence=['#2E86AB', '#F18F01', '#A23B72', '#28a745']
+    )
+    fig.update_layout(
+        xaxis_title=grain,
+        yaxis_title="Revenue ($)",
+        legend_title="Payment Status"
+    )
+    return fig
+
+def payment_status_pie():
+    """Pie of bills per payment status"""
+    payment_status = index_counts("billing", "payment_status")
+    if not payment_status:
+        return None
+    return px.pie(
+        values=list(payment_status.values()),
+        names=list(payment_status.keys()),
+        title="Payment Status Distribution",
+        color_discrete_sequence=['#28a745', '#ffc107', '#dc3545']
+    )
+
 # ----------------- HOME PAGE ----------------------
 def show_home():
     """Display the home page with welcome message and overview"""
@@ -696,11 +4527,9 @@ def show_home():
     st.markdown("### 📊 System Overview")
 
     # Get data for overview
-    patients = load_data("patients")
-    doctors = load_data("doctors")
-    appointments = load_data("appointments")
-    inventory = load_data("inventory")
-    billing = load_data("billing")
+    patient_stats = get_aggregates("patients")
+    doctor_stats = get_aggregates("doctors")
+    appointment_stats = get_aggregates("appointments")
 
     # Display key metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -712,7 +4541,7 @@ def show_home():
             <h3 style="color: #2D3436; margin: 0.5rem 0;">{}</h3>
             <p style="color: #636E72; margin: 0;">Total Patients</p>
         </div>
-        """.format(len(patients)), unsafe_allow_html=True)
+        """.format(patient_stats.get("count", 0)), unsafe_allow_html=True)
 
     with col2:
         st.markdown("""
@@ -721,7 +4550,7 @@ def show_home():
             <h3 style="color: #2D3436; margin: 0.5rem 0;">{}</h3>
             <p style="color: #636E72; margin: 0;">Total Doctors</p>
         </div>
-        """.format(len(doctors)), unsafe_allow_html=True)
+        """.format(doctor_stats.get("count", 0)), unsafe_allow_html=True)
 
     with col3:
         st.markdown("""
@@ -730,10 +4559,10 @@ def show_home():
             <h3 style="color: #2D3436; margin: 0.5rem 0;">{}</h3>
             <p style="color: #636E72; margin: 0;">Appointments</p>
         </div>
-        """.format(len(appointments)), unsafe_allow_html=True)
+        """.format(appointment_stats.get("count", 0)), unsafe_allow_html=True)
 
     with col4:
-        total_revenue = sum([b.get('total', 0) for b in billing])
+        total_revenue = revenue_total()
         st.markdown("""
         <div class="metric-container fade-in">
             <h2 style="color: #6C5CE7; font-size: 2.5rem; margin: 0;">💰</h2>
@@ -797,8 +4626,8 @@ def show_home():
 
     with col1:
         st.markdown("#### Recent Patients")
-        if patients:
-            recent_patients = sorted(patients, key=lambda x: x.get('created_date', ''), reverse=True)[:3]
+        if patient_stats.get("count"):
+            recent_patients = recent_records("patients", "created_date", 3)
             for patient in recent_patients:
                 st.markdown(f"""
                 <div style="background: #F8F9FF; padding: 1rem; border-radius: 10px; margin: 0.5rem 0;
@@ -812,17 +4641,14 @@ def show_home():
 
     with col2:
         st.markdown("#### Upcoming Appointments")
-        if appointments:
-            today = datetime.datetime.now().strftime('%Y-%m-%d')
-            upcoming = [apt for apt in appointments if apt.get('appointment_date', '') >= today and apt.get('status') == 'Scheduled']
-            upcoming = sorted(upcoming, key=lambda x: x.get('appointment_date', ''))[:3]
-
+        upcoming = date_range_records("appointments", date.today(), None, {'status': 'Scheduled'}, limit=3)
+        if upcoming:
             for appointment in upcoming:
                 st.markdown(f"""
                 <div style="background: #F8F9FF; padding: 1rem; border-radius: 10px; margin: 0.5rem 0;
                             border-left: 4px solid #00CEC9; box-shadow: 0 2px 8px rgba(0,0,0,0.05);">
                     <strong style="color: #2D3436;">{appointment.get('patient_name', 'Unknown')}</strong><br>
-                    <small style="color: #636E72;">{appointment.get('appointment_date', 'N/A')} at {appointment.get('appointment_time', 'N/A')}</small><br>
+                    <small style="color: #636E72;">{appointment.get('appointment_date', 'N/A')} at {appointment_time_label(appointment)}</small><br>
                     <small style="color: #636E72;">Doctor: {appointment.get('doctor_name', 'N/A')}</small>
                 </div>
                 """, unsafe_allow_html=True)
@@ -853,15 +4679,8 @@ def show_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
-    # Initialize sample data
-    initialize_sample_data()
-
     # Get statistics
-    patients = load_data("patients")
-    doctors = load_data("doctors")
-    appointments = load_data("appointments")
-    inventory = load_data("inventory")
-    billing = load_data("billing")
+    patient_stats = get_aggregates("patients")
 
     # Key Performance Indicators
     st.markdown("### 📊 Key Performance Indicators")
@@ -869,18 +4688,17 @@ def show_dashboard():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Patients", len(patients), 5.2)
+        metric_card("Total Patients", patient_stats.get("count", 0), 5.2)
 
     with col2:
-        active_patients = len([p for p in patients if p.get('status') == 'Admitted'])
+        active_patients = patient_stats.get("status=Admitted", 0)
         metric_card("Active Patients", active_patients, 2.1)
 
     with col3:
-        metric_card("Total Doctors", len(doctors), 0.0)
+        metric_card("Total Doctors", get_aggregates("doctors").get("count", 0), 0.0)
 
     with col4:
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        today_appointments = len([a for a in appointments if a.get('appointment_date') == today])
+        today_appointments = date_range_count("appointments", date.today(), date.today())
         metric_card("Today's Appointments", today_appointments, -1.5)
 
     st.markdown("---")
@@ -891,20 +4709,10 @@ def show_dashboard():
     with col1:
         st.markdown("### 📈 Patient Analytics")
 
-        if patients:
-            status_data = {}
-            for patient in patients:
-                status = patient.get('status', 'Unknown')
-                status_data[status] = status_data.get(status, 0) + 1
-
-            if status_data:
-                fig_patients = px.pie(
-                    values=list(status_data.values()),
-                    names=list(status_data.keys()),
-                    title="Patient Status Distribution",
-                    color_discrete_sequence=['#2E86AB', '#A23B72', '#F18F01', '#28a745']
-                )
-                fig_patients.update_layout(height=400)
+        if patient_stats.get("count"):
+            fig_patients = cached_figure("dashboard_patient_status", [(get_index_store(), "patients")], patient_status_pie)
+
+            if fig_patients:
                 st.plotly_chart(fig_patients, use_container_width=True)
         else:
             info_card("No Data", "No patient data available for analysis.")
@@ -912,32 +4720,10 @@ def show_dashboard():
     with col2:
         st.markdown("### 💰 Revenue Analytics")
 
-        if billing:
-            monthly_revenue = {}
-            for bill in billing:
-                date = bill.get('bill_date', '')
-                if date:
-                    try:
-                        month = date[:7]  # YYYY-MM format
-                        monthly_revenue[month] = monthly_revenue.get(month, 0) + bill.get('total', 0)
-                    except:
-                        continue
-
-            if monthly_revenue:
-                months = list(monthly_revenue.keys())
-                revenues = list(monthly_revenue.values())
-
-                fig_revenue = px.bar(
-                    x=months,
-                    y=revenues,
-                    title="Monthly Revenue",
-                    color_discrete_sequence=['#2E86AB']
-                )
-                fig_revenue.update_layout(
-                    height=400,
-                    xaxis_title="Month",
-                    yaxis_title="Revenue ($)"
-                )
+        if get_aggregates("billing").get("count"):
+            fig_revenue = cached_figure("dashboard_monthly_revenue", [(get_revenue_rollup_store(), "billing")], monthly_revenue_bar)
+
+            if fig_revenue:
                 st.plotly_chart(fig_revenue, use_container_width=True)
         else:
             info_card("No Data", "No billing data available for analysis.")
@@ -949,8 +4735,8 @@ def show_dashboard():
 
     with col1:
         st.markdown("#### Recent Patients")
-        if patients:
-            recent_patients = sorted(patients, key=lambda x: x.get('created_date', ''), reverse=True)[:5]
+        if patient_stats.get("count"):
+            recent_patients = recent_records("patients", "created_date", 5)
 
             for patient in recent_patients:
                 st.markdown(f"""
@@ -965,17 +4751,14 @@ def show_dashboard():
 
     with col2:
         st.markdown("#### Upcoming Appointments")
-        if appointments:
-            today = datetime.datetime.now().strftime('%Y-%m-%d')
-            upcoming = [apt for apt in appointments if apt.get('appointment_date', '') >= today and apt.get('status') == 'Scheduled']
-            upcoming = sorted(upcoming, key=lambda x: x.get('appointment_date', ''))[:5]
-
+        upcoming = date_range_records("appointments", date.today(), None, {'status': 'Scheduled'}, limit=5)
+        if upcoming:
             for appointment in upcoming:
                 st.markdown(f"""
                 <div style="background: #f8f9fa; padding: 1rem; border-radius: 8px; margin: 0.5rem 0;
                             border-left: 4px solid #A23B72;">
                     <strong>{appointment.get('patient_name', 'Unknown')}</strong><br>
-                    <small>{appointment.get('appointment_date', 'N/A')} at {appointment.get('appointment_time', 'N/A')}</small><br>
+                    <small>{appointment.get('appointment_date', 'N/A')} at {appointment_time_label(appointment)}</small><br>
                     <small>Doctor: {appointment.get('doctor_name', 'N/A')}</small>
                 </div>
                 """, unsafe_allow_html=True)
@@ -1003,31 +4786,26 @@ def show_patient_management():
     st.markdown("Manage patient records, admissions, and medical information")
 
     # Check if we need to show a specific tab
-    default_tab = 0
+    select = None
     if st.session_state.get('patient_tab') == 'Add Patient':
-        default_tab = 1
+        select = "➕ Add Patient"
         st.session_state.patient_tab = None  # Reset after use
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["📋 All Patients", "➕ Add Patient", "🔍 Search Patients"])
-
-    with tab1:
-        show_all_patients()
-
-    with tab2:
-        show_add_patient()
-
-    with tab3:
-        show_search_patients()
+    lazy_tabs("tab_patients", [
+        ("📋 All Patients", show_all_patients),
+        ("➕ Add Patient", show_add_patient),
+        ("🔍 Search Patients", show_search_patients),
+    ], select)
 
 def show_all_patients():
     """Display all patients"""
 
     st.markdown("### 📋 All Patients")
 
-    patients = load_data("patients")
+    stats = get_aggregates("patients")
 
-    if not patients:
+    if not stats.get("count"):
         info_card("No Patients", "No patient records found. Add your first patient using the 'Add Patient' tab.")
         return
 
@@ -1035,35 +4813,21 @@ def show_all_patients():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Patients", len(patients))
+        metric_card("Total Patients", stats.get("count", 0))
 
     with col2:
-        admitted = len([p for p in patients if p.get('status') == 'Admitted'])
-        metric_card("Currently Admitted", admitted)
+        metric_card("Currently Admitted", stats.get("status=Admitted", 0))
 
     with col3:
-        discharged = len([p for p in patients if p.get('status') == 'Discharged'])
-        metric_card("Discharged", discharged)
+        metric_card("Discharged", stats.get("status=Discharged", 0))
 
     with col4:
-        emergency = len([p for p in patients if 'emergency' in p.get('medical_history', '').lower()])
-        metric_card("Emergency Cases", emergency)
+        metric_card("Emergency Cases", stats.get("emergency", 0))
 
     st.markdown("---")
 
-    # Display patients in a table
-    if patients:
-        df = pd.DataFrame(patients)
-
-        # Select relevant columns for display
-        display_columns = ['id', 'name', 'age', 'gender', 'phone', 'status', 'assigned_doctor', 'room_number']
-        available_columns = [col for col in display_columns if col in df.columns]
-
-        st.dataframe(
-            df[available_columns],
-            use_container_width=True,
-            hide_index=True
-        )
+    # Display patients in a table, one page at a time
+    paginated_table("table_patients", "patients", ['id', 'name', 'age', 'gender', 'phone', 'status', 'assigned_doctor', 'room_number'])
 
 def show_add_patient():
     """Display add patient form"""
@@ -1096,8 +4860,7 @@ def show_add_patient():
             discharge_date = st.date_input("Expected Discharge Date", value=date.today())
 
             # Get list of doctors for assignment
-            doctors = load_data("doctors")
-            doctor_names = [f"Dr. {doc.get('name', 'Unknown')}" for doc in doctors if doc.get('status') == 'Active']
+            doctor_names = [f"Dr. {doc.get('name', 'Unknown')}" for doc in filter_records("doctors", {'status': 'Active'})]
             assigned_doctor = st.selectbox("Assigned Doctor", ["None"] + doctor_names)
 
             room_number = st.text_input("Room Number", placeholder="e.g., 101, 205")
@@ -1113,7 +4876,6 @@ def show_add_patient():
 
         if submit:
             if name and age and gender and phone:
-                patients = load_data("patients")
                 patient_data = {
                     "id": generate_id("patients"),
                     "name": name,
@@ -1134,8 +4896,7 @@ def show_add_patient():
                     "created_date": datetime.datetime.now().isoformat()
                 }
 
-                patients.append(patient_data)
-                save_data("patients", patients)
+                insert_record("patients", patient_data)
                 success_message(f"Patient '{name}' added successfully with ID: {patient_data['id']}")
                 st.rerun()
             else:
@@ -1149,14 +4910,12 @@ def show_search_patients():
 
     st.markdown("### 🔍 Search Patients")
 
-    patients = load_data("patients")
-
-    if not patients:
+    if not get_aggregates("patients").get("count"):
         info_card("No Patients", "No patient records available for search.")
         return
 
     # Search filters
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
 
     with col1:
         search_name = st.text_input("Search by Name", placeholder="Enter patient name")
@@ -1167,33 +4926,27 @@ def show_search_patients():
     with col3:
         filter_gender = st.selectbox("Filter by Gender", ["All", "Male", "Female", "Other"])
 
-    # Apply filters
-    filtered_patients = patients
-
-    if search_name:
-        filtered_patients = [p for p in filtered_patients if search_name.lower() in p.get('name', '').lower()]
+    with col4:
+        limit = st.number_input("Max results", min_value=1, max_value=1000, value=SEARCH_RESULT_LIMIT, step=10)
 
+    # Apply filters through the name and field indexes
+    filters = {}
     if filter_status != "All":
-        filtered_patients = [p for p in filtered_patients if p.get('status') == filter_status]
-
+        filters['status'] = filter_status
     if filter_gender != "All":
-        filtered_patients = [p for p in filtered_patients if p.get('gender') == filter_gender]
+        filters['gender'] = filter_gender
 
-    # Display results
-    st.markdown(f"### Search Results ({len(filtered_patients)} patients found)")
+    found, filtered_patients = search_records("patients", search_name, filters, limit)
 
-    if filtered_patients:
-        df = pd.DataFrame(filtered_patients)
+    # Display results, best matches first
+    if found > len(filtered_patients):
+        st.markdown(f"### Search Results ({found} patients found, showing the best {len(filtered_patients)})")
+    else:
+        st.markdown(f"### Search Results ({found} patients found)")
 
-        # Select relevant columns
+    if filtered_patients:
         display_columns = ['id', 'name', 'age', 'gender', 'phone', 'status', 'assigned_doctor', 'room_number']
-        available_columns = [col for col in display_columns if col in df.columns]
-
-        st.dataframe(
-            df[available_columns],
-            use_container_width=True,
-            hide_index=True
-        )
+        paginated_table("table_search_patients", "patients", display_columns, records=filtered_patients)
     else:
         info_card("No Results", "No patients match your search criteria.")
 
@@ -1205,16 +4958,11 @@ def show_doctor_management():
     st.markdown("Manage doctor profiles, specializations, and schedules")
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["👨‍⚕️ All Doctors", "➕ Add Doctor", "📅 Schedules"])
-
-    with tab1:
-        show_all_doctors()
-
-    with tab2:
-        show_add_doctor()
-
-    with tab3:
-        show_doctor_schedules()
+    lazy_tabs("tab_doctors", [
+        ("👨‍⚕️ All Doctors", show_all_doctors),
+        ("➕ Add Doctor", show_add_doctor),
+        ("📅 Schedules", show_doctor_schedules),
+    ])
 
 def show_all_doctors():
     """Display all doctors"""
@@ -1228,21 +4976,20 @@ def show_all_doctors():
         return
 
     # Display statistics
+    stats = get_aggregates("doctors")
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Doctors", len(doctors))
+        metric_card("Total Doctors", stats.get("count", 0))
 
     with col2:
-        active = len([d for d in doctors if d.get('status') == 'Active'])
-        metric_card("Active Doctors", active)
+        metric_card("Active Doctors", stats.get("status=Active", 0))
 
     with col3:
-        specializations = len(set([d.get('specialization', '') for d in doctors]))
-        metric_card("Specializations", specializations)
+        metric_card("Specializations", len(count_by("doctors", "specialization")))
 
     with col4:
-        avg_experience = sum([d.get('experience', 0) for d in doctors]) / len(doctors) if doctors else 0
+        avg_experience = stats.get("experience", 0) / stats["count"] if stats.get("count") else 0
         metric_card("Avg Experience", f"{avg_experience:.1f} years")
 
     st.markdown("---")
@@ -1310,7 +5057,6 @@ def show_add_doctor():
 
         if submit:
             if name and specialization and department and phone and email and qualification:
-                doctors = load_data("doctors")
                 doctor_data = {
                     "id": generate_id("doctors"),
                     "name": name,
@@ -1326,8 +5072,7 @@ def show_add_doctor():
                     "created_date": datetime.datetime.now().isoformat()
                 }
 
-                doctors.append(doctor_data)
-                save_data("doctors", doctors)
+                insert_record("doctors", doctor_data)
                 success_message(f"Doctor '{name}' added successfully with ID: {doctor_data['id']}")
                 st.rerun()
             else:
@@ -1341,39 +5086,66 @@ def show_doctor_schedules():
 
     st.markdown("### 📅 Doctor Schedules & Availability")
 
-    doctors = load_data("doctors")
-
-    if not doctors:
+    if not get_aggregates("doctors").get("count"):
         info_card("No Doctors", "No doctor records available.")
         return
 
     # Filter by department
-    departments = list(set([d.get('department', 'Unknown') for d in doctors]))
+    departments = index_values("doctors", "department")
     selected_dept = st.selectbox("Filter by Department", ["All"] + departments)
 
-    filtered_doctors = doctors
+    filters = {'status': 'Active'}
     if selected_dept != "All":
-        filtered_doctors = [d for d in doctors if d.get('department') == selected_dept]
+        filters['department'] = selected_dept
 
     # Display schedules in a table format
+    doctors = filter_records("doctors", filters)
     schedule_data = []
-    for doctor in filtered_doctors:
-        if doctor.get('status') == 'Active':
-            schedule_data.append({
-                "Doctor": doctor.get('name', 'Unknown'),
-                "Specialization": doctor.get('specialization', 'Unknown'),
-                "Department": doctor.get('department', 'Unknown'),
-                "Schedule": doctor.get('schedule', 'Not specified'),
-                "Consultation Fee": f"${doctor.get('consultation_fee', 0):.2f}",
-                "Phone": doctor.get('phone', 'N/A'),
-                "Status": doctor.get('status', 'Unknown')
-            })
+    for doctor in doctors:
+        upcoming = next_free_slots([doctor], 1)
+        schedule_data.append({
+            "Doctor": doctor.get('name', 'Unknown'),
+            "Specialization": doctor.get('specialization', 'Unknown'),
+            "Department": doctor.get('department', 'Unknown'),
+            "Schedule": doctor.get('schedule', 'Not specified'),
+            "Next Available": format_slot(upcoming[0][0]) if upcoming else "None",
+            "Consultation Fee": f"${doctor.get('consultation_fee', 0):.2f}",
+            "Phone": doctor.get('phone', 'N/A'),
+            "Status": doctor.get('status', 'Unknown')
+        })
+
+    if not schedule_data:
+        info_card("No Active Doctors", "No active doctors found in the selected department.")
+        return
+
+    df = pd.DataFrame(schedule_data)
+    st.dataframe(df, use_container_width=True, hide_index=True)
 
-    if schedule_data:
-        df = pd.DataFrame(schedule_data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+    # Earliest free slots of one doctor, or of every listed doctor merged
+    st.markdown("#### 🔎 Next Free Slots")
+    col1, col2 = st.columns([3, 1])
+
+    with col1:
+        any_doctor = "Any doctor" if selected_dept == "All" else f"Any doctor in {selected_dept}"
+        doctor_names = [doctor.get('name', 'Unknown') for doctor in doctors]
+        selected_doctor = st.selectbox("Doctor", [any_doctor] + doctor_names)
+
+    with col2:
+        count = st.number_input("Slots to show", min_value=1, max_value=50, value=5)
+
+    candidates = doctors if selected_doctor == any_doctor else [doctors[doctor_names.index(selected_doctor)]]
+    slots = next_free_slots(candidates, count)
+
+    if slots:
+        slot_data = [{
+            "When": format_slot(minutes),
+            "Doctor": doctor.get('name', 'Unknown'),
+            "Department": doctor.get('department', 'Unknown'),
+            "Consultation Fee": f"${doctor.get('consultation_fee', 0):.2f}"
+        } for minutes, doctor in slots]
+        st.dataframe(pd.DataFrame(slot_data), use_container_width=True, hide_index=True)
     else:
-        info_card("No Active Doctors", "No active doctors found in the selected department.")
+        info_card("No Free Slots", f"No free slots in the next {AVAILABILITY_HORIZON_DAYS} days.")
 
 # ----------------- APPOINTMENTS ----------------------
 def show_appointments():
@@ -1383,29 +5155,27 @@ def show_appointments():
     st.markdown("Schedule, manage, and track patient appointments")
 
     # Check if we need to show a specific tab
+    select = None
     if st.session_state.get('appointment_tab') == 'Schedule Appointment':
+        select = "➕ Schedule Appointment"
         st.session_state.appointment_tab = None  # Reset after use
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["📅 All Appointments", "➕ Schedule Appointment", "📊 Calendar View"])
-
-    with tab1:
-        show_all_appointments()
-
-    with tab2:
-        show_schedule_appointment()
-
-    with tab3:
-        show_calendar_view()
+    lazy_tabs("tab_appointments", [
+        ("📅 All Appointments", show_all_appointments),
+        ("➕ Schedule Appointment", show_schedule_appointment),
+        ("📊 Calendar View", show_calendar_view),
+        ("📥 Batch Scheduling", show_batch_scheduling),
+    ], select)
 
 def show_all_appointments():
     """Display all appointments"""
 
     st.markdown("### 📅 All Appointments")
 
-    appointments = load_data("appointments")
+    stats = get_aggregates("appointments")
 
-    if not appointments:
+    if not stats.get("count"):
         info_card("No Appointments", "No appointments found. Schedule your first appointment using the 'Schedule Appointment' tab.")
         return
 
@@ -1413,65 +5183,62 @@ def show_all_appointments():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Appointments", len(appointments))
+        metric_card("Total Appointments", stats.get("count", 0))
 
     with col2:
-        scheduled = len([a for a in appointments if a.get('status') == 'Scheduled'])
-        metric_card("Scheduled", scheduled)
+        metric_card("Scheduled", stats.get("status=Scheduled", 0))
 
     with col3:
-        completed = len([a for a in appointments if a.get('status') == 'Completed'])
-        metric_card("Completed", completed)
+        metric_card("Completed", stats.get("status=Completed", 0))
 
     with col4:
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        today_appointments = len([a for a in appointments if a.get('appointment_date') == today])
-        metric_card("Today", today_appointments)
+        metric_card("Today", date_range_count("appointments", date.today(), date.today()))
 
     st.markdown("---")
 
-    # Display appointments in a table
-    if appointments:
-        df = pd.DataFrame(appointments)
-
-        # Select relevant columns for display
-        display_columns = ['id', 'patient_name', 'doctor_name', 'appointment_date', 'appointment_time', 'type', 'status']
-        available_columns = [col for col in display_columns if col in df.columns]
-
-        st.dataframe(
-            df[available_columns],
-            use_container_width=True,
-            hide_index=True
-        )
+    # Display appointments in a table, one page at a time
+    paginated_table("table_appointments", "appointments", ['id', 'patient_name', 'doctor_name', 'appointment_date', 'appointment_time', 'type', 'status'])
 
 def show_schedule_appointment():
     """Display schedule appointment form"""
 
     st.markdown("### ➕ Schedule New Appointment")
 
-    # Get patients and doctors for dropdowns
+    # Get patients for the dropdown
     patients = load_data("patients")
-    doctors = load_data("doctors")
 
-    if not patients or not doctors:
+    if not patients or not get_aggregates("doctors").get("count"):
         error_message("Please ensure you have both patients and doctors in the system before scheduling appointments.")
         return
 
+    # Doctor and date are picked outside the form so the time list can be
+    # narrowed to that doctor's free slots as soon as either changes
+    col1, col2 = st.columns(2)
+
+    with col1:
+        active_doctors = filter_records("doctors", {'status': 'Active'})
+        doctor_options = [f"{d.get('name', 'Unknown')} - {d.get('specialization', 'N/A')}" for d in active_doctors]
+        selected_doctor = st.selectbox("Select Doctor *", doctor_options)
+
+    with col2:
+        # Date selection (minimum today)
+        appointment_date = st.date_input("Appointment Date *",
+                                       min_value=date.today(),
+                                       value=date.today())
+
+    doctor = active_doctors[doctor_options.index(selected_doctor)] if selected_doctor else {}
+    open_slots = available_slots(doctor, appointment_date) if doctor else []
+
     with st.form("schedule_appointment_form"):
         col1, col2 = st.columns(2)
 
         with col1:
-            st.markdown("#### Patient & Doctor Selection")
+            st.markdown("#### Patient & Visit")
 
             # Patient selection
             patient_options = [f"{p.get('name', 'Unknown')} (ID: {p.get('id', 'N/A')})" for p in patients]
             selected_patient = st.selectbox("Select Patient *", patient_options)
 
-            # Doctor selection
-            active_doctors = [d for d in doctors if d.get('status') == 'Active']
-            doctor_options = [f"{d.get('name', 'Unknown')} - {d.get('specialization', 'N/A')}" for d in active_doctors]
-            selected_doctor = st.selectbox("Select Doctor *", doctor_options)
-
             # Appointment type
             appointment_type = st.selectbox("Appointment Type *", [
                 "Consultation", "Follow-up", "Check-up", "Emergency",
@@ -1479,20 +5246,14 @@ def show_schedule_appointment():
             ])
 
         with col2:
-            st.markdown("#### Date & Time")
+            st.markdown("#### Time")
 
-            # Date selection (minimum today)
-            appointment_date = st.date_input("Appointment Date *",
-                                           min_value=date.today(),
-                                           value=date.today())
-
-            # Time selection
-            time_slots = [
-                "09:00 AM", "09:30 AM", "10:00 AM", "10:30 AM", "11:00 AM", "11:30 AM",
-                "12:00 PM", "12:30 PM", "01:00 PM", "01:30 PM", "02:00 PM", "02:30 PM",
-                "03:00 PM", "03:30 PM", "04:00 PM", "04:30 PM", "05:00 PM", "05:30 PM"
-            ]
-            appointment_time = st.selectbox("Appointment Time *", time_slots)
+            # Only slots in the doctor's schedule that are still free on the chosen date
+            appointment_minute = st.selectbox("Appointment Time *", open_slots, format_func=format_time_of_day)
+            if doctor and not open_slots:
+                upcoming = next_free_slots([doctor], 1, appointment_date)
+                hint = f" Next free slot: {format_slot(upcoming[0][0])}." if upcoming else ""
+                st.caption(f"{doctor.get('name', 'This doctor')} has no free slots on {appointment_date}.{hint}")
 
             # Notes
             notes = st.text_area("Notes", placeholder="Additional notes or special instructions")
@@ -1506,52 +5267,72 @@ def show_schedule_appointment():
             clear = st.form_submit_button("🔄 Clear", use_container_width=True)
 
         if submit:
-            if selected_patient and selected_doctor and appointment_date and appointment_time:
-                # Extract patient and doctor information
+            if selected_patient and doctor and appointment_date and appointment_minute is not None:
+                # Extract patient information
                 patient_id = selected_patient.split("ID: ")[1].split(")")[0]
                 patient_name = selected_patient.split(" (ID:")[0]
-                doctor_name = selected_doctor.split(" - ")[0]
-
-                # Find doctor ID
-                doctor_id = None
-                for doctor in active_doctors:
-                    if doctor.get('name') == doctor_name:
-                        doctor_id = doctor.get('id')
-                        break
 
-                appointments = load_data("appointments")
                 appointment_data = {
                     "id": generate_id("appointments"),
                     "patient_id": patient_id,
                     "patient_name": patient_name,
-                    "doctor_id": doctor_id,
-                    "doctor_name": doctor_name,
+                    "doctor_id": doctor.get('id'),
+                    "doctor_name": doctor.get('name'),
                     "appointment_date": str(appointment_date),
-                    "appointment_time": appointment_time,
+                    "appointment_at": appointment_date.toordinal() * MINUTES_PER_DAY + appointment_minute,
                     "type": appointment_type,
                     "status": "Scheduled",
                     "notes": notes,
                     "created_date": datetime.datetime.now().isoformat()
                 }
 
-                appointments.append(appointment_data)
-                save_data("appointments", appointments)
-                success_message(f"Appointment scheduled successfully! ID: {appointment_data['id']}")
-                st.rerun()
+                if book_appointment(appointment_data):
+                    success_message(f"Appointment scheduled successfully! ID: {appointment_data['id']}")
+                    st.rerun()
+                else:
+                    error_message(f"{format_time_of_day(appointment_minute)} on {appointment_date} was just booked for this doctor. Please pick another time.")
             else:
                 error_message("Please fill in all required fields marked with *")
 
         if clear:
             st.rerun()
 
+def show_batch_scheduling():
+    """Book a file of appointment requests in one go"""
+
+    st.markdown("### 📥 Batch Scheduling")
+    st.caption("Upload a CSV (with header) or JSON Lines file with the columns patient_id, department, "
+               "earliest_date (YYYY-MM-DD), type and optionally max_fee and notes. Each request gets the "
+               "earliest free slot of an active doctor in its department.")
+
+    uploaded = st.file_uploader("Request file", type=["csv", "jsonl"])
+
+    if uploaded is not None and st.button("📅 Schedule Batch", type="primary"):
+        try:
+            requests = parse_batch_requests(uploaded.getvalue().decode("utf-8-sig"))
+        except (ValueError, csv.Error) as e:
+            error_message(f"Could not read the request file: {e}")
+            return
+        appointments, unplaced = schedule_batch(requests)
+        st.session_state.batch_schedule_result = (len(appointments), unplaced)
+
+    result = st.session_state.get('batch_schedule_result')
+    if result:
+        scheduled, unplaced = result
+        success_message(f"Scheduled {scheduled} appointments, {len(unplaced)} requests could not be placed.")
+        if unplaced:
+            st.dataframe(pd.DataFrame([{**request, 'reason': reason} for request, reason in unplaced],
+                                      columns=BATCH_REPORT_FIELDS),
+                         use_container_width=True, hide_index=True)
+            st.download_button("⬇️ Download unplaced requests", unplaced_report(unplaced),
+                               file_name="unplaced_requests.csv", mime="text/csv")
+
 def show_calendar_view():
     """Display calendar view of appointments"""
 
     st.markdown("### 📊 Calendar View")
 
-    appointments = load_data("appointments")
-
-    if not appointments:
+    if not get_aggregates("appointments").get("count"):
         info_card("No Appointments", "No appointments to display in calendar view.")
         return
 
@@ -1564,12 +5345,8 @@ def show_calendar_view():
     with col2:
         end_date = st.date_input("End Date", value=date.today() + timedelta(days=7))
 
-    # Filter appointments by date range
-    filtered_appointments = []
-    for appointment in appointments:
-        apt_date = appointment.get('appointment_date', '')
-        if apt_date and start_date <= datetime.datetime.strptime(apt_date, '%Y-%m-%d').date() <= end_date:
-            filtered_appointments.append(appointment)
+    # Only the appointments in range are read, already in date order
+    filtered_appointments = date_range_records("appointments", start_date, end_date)
 
     if filtered_appointments:
         # Group appointments by date
@@ -1581,18 +5358,16 @@ def show_calendar_view():
             appointments_by_date[apt_date].append(appointment)
 
         # Display appointments by date
-        for apt_date in sorted(appointments_by_date.keys()):
+        for apt_date in appointments_by_date:
             st.markdown(f"#### 📅 {apt_date}")
 
-            daily_appointments = appointments_by_date[apt_date]
-            daily_appointments.sort(key=lambda x: x.get('appointment_time', ''))
-
-            for appointment in daily_appointments:
+            # The date index already orders each day by appointment_at
+            for appointment in appointments_by_date[apt_date]:
                 badge = status_badge(appointment.get('status', 'Unknown'))
                 st.markdown(f"""
                 <div style="background: #f8f9fa; padding: 1rem; border-radius: 8px; margin: 0.5rem 0;
                             border-left: 4px solid #F18F01;">
-                    <strong>{appointment.get('appointment_time', 'N/A')}</strong> -
+                    <strong>{appointment_time_label(appointment)}</strong> -
                     {appointment.get('patient_name', 'Unknown')} with {appointment.get('doctor_name', 'Unknown')}
                     {badge}
                     <br><small>{appointment.get('type', 'N/A')} | {appointment.get('notes', 'No notes')}</small>
@@ -1611,29 +5386,27 @@ def show_billing():
     st.markdown("Manage patient bills, payments, and financial records")
 
     # Check if we need to show a specific tab
+    select = None
     if st.session_state.get('billing_tab') == 'Create Bill':
+        select = "➕ Create Bill"
         st.session_state.billing_tab = None  # Reset after use
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["💳 All Bills", "➕ Create Bill", "📊 Financial Reports"])
-
-    with tab1:
-        show_all_bills()
-
-    with tab2:
-        show_create_bill()
-
-    with tab3:
-        show_financial_reports()
+    lazy_tabs("tab_billing", [
+        ("💳 All Bills", show_all_bills),
+        ("➕ Create Bill", show_create_bill),
+        ("📊 Financial Reports", show_financial_reports),
+        ("🧾 End-of-Day Run", show_billing_run),
+    ], select)
 
 def show_all_bills():
     """Display all bills"""
 
     st.markdown("### 💳 All Bills")
 
-    bills = load_data("billing")
+    stats = get_aggregates("billing")
 
-    if not bills:
+    if not stats.get("count"):
         info_card("No Bills", "No billing records found. Create your first bill using the 'Create Bill' tab.")
         return
 
@@ -1641,35 +5414,62 @@ def show_all_bills():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Bills", len(bills))
+        metric_card("Total Bills", stats.get("count", 0))
 
     with col2:
-        total_revenue = sum([b.get('total', 0) for b in bills])
-        metric_card("Total Revenue", f"${total_revenue:,.2f}")
+        metric_card("Total Revenue", f"${revenue_total():,.2f}")
 
     with col3:
-        paid_bills = len([b for b in bills if b.get('payment_status') == 'Paid'])
-        metric_card("Paid Bills", paid_bills)
+        metric_card("Paid Bills", stats.get("payment_status=Paid", 0))
 
     with col4:
-        pending_bills = len([b for b in bills if b.get('payment_status') == 'Pending'])
-        metric_card("Pending Bills", pending_bills)
+        metric_card("Pending Bills", stats.get("payment_status=Pending", 0))
 
     st.markdown("---")
 
-    # Display bills in a table
-    if bills:
-        df = pd.DataFrame(bills)
-
-        # Select relevant columns for display
-        display_columns = ['id', 'patient_name', 'bill_date', 'total', 'payment_status', 'payment_method']
-        available_columns = [col for col in display_columns if col in df.columns]
-
-        st.dataframe(
-            df[available_columns],
-            use_container_width=True,
-            hide_index=True
-        )
+    # Display bills in a table, one page at a time
+    paginated_table("table_bills", "billing", ['id', 'patient_name', 'bill_date', 'total', 'payment_status', 'payment_method'])
+
+def show_billing_run():
+    """Bill a day's discharges and completed appointments"""
+
+    st.markdown("### 🧾 End-of-Day Billing Run")
+    st.markdown(f"Creates one itemized bill per patient for stays ending and appointments completed on the day: "
+                f"consultations at the doctor's fee, room days at ${BILLING_ROOM_RATE:,.2f}, "
+                f"tax {BILLING_TAX_RATE:g}%. Charges already billed are skipped, so the run can be repeated.")
+
+    with st.form("billing_run_form"):
+        day = st.date_input("Day", value=date.today(), key="billing_run_date")
+        submitted = st.form_submit_button("🧾 Run Billing", type="primary", use_container_width=True)
+
+    if submitted:
+        # Worker processes need an importable module, so the run happens in a
+        # separate `python app.py billing-run` process
+        with st.spinner("Pricing and writing bills..."):
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "billing-run",
+                                     "--date", day.isoformat(), "--json"],
+                                    capture_output=True, text=True)
+        if result.returncode != 0:
+            error_message(f"Billing run failed: {(result.stderr.strip().splitlines() or ['exit status ' + str(result.returncode)])[-1]}")
+            return
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            metric_card("Bills Created", report["bills"])
+        with col2:
+            metric_card("Billed", f"${report['total']:,.2f}")
+        with col3:
+            metric_card("Already Billed", report["already_billed"])
+        with col4:
+            metric_card("Throughput", f"{report['bills_per_s']:,.0f}/s")
+        st.caption(f"{report['charges']} charges priced with {report['workers'] or 'no'} worker processes in "
+                   f"{report['elapsed_s']:.2f}s (collect {report['collect_s']:.2f}s, price {report['price_s']:.2f}s, "
+                   f"commit {report['commit_s']:.2f}s)")
+        if report["bills"]:
+            success_message(f"Created {report['bills']} bills for {report['date']}")
+        else:
+            info_card("Nothing to Bill", f"Every discharge and completed appointment on {report['date']} is already billed.")
 
 def show_create_bill():
     """Display create bill form"""
@@ -1736,8 +5536,6 @@ def show_create_bill():
                 patient_id = selected_patient.split("ID: ")[1].split(")")[0]
                 patient_name = selected_patient.split(" (ID:")[0]
 
-                bills = load_data("billing")
-
                 # Create bill items
                 items = []
                 if consultation_fee > 0:
@@ -1766,8 +5564,7 @@ def show_create_bill():
                     "created_date": datetime.datetime.now().isoformat()
                 }
 
-                bills.append(bill_data)
-                save_data("billing", bills)
+                insert_record("billing", bill_data)
                 success_message(f"Bill created successfully! ID: {bill_data['id']} | Total: ${total:.2f}")
                 st.rerun()
             else:
@@ -1781,57 +5578,38 @@ def show_financial_reports():
 
     st.markdown("### 📊 Financial Reports")
 
-    bills = load_data("billing")
-
-    if not bills:
+    if not get_aggregates("billing").get("count"):
         info_card("No Data", "No billing data available for financial reports.")
         return
 
+    # Revenue totals straight from the rollup
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        metric_card("Total Revenue", f"${revenue_total():,.2f}")
+
+    with col2:
+        metric_card("Collected", f"${revenue_total({'payment_status': 'Paid'}):,.2f}")
+
+    with col3:
+        metric_card("Pending & Partial", f"${revenue_total() - revenue_total({'payment_status': 'Paid'}):,.2f}")
+
     # Revenue analytics
     col1, col2 = st.columns(2)
 
     with col1:
-        # Monthly revenue
-        monthly_revenue = {}
-        for bill in bills:
-            date = bill.get('bill_date', '')
-            if date:
-                try:
-                    month = date[:7]  # YYYY-MM format
-                    monthly_revenue[month] = monthly_revenue.get(month, 0) + bill.get('total', 0)
-                except:
-                    continue
-
-        if monthly_revenue:
-            months = list(monthly_revenue.keys())
-            revenues = list(monthly_revenue.values())
+        # Revenue per month or day, stacked by payment status
+        grain = st.radio("Period", ["Month", "Day"], horizontal=True, key="revenue_grain")
+        fig_revenue = cached_figure("financial_revenue", [(get_revenue_rollup_store(), "billing")], revenue_by_status_bar, grain)
 
-            fig_revenue = px.bar(
-                x=months,
-                y=revenues,
-                title="Monthly Revenue",
-                color_discrete_sequence=['#2E86AB']
-            )
-            fig_revenue.update_layout(
-                xaxis_title="Month",
-                yaxis_title="Revenue ($)"
-            )
+        if fig_revenue:
             st.plotly_chart(fig_revenue, use_container_width=True)
 
     with col2:
         # Payment status distribution
-        payment_status = {}
-        for bill in bills:
-            status = bill.get('payment_status', 'Unknown')
-            payment_status[status] = payment_status.get(status, 0) + 1
-
-        if payment_status:
-            fig_status = px.pie(
-                values=list(payment_status.values()),
-                names=list(payment_status.keys()),
-                title="Payment Status Distribution",
-                color_discrete_sequence=['#28a745', '#ffc107', '#dc3545']
-            )
+        fig_status = cached_figure("financial_payment_status", [(get_index_store(), "billing")], payment_status_pie)
+
+        if fig_status:
             st.plotly_chart(fig_status, use_container_width=True)
 
 # ----------------- INVENTORY ----------------------
@@ -1842,25 +5620,21 @@ def show_inventory():
     st.markdown("Manage medicines, equipment, and medical supplies")
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["📦 All Items", "➕ Add Item", "⚠️ Low Stock Alerts"])
-
-    with tab1:
-        show_all_inventory()
-
-    with tab2:
-        show_add_inventory()
-
-    with tab3:
-        show_low_stock_alerts()
+    lazy_tabs("tab_inventory", [
+        ("📦 All Items", show_all_inventory),
+        ("➕ Add Item", show_add_inventory),
+        ("⚠️ Low Stock Alerts", show_low_stock_alerts),
+        ("📒 Stock Ledger", show_stock_ledger),
+    ])
 
 def show_all_inventory():
     """Display all inventory items"""
 
     st.markdown("### 📦 All Inventory Items")
 
-    inventory = load_data("inventory")
+    stats = get_aggregates("inventory")
 
-    if not inventory:
+    if not stats.get("count"):
         info_card("No Items", "No inventory items found. Add your first item using the 'Add Item' tab.")
         return
 
@@ -1868,36 +5642,30 @@ def show_all_inventory():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Items", len(inventory))
+        metric_card("Total Items", stats.get("count", 0))
 
     with col2:
-        in_stock = len([i for i in inventory if i.get('status') == 'In Stock'])
-        metric_card("In Stock", in_stock)
+        metric_card("In Stock", stats.get("status=In Stock", 0))
 
     with col3:
-        low_stock = len([i for i in inventory if i.get('quantity', 0) <= i.get('minimum_stock', 0)])
-        metric_card("Low Stock", low_stock)
+        metric_card("Low Stock", stats.get("low_stock", 0))
 
     with col4:
-        total_value = sum([i.get('quantity', 0) * i.get('price_per_unit', 0) for i in inventory])
-        metric_card("Total Value", f"${total_value:,.2f}")
-
-    st.markdown("---")
-
-    # Display inventory in a table
-    if inventory:
-        df = pd.DataFrame(inventory)
-
-        # Select relevant columns for display
-        display_columns = ['id', 'name', 'category', 'quantity', 'unit', 'price_per_unit', 'status']
-        available_columns = [col for col in display_columns if col in df.columns]
+        metric_card("Total Value", f"${stats.get('value', 0):,.2f}")
 
+    with st.expander("📊 Stock by Category"):
+        by_category = inventory_by_category()
         st.dataframe(
-            df[available_columns],
-            use_container_width=True,
-            hide_index=True
+            by_category.rename(columns={"category": "Category", "items": "Items", "quantity": "Units",
+                                        "value": "Stock Value ($)", "low_stock": "Low Stock"}),
+            use_container_width=True, hide_index=True
         )
 
+    st.markdown("---")
+
+    # Display inventory in a table, one page at a time
+    paginated_table("table_inventory", "inventory", ['id', 'name', 'category', 'quantity', 'unit', 'price_per_unit', 'status'])
+
 def show_add_inventory():
     """Display add inventory form"""
 
@@ -1932,7 +5700,6 @@ def show_add_inventory():
 
         if submit:
             if name and category and quantity >= 0 and unit and price_per_unit >= 0:
-                inventory = load_data("inventory")
                 item_data = {
                     "id": generate_id("inventory"),
                     "name": name,
@@ -1948,8 +5715,8 @@ def show_add_inventory():
                     "created_date": datetime.datetime.now().isoformat()
                 }
 
-                inventory.append(item_data)
-                save_data("inventory", inventory)
+                insert_record("inventory", item_data)
+                open_stock_item(item_data)
                 success_message(f"Item '{name}' added successfully with ID: {item_data['id']}")
                 st.rerun()
             else:
@@ -1963,14 +5730,12 @@ def show_low_stock_alerts():
 
     st.markdown("### ⚠️ Low Stock Alerts")
 
-    inventory = load_data("inventory")
-
-    if not inventory:
+    if not get_aggregates("inventory").get("count"):
         info_card("No Items", "No inventory items available.")
         return
 
     # Find low stock items
-    low_stock_items = [item for item in inventory if item.get('quantity', 0) <= item.get('minimum_stock', 0)]
+    low_stock_items = records_by_id("inventory", low_stock_frame()["id"].tolist())
 
     if low_stock_items:
         st.warning(f"⚠️ {len(low_stock_items)} items are running low on stock!")
@@ -1988,6 +5753,71 @@ def show_low_stock_alerts():
     else:
         success_message("✅ All items are adequately stocked!")
 
+def show_stock_ledger():
+    """Record stock movements and view running and past balances"""
+
+    st.markdown("### 📒 Stock Ledger")
+
+    items = load_data("inventory")
+
+    if not items:
+        info_card("No Items", "No inventory items available.")
+        return
+
+    names = {item.get('id'): item.get('name', 'Unknown') for item in items}
+
+    with st.form("stock_movement_form"):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            item_id = st.selectbox("Item *", list(names), format_func=lambda i: f"{names[i]} (ID: {i})")
+            kind = st.selectbox("Movement *", STOCK_MOVEMENT_KINDS)
+            quantity = st.number_input("Quantity * (counted stock for an Adjustment)", min_value=0, value=1)
+
+        with col2:
+            reference = st.text_input("Reference", placeholder="e.g., PO number, prescription, bill ID")
+            note = st.text_area("Note")
+
+        submit = st.form_submit_button("💾 Record Movement", type="primary", use_container_width=True)
+
+        if submit:
+            try:
+                movement = record_stock_movement(item_id, kind, quantity, reference or None, note or None)
+            except ValueError as e:
+                error_message(str(e))
+            else:
+                success_message(f"{kind} recorded for {names[item_id]}: {movement['quantity']:+} units, "
+                                f"balance {movement['balance']}")
+
+    ledger = get_stock_ledger()
+    col1, col2 = st.columns(2)
+
+    with col1:
+        metric_card("Movements Logged", ledger.seq)
+
+    with col2:
+        metric_card("Balance Snapshots", len(ledger.snapshots))
+
+    st.markdown("#### 🕒 Recent Movements")
+    movements = ledger.recent(50)
+    if movements:
+        st.dataframe(pd.DataFrame([{**movement, "name": names.get(movement["item_id"], "-")} for movement in movements],
+                                  columns=["seq", "at", "item_id", "name", "kind", "quantity", "balance", "reference", "note"]),
+                     use_container_width=True, hide_index=True)
+    else:
+        st.info("No stock movements recorded yet.")
+
+    st.markdown("#### 📅 Stock on a Past Date")
+    day = st.date_input("End of day", value=date.today(), key="stock_at_date")
+    balances = stock_at(day)
+    current = ledger.current()
+    rows = [{"id": item.get('id'), "name": item.get('name'), "unit": item.get('unit'),
+             "stock_on_date": balances.get(item.get('id')),
+             "current_stock": current.get(item.get('id'), item.get('quantity'))} for item in items]
+    paginated_table("table_stock_at", "stock", ["id", "name", "unit", "stock_on_date", "current_stock"], rows)
+    st.caption("Items without movements by then show no stock; "
+               "`python app.py reconcile-stock` opens the ledger of every item.")
+
 # ----------------- REPORTS ----------------------
 def show_reports():
     """Display reports and analytics"""
@@ -1996,58 +5826,48 @@ def show_reports():
     st.markdown("Comprehensive reports and data analytics")
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["📈 Overview", "👥 Patient Reports", "💰 Financial Reports"])
-
-    with tab1:
-        show_overview_reports()
-
-    with tab2:
-        show_patient_reports()
-
-    with tab3:
-        show_financial_reports()
+    lazy_tabs("tab_reports", [
+        ("📈 Overview", show_overview_reports),
+        ("👥 Patient Reports", show_patient_reports),
+        ("💰 Financial Reports", show_financial_reports),
+    ])
 
 def show_overview_reports():
     """Display overview reports"""
 
     st.markdown("### 📈 System Overview")
 
-    # Get all data
-    patients = load_data("patients")
-    doctors = load_data("doctors")
-    appointments = load_data("appointments")
-    inventory = load_data("inventory")
-    billing = load_data("billing")
+    # Get all counters
+    patients = get_aggregates("patients")
+    doctors = get_aggregates("doctors")
+    appointments = get_aggregates("appointments")
+    inventory = get_aggregates("inventory")
 
     # Summary statistics
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        metric_card("Total Patients", len(patients))
-        metric_card("Active Patients", len([p for p in patients if p.get('status') == 'Admitted']))
+        metric_card("Total Patients", patients.get("count", 0))
+        metric_card("Active Patients", patients.get("status=Admitted", 0))
 
     with col2:
-        metric_card("Total Doctors", len(doctors))
-        metric_card("Active Doctors", len([d for d in doctors if d.get('status') == 'Active']))
+        metric_card("Total Doctors", doctors.get("count", 0))
+        metric_card("Active Doctors", doctors.get("status=Active", 0))
 
     with col3:
-        metric_card("Total Appointments", len(appointments))
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        metric_card("Today's Appointments", len([a for a in appointments if a.get('appointment_date') == today]))
+        metric_card("Total Appointments", appointments.get("count", 0))
+        metric_card("Today's Appointments", date_range_count("appointments", date.today(), date.today()))
 
     with col4:
-        total_revenue = sum([b.get('total', 0) for b in billing])
-        metric_card("Total Revenue", f"${total_revenue:,.2f}")
-        metric_card("Inventory Items", len(inventory))
+        metric_card("Total Revenue", f"${revenue_total():,.2f}")
+        metric_card("Inventory Items", inventory.get("count", 0))
 
 def show_patient_reports():
     """Display patient-specific reports"""
 
     st.markdown("### 👥 Patient Reports")
 
-    patients = load_data("patients")
-
-    if not patients:
+    if not get_aggregates("patients").get("count"):
         info_card("No Data", "No patient data available for reports.")
         return
 
@@ -2056,34 +5876,16 @@ def show_patient_reports():
 
     with col1:
         # Gender distribution
-        gender_data = {}
-        for patient in patients:
-            gender = patient.get('gender', 'Unknown')
-            gender_data[gender] = gender_data.get(gender, 0) + 1
-
-        if gender_data:
-            fig_gender = px.pie(
-                values=list(gender_data.values()),
-                names=list(gender_data.keys()),
-                title="Patient Gender Distribution",
-                color_discrete_sequence=['#2E86AB', '#A23B72', '#F18F01']
-            )
+        fig_gender = cached_figure("patient_gender", [(get_index_store(), "patients")], patient_gender_pie)
+
+        if fig_gender:
             st.plotly_chart(fig_gender, use_container_width=True)
 
     with col2:
         # Status distribution
-        status_data = {}
-        for patient in patients:
-            status = patient.get('status', 'Unknown')
-            status_data[status] = status_data.get(status, 0) + 1
-
-        if status_data:
-            fig_status = px.bar(
-                x=list(status_data.keys()),
-                y=list(status_data.values()),
-                title="Patient Status Distribution",
-                color_discrete_sequence=['#2E86AB']
-            )
+        fig_status = cached_figure("patient_status", [(get_index_store(), "patients")], patient_status_bar)
+
+        if fig_status:
             st.plotly_chart(fig_status, use_container_width=True)
 
 # ----------------- SETTINGS ----------------------
@@ -2094,16 +5896,11 @@ def show_settings():
     st.markdown("System settings and user preferences")
 
     # Tab navigation
-    tab1, tab2, tab3 = st.tabs(["👤 User Profile", "🏥 Hospital Info", "🔧 System Settings"])
-
-    with tab1:
-        show_user_profile()
-
-    with tab2:
-        show_hospital_info()
-
-    with tab3:
-        show_system_settings()
+    lazy_tabs("tab_settings", [
+        ("👤 User Profile", show_user_profile),
+        ("🏥 Hospital Info", show_hospital_info),
+        ("🔧 System Settings", show_system_settings),
+    ])
 
 def show_user_profile():
     """Display user profile settings"""
@@ -2183,22 +5980,133 @@ def show_system_settings():
 
     with col1:
         if st.button("📤 Export Data", use_container_width=True):
-            info_card("Export", "Data export functionality will be implemented.")
+            st.session_state.show_export = not st.session_state.get('show_export', False)
 
     with col2:
         if st.button("📥 Import Data", use_container_width=True):
-            info_card("Import", "Data import functionality will be implemented.")
+            st.session_state.show_import = not st.session_state.get('show_import', False)
 
     with col3:
         if st.button("🗑️ Clear All Data", use_container_width=True):
             info_card("Clear Data", "Data clearing functionality will be implemented with proper confirmation.")
 
+    if st.session_state.get('show_export'):
+        show_export_data()
+
+    if st.session_state.get('show_import'):
+        show_import_data()
+
+    st.markdown("---")
+
+    # Storage and cache diagnostics
+    st.markdown("#### Storage & Cache")
+    cache_stats = get_cache_stats()
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        metric_card("Storage Engine", get_storage().name.upper())
+
+    with col2:
+        metric_card("Cache Hits", f"{cache_stats['hits']:,}")
+
+    with col3:
+        metric_card("Cache Misses", f"{cache_stats['misses']:,}")
+
+    with col4:
+        metric_card("Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+
+    import_timings = get_import_timings()
+    if import_timings:
+        st.markdown("#### Deferred Imports")
+        st.caption("Loaded on first use in this process")
+        for name, seconds in import_timings.items():
+            st.write(f"**{name}:** {seconds * 1000:,.0f} ms")
+
+def show_export_data():
+    """Export a dataset to CSV, JSON Lines or Parquet for download"""
+
+    st.markdown("#### 📤 Export Data")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        data_type = st.selectbox("Dataset", DATA_TYPES, format_func=str.title, key="export_dataset")
+        formats = EXPORT_FORMATS if _parquet()[0] is not None else [fmt for fmt in EXPORT_FORMATS if fmt != "parquet"]
+        fmt = st.selectbox("Format", formats, format_func=str.upper, key="export_format")
+
+    with col2:
+        all_columns = export_columns(data_type)
+        columns = st.multiselect("Columns", all_columns, default=all_columns, key=f"export_columns_{data_type}")
+        date_field = EXPORT_DATE_FIELDS[data_type]
+        date_range = None
+        if st.checkbox(f"Only records with {date_field} in a date range", key="export_by_date"):
+            date_range = st.date_input("Date range", value=(date.today() - timedelta(days=30), date.today()),
+                                       key="export_date_range")
+
+    if st.button("📤 Export", type="primary"):
+        if not columns:
+            error_message("Select at least one column to export.")
+            return
+        start, end = (tuple(date_range) + (None, None))[:2] if date_range else (None, None)
+        path, count = export_dataset(data_type, fmt, columns=columns, start=start, end=end)
+        st.session_state.export_result = (path, count)
+
+    result = st.session_state.get('export_result')
+    if result and os.path.exists(result[0]):
+        path, count = result
+        success_message(f"Exported {count:,} records to {path}")
+        with open(path, 'rb') as f:
+            st.download_button("⬇️ Download export", f, file_name=os.path.basename(path),
+                               mime="application/octet-stream")
+
+def show_import_data():
+    """Bulk import of patients, doctors or inventory from a CSV or JSON Lines file"""
+
+    st.markdown("#### 📥 Import Data")
+    st.caption("Columns are the record fields shown in the add forms (the id column is ignored, new ids are "
+               "assigned). Rows are checked like the forms check them; rejected rows are listed in an error "
+               "report. Uploading the same file again resumes an interrupted import.")
+
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        data_type = st.selectbox("Dataset", list(IMPORT_FIELDS), format_func=str.title, key="import_dataset")
+
+    with col2:
+        uploaded = st.file_uploader("File", type=["csv", "jsonl"], key="import_file")
+
+    if uploaded is None:
+        return
+
+    fmt = "jsonl" if uploaded.name.lower().endswith(".jsonl") else "csv"
+    job = import_job_id(data_type, uploaded.name, uploaded.size, uploaded.getvalue()[:65536])
+    progress = load_import_progress(job)
+    if progress and progress["finished"]:
+        st.caption(f"This file was already imported: {progress['imported']:,} records, {progress['failed']:,} rejected.")
+    elif progress:
+        st.caption(f"Import interrupted after {progress['rows_done']:,} rows; it continues from there.")
+
+    if st.button("📥 Start Import", type="primary"):
+        bar = st.progress(0.0)
+        total = max(uploaded.size, 1)
+        uploaded.seek(0)
+        f = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+        progress = import_records(data_type, f, fmt, job,
+                                  on_chunk=lambda p: bar.progress(min(uploaded.tell() / total, 1.0)))
+        f.detach()
+        bar.progress(1.0)
+        success_message(f"Imported {progress['imported']:,} {data_type} records, {progress['failed']:,} rows rejected.")
+
+    if progress and progress["failed"] and os.path.exists(import_errors_path(job)):
+        with open(import_errors_path(job), 'rb') as f:
+            st.download_button("⬇️ Download error report", f.read(), file_name=f"{job}.errors.csv", mime="text/csv")
+
 # ----------------- MAIN APPLICATION ----------------------
 def main():
     """Main application function"""
 
     load_css()
-    initialize_sample_data()
+    bootstrap()
 
     # Authentication check
     if 'logged_in' not in st.session_state or not st.session_state.logged_in:
@@ -2288,13 +6196,9 @@ def main():
 
         # System Status
         st.markdown("### 📊 System Status")
-        patients = load_data("patients")
-        doctors = load_data("doctors")
-        appointments = load_data("appointments")
-
-        st.metric("Total Patients", len(patients))
-        st.metric("Total Doctors", len(doctors))
-        st.metric("Total Appointments", len(appointments))
+        st.metric("Total Patients", get_aggregates("patients").get("count", 0))
+        st.metric("Total Doctors", get_aggregates("doctors").get("count", 0))
+        st.metric("Total Appointments", get_aggregates("appointments").get("count", 0))
 
         st.markdown("---")
 
@@ -2331,5 +6235,220 @@ def main():
     elif current_page == 'Dashboard':
         show_dashboard()
 
+# ----------------- COMMAND LINE ----------------------
+def run_cli(argv):
+    """Run maintenance commands headlessly, e.g. `python app.py migrate-sqlite`"""
+    parser = argparse.ArgumentParser(prog="app.py", description="Hospital Management System maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate-sqlite", help="Copy the JSON datasets into the SQLite database")
+    migrate.add_argument("--data-dir", default=DATA_DIR)
+    migrate.add_argument("--db", default=SQLITE_PATH)
+
+    migrate_jsonl = commands.add_parser("migrate-jsonl", help="Copy the JSON datasets into JSON Lines files")
+    migrate_jsonl.add_argument("--data-dir", default=DATA_DIR)
+
+    compact = commands.add_parser("compact", help="Fold JSON journals into their base files / drop superseded JSONL lines")
+    compact.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to compact (default: all)")
+
+    sequence = commands.add_parser("sequence", help="Show or configure id sequences")
+    sequence.add_argument("dataset", nargs="?", metavar="dataset")
+    sequence.add_argument("--prefix")
+    sequence.add_argument("--width", type=int)
+
+    convert = commands.add_parser("convert-columnar", help="Write Parquet copies of the datasets")
+    convert.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to convert (default: all)")
+
+    benchmark = commands.add_parser("benchmark", help="Compare JSON and Parquet size and load time")
+    benchmark.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to measure (default: all)")
+
+    rebuild = commands.add_parser("rebuild-aggregates", help="Recompute the dashboard counters and revenue rollup from the stored records")
+    rebuild.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to rebuild (default: all)")
+
+    upgrade = commands.add_parser("upgrade-records", help="Store records read in an older layout in the current one")
+    upgrade.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to upgrade (default: all)")
+
+    reindex = commands.add_parser("rebuild-indexes", help="Rebuild the search and filter indexes from the stored records")
+    reindex.add_argument("datasets", nargs="*", metavar="dataset", help="Datasets to rebuild (default: all indexed)")
+
+    batch = commands.add_parser("schedule-batch", help="Book a CSV or JSON Lines file of appointment requests")
+    batch.add_argument("file", help="Columns: patient_id, department, earliest_date, type, max_fee, notes")
+    batch.add_argument("--report", help="Write the requests that could not be placed to this CSV file")
+
+    bulk = commands.add_parser("import", help="Stream a CSV or JSON Lines file into patients, doctors or inventory")
+    bulk.add_argument("dataset", choices=list(IMPORT_FIELDS))
+    bulk.add_argument("file")
+    bulk.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension")
+    bulk.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS, help="Rows committed per write")
+    bulk.add_argument("--restart", action="store_true", help="Ignore saved progress and start from the first row")
+
+    export = commands.add_parser("export", help="Stream a dataset to CSV, JSON Lines or Parquet")
+    export.add_argument("dataset", choices=DATA_TYPES)
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export.add_argument("--output", "-o", help="Output file, '-' for stdout (default: data/exports/<dataset>.<format>)")
+    export.add_argument("--columns", help="Comma-separated columns to export (default: all record fields)")
+    export.add_argument("--since", type=date.fromisoformat, help="Only records dated on or after YYYY-MM-DD")
+    export.add_argument("--until", type=date.fromisoformat, help="Only records dated on or before YYYY-MM-DD")
+    export.add_argument("--date-field", help="Field the date range applies to (default depends on the dataset)")
+
+    billing = commands.add_parser("billing-run", help="Bill the day's discharges and completed appointments")
+    billing.add_argument("--date", type=date.fromisoformat, default=None, help="Day to bill, YYYY-MM-DD (default today)")
+    billing.add_argument("--workers", type=int, default=BILLING_WORKERS, help="Pricing processes (0: one per CPU)")
+    billing.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    stock = commands.add_parser("stock-at", help="Show inventory balances at the end of a day from the stock ledger")
+    stock.add_argument("date", type=date.fromisoformat, help="YYYY-MM-DD")
+
+    commands.add_parser("reconcile-stock", help="Log ledger entries for quantities changed outside the stock ledger")
+
+    setup = commands.add_parser("bootstrap", help="Create the data directory and import or seed datasets")
+    setup.add_argument("--no-seed", action="store_true", help="Do not add demo records to empty datasets")
+
+    commands.add_parser("profile-imports", help="Report the cold import cost of each heavy module")
+
+    args = parser.parse_args(argv)
+
+    for data_type in getattr(args, "datasets", None) or []:
+        if data_type not in DATA_TYPES:
+            parser.error(f"unknown dataset '{data_type}', expected one of {', '.join(DATA_TYPES)}")
+
+    if args.command == "bootstrap":
+        result = bootstrap(SEED_SAMPLE_DATA and not args.no_seed)
+        for data_type, count in result["migrated"].items():
+            print(f"{data_type}: imported {count} records from {DATA_DIR}/{data_type}.json")
+        print(f"Data directory ready ({result['engine']} engine, sample data {'seeded' if result['seeded'] else 'not seeded'})")
+        return
+
+    ensure_data_directory()
+
+    if args.command == "migrate-sqlite":
+        counts = migrate_json_to_sqlite(args.data_dir, args.db)
+        for data_type, count in counts.items():
+            print(f"{data_type}: {count} records")
+        print(f"Migrated {sum(counts.values())} records into {args.db}")
+        print("Set HMS_STORAGE_ENGINE=sqlite to serve the app from it")
+
+    elif args.command == "migrate-jsonl":
+        counts = migrate_json_to_jsonl(args.data_dir)
+        for data_type, count in counts.items():
+            print(f"{data_type}: {count} records")
+        print(f"Migrated {sum(counts.values())} records into {args.data_dir}/*.jsonl")
+        print("Set HMS_STORAGE_ENGINE=jsonl to serve the app from them")
+
+    elif args.command == "compact":
+        for data_type in args.datasets or DATA_TYPES:
+            print(f"{data_type}: {compact_data(data_type)} records")
+
+    elif args.command == "convert-columnar":
+        for data_type in args.datasets or DATA_TYPES:
+            count = convert_to_columnar(data_type)
+            print(f"{data_type}: {count} records -> {columnar_path(data_type)}")
+        print("Set HMS_COLUMNAR=1 to serve reports from the Parquet copies")
+
+    elif args.command == "benchmark":
+        print(f"Storage engine: {get_storage().name}")
+        print(f"{'dataset':<14}{'records':>10}{'size':>12}{'load':>10}{'parquet':>12}{'load':>10}{'columns':>10}")
+        for result in run_benchmark(args.datasets):
+            size = f"{result['size_bytes'] / 1024:,.1f}K" if "size_bytes" in result else "-"
+            parquet = f"{result['parquet_bytes'] / 1024:,.1f}K" if "parquet_bytes" in result else "-"
+            parquet_load = f"{result['parquet_load_s'] * 1000:,.1f}ms" if "parquet_load_s" in result else "-"
+            columns = f"{result['parquet_columns_s'] * 1000:,.1f}ms" if "parquet_columns_s" in result else "-"
+            print(f"{result['dataset']:<14}{result['records']:>10,}{size:>12}{result['load_s'] * 1000:>8,.1f}ms"
+                  f"{parquet:>12}{parquet_load:>10}{columns:>10}")
+
+    elif args.command == "rebuild-aggregates":
+        for data_type, counters in rebuild_aggregates(args.datasets).items():
+            print(f"{data_type}: {counters.get('count', 0)} records, {len(counters)} counters")
+        if "billing" in (args.datasets or DATA_TYPES):
+            cells = sum(key.startswith("count|") for key in rebuild_revenue_rollup())
+            print(f"billing: revenue rollup of {cells} cells")
+
+    elif args.command == "upgrade-records":
+        for data_type, count in persist_upgrades(args.datasets).items():
+            print(f"{data_type}: {count} records upgraded")
+
+    elif args.command == "rebuild-indexes":
+        for data_type, entry in rebuild_indexes(args.datasets).items():
+            print(f"{data_type}: {len(entry['slots'])} records, {len(entry['grams'])} n-grams, "
+                  f"{sum(len(values) for values in entry['bitmaps'].values())} bitmaps")
+
+    elif args.command == "schedule-batch":
+        started = time.perf_counter()
+        appointments, unplaced = schedule_batch(load_batch_requests(args.file))
+        print(f"Scheduled {len(appointments)} appointments in {time.perf_counter() - started:.2f}s, {len(unplaced)} unplaced")
+        for reason, count in collections.Counter(reason for _, reason in unplaced).most_common():
+            print(f"  {reason}: {count}")
+        if args.report:
+            with open(args.report, "w", encoding="utf-8", newline="") as f:
+                f.write(unplaced_report(unplaced))
+            print(f"Unplaced requests written to {args.report}")
+
+    elif args.command == "import":
+        started = time.perf_counter()
+        progress = import_file(args.dataset, args.file, args.format, args.chunk_rows, args.restart,
+                               on_chunk=lambda p: print(f"{p['rows_done']:,} rows: {p['imported']:,} imported, {p['failed']:,} rejected"))
+        print(f"{args.dataset}: {progress['imported']:,} imported, {progress['failed']:,} rejected "
+              f"in {progress['chunks']} chunks ({time.perf_counter() - started:.1f}s)")
+        if progress['failed']:
+            print(f"Rejected rows: {import_errors_path(progress['job'])}")
+
+    elif args.command == "export":
+        columns = [column.strip() for column in args.columns.split(",")] if args.columns else None
+        if args.output == "-":
+            if args.format == "parquet":
+                parser.error("Parquet exports need an --output file")
+            columns = columns or export_columns(args.dataset)
+            rows = export_rows(args.dataset, columns, args.since, args.until, args.date_field)
+            write_export(args.dataset, rows, columns, args.format, sys.stdout.buffer)
+        else:
+            started = time.perf_counter()
+            path, count = export_dataset(args.dataset, args.format, args.output, columns,
+                                         args.since, args.until, args.date_field)
+            print(f"{args.dataset}: {count:,} records -> {path} ({time.perf_counter() - started:.1f}s)")
+
+    elif args.command == "billing-run":
+        report = run_billing(args.date, args.workers)
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print(f"{report['date']}: {report['bills']:,} bills for {report['charges']:,} charges, "
+                  f"${report['total']:,.2f} ({report['already_billed']:,} already billed)")
+            print(f"Priced with {report['workers'] or 'no'} worker processes: collect {report['collect_s']:.2f}s, "
+                  f"price {report['price_s']:.2f}s, commit {report['commit_s']:.2f}s, "
+                  f"{report['bills_per_s']:,.0f} bills/s")
+
+    elif args.command == "stock-at":
+        balances = stock_at(args.date)
+        for item_id, balance in sorted(balances.items()):
+            print(f"{item_id}: {balance}")
+        print(f"{len(balances)} items with stock movements by {args.date.isoformat()}")
+
+    elif args.command == "reconcile-stock":
+        movements = reconcile_stock()
+        for movement in movements:
+            print(f"{movement['item_id']}: {movement['kind']} {movement['quantity']:+} -> {movement['balance']}")
+        print(f"Logged {len(movements)} movements")
+
+    elif args.command == "profile-imports":
+        deferred = {"pandas", "plotly.express", "pyarrow.parquet"}
+        for name, seconds in profile_imports().items():
+            cost = "not installed" if seconds is None else f"{seconds * 1000:,.1f}ms"
+            print(f"{name:<18}{cost:>16}  {'deferred' if name in deferred else 'at startup'}")
+
+    elif args.command == "sequence":
+        allocator = get_sequence_allocator()
+        if args.dataset:
+            if args.dataset not in DATA_TYPES:
+                parser.error(f"unknown dataset '{args.dataset}', expected one of {', '.join(DATA_TYPES)}")
+            allocator.configure(args.dataset, args.prefix, args.width)
+        sequences = allocator.current()
+        for data_type in DATA_TYPES:
+            if data_type in sequences:
+                seq = sequences[data_type]
+                print(f"{data_type}: next {seq['prefix']}{seq['next']:0{seq['width']}d}")
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+ENGINES = ["json", "sqlite", "jsonl"]
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run against an empty data/ directory under tmp_path with fresh process-wide singletons"""
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    app.ensure_data_directory()
+    yield tmp_path / app.DATA_DIR
+    st.cache_resource.clear()
+
+@pytest.fixture(params=ENGINES)
+def engine(request, data_dir, monkeypatch):
+    """Each storage engine in turn, selected as HMS_STORAGE_ENGINE would"""
+    monkeypatch.setattr(app, "STORAGE_ENGINE", request.param)
+    return request.param
+
+@pytest.fixture
+def seeded(engine):
+    """An engine prepared the way the app does on first start, with the demo records"""
+    app.bootstrap(True)
+    return engine
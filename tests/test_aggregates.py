@@ -0,0 +1,37 @@
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", **fields}
+
+def test_writes_update_aggregates(engine):
+    app.insert_records("patients", [patient("P001"), patient("P002", status="Discharged")])
+    app.update_record("patients", patient("P001", status="Discharged"))
+    counters = app.get_aggregates("patients")
+    assert counters["count"] == 2
+    assert counters["status=Discharged"] == 2
+    assert "status=Admitted" not in counters
+
+def test_write_from_another_process_is_counted(engine):
+    app.insert_records("patients", [patient("P001"), patient("P002")])
+    # Warm the dataset cache so load_data would still serve two records
+    assert len(app.load_data("patients")) == 2
+    app.STORAGE_ENGINES[engine]().insert("patients", patient("P050"))
+
+    assert app.get_aggregates("patients")["count"] == 3
+    assert app.get_aggregates("patients")["status=Admitted"] == 3
+
+def test_aggregates_are_trusted_within_the_window(engine, monkeypatch):
+    app.insert_record("patients", patient("P001"))
+    app.get_aggregates("patients")
+    storage = app.get_storage()
+    calls = []
+    monkeypatch.setattr(storage, "version", lambda data_type: calls.append(data_type))
+    for _ in range(5):
+        assert app.get_aggregates("patients")["count"] == 1
+    assert calls == []
+
+def test_rebuild_aggregates_from_storage(engine):
+    app.insert_records("patients", [patient("P001"), patient("P002")])
+    app.get_aggregate_store().rebuild(app.get_storage(), "patients", [])
+    assert app.get_aggregates("patients").get("count", 0) == 0
+    assert app.rebuild_aggregates(["patients"])["patients"]["count"] == 2
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+import app
+
+# A Monday well in the future, so no slot has passed yet
+MONDAY = date.today() + timedelta(days=14 - date.today().weekday())
+
+def hours(start, end):
+    return app.slot_mask(range(start * 60, end * 60, app.SLOT_MINUTES))
+
+def doctor(doctor_id="D001", schedule="Mon-Fri: 9:00 AM - 5:00 PM"):
+    return {"id": doctor_id, "name": f"Dr. {doctor_id}", "status": "Active", "schedule": schedule}
+
+def test_weekday_range():
+    assert app.parse_schedule("Mon-Fri: 9:00 AM - 5:00 PM") == [hours(9, 17)] * 5 + [0, 0]
+
+def test_several_clauses_and_ranges():
+    week = app.parse_schedule("Mon, Wed: 08:00-12:00, 14:00-18:00; Sat: 10 am to 1 pm\nSun: Closed")
+    split_day = hours(8, 12) | hours(14, 18)
+    assert week == [split_day, 0, split_day, 0, 0, hours(10, 13), 0]
+
+def test_ranges_wrap_around_the_week():
+    week = app.parse_schedule("Sat-Mon: 10:00-14:00")
+    assert [day for day, mask in enumerate(week) if mask] == [0, 5, 6]
+    assert app.parse_schedule("Weekends: 9:00-12:00") == [0] * 5 + [hours(9, 12)] * 2
+
+def test_clause_without_days_covers_every_day():
+    assert app.parse_schedule("9am-1pm") == [hours(9, 13)] * 7
+
+def test_ranges_are_cut_to_whole_slots_and_midnight():
+    week = app.parse_schedule("Tue: 9:15 - 10:45; Thu: 10 PM - 2 AM")
+    assert app.mask_minutes(week[1]) == [9 * 60 + 30, 10 * 60]
+    assert app.mask_minutes(week[3]) == list(range(22 * 60, 24 * 60, app.SLOT_MINUTES))
+
+def test_unreadable_schedule():
+    for text in ("", None, "By appointment", "Sun: Closed", "Someday: 9-5"):
+        assert app.parse_schedule(text) is None
+
+def test_weekly_availability_falls_back_and_recompiles(data_dir):
+    unreadable = doctor(schedule="On call")
+    assert app.weekly_availability(unreadable) == [app.DEFAULT_DAY_MASK] * 7
+    assert app.weekly_availability(doctor("D001", "Mon: 9-10")) == [hours(9, 10)] + [0] * 6
+    # Same doctor, new schedule: the cached week is replaced
+    assert app.weekly_availability(doctor("D001", "Tue: 9-10")) == [0, hours(9, 10)] + [0] * 5
+
+def test_available_slots_skip_booked_and_off_days(engine):
+    surgeon = doctor(schedule="Mon-Fri: 9:00 AM - 11:00 AM")
+    app.insert_record("doctors", surgeon)
+    assert app.available_slots(surgeon, MONDAY) == [540, 570, 600, 630]
+    assert app.available_slots(surgeon, MONDAY + timedelta(days=5)) == []
+    assert app.available_slots(surgeon, date.today() - timedelta(days=1)) == []
+
+    assert app.book_appointment({"id": "A001", "patient_id": "P001", "doctor_id": "D001", "status": "Scheduled",
+                                 "appointment_at": MONDAY.toordinal() * app.MINUTES_PER_DAY + 570})
+    assert app.available_slots(surgeon, MONDAY) == [540, 600, 630]
+    slots = app.next_free_slots([surgeon], 3, MONDAY)
+    assert [minutes % app.MINUTES_PER_DAY for minutes, _ in slots] == [540, 600, 630]
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import pytest
+
+import app
+
+MONDAY = date(2030, 1, 7)
+
+def doctor(record_id, fee, department="Cardiology", **fields):
+    return {"id": record_id, "name": f"Dr. {record_id}", "department": department, "status": "Active",
+            "consultation_fee": fee, "schedule": "Mon-Fri: 9:00 AM - 10:00 AM", **fields}
+
+def request(patient_id="P001", department="Cardiology", earliest_date=MONDAY, **fields):
+    return {"patient_id": patient_id, "department": department,
+            "earliest_date": str(earliest_date or ""), "type": "", "max_fee": "", "notes": "", **fields}
+
+def at(day, hour, minute=0):
+    return app.appointment_minutes(day.isoformat(), f"{hour:02d}:{minute:02d}")
+
+@pytest.fixture
+def clinic(engine):
+    app.insert_records("patients", [{"id": f"P00{n}", "name": f"Patient {n}", "status": "Admitted"} for n in range(1, 6)])
+    app.insert_records("doctors", [doctor("D001", 200), doctor("D002", 100), doctor("D003", 50, department="Neurology", status="Inactive")])
+    return engine
+
+def placed(appointments):
+    return [(appointment["patient_id"], appointment["doctor_id"], appointment["appointment_at"]) for appointment in appointments]
+
+def test_requests_get_the_earliest_slots_cheapest_doctor_first(clinic):
+    requests = [request("P001", earliest_date=MONDAY + timedelta(days=1)), request("P002"), request("P003"), request("P004")]
+    appointments, unplaced = app.schedule_batch(requests, start=MONDAY)
+    assert unplaced == []
+    assert placed(appointments) == [
+        ("P002", "D002", at(MONDAY, 9)),
+        ("P003", "D001", at(MONDAY, 9)),
+        ("P004", "D002", at(MONDAY, 9, 30)),
+        ("P001", "D002", at(MONDAY + timedelta(days=1), 9)),
+    ]
+    assert [record["id"] for record in app.load_data("appointments")] == [appointment["id"] for appointment in appointments]
+
+def test_unplaceable_requests_are_reported(clinic):
+    requests = [request("P404"), request(department="Neurology"), request(earliest_date="soon"),
+                request(max_fee="20"), request(max_fee="lots")]
+    requests = [dict(request, row=row) for row, request in enumerate(requests, 1)]
+    appointments, unplaced = app.schedule_batch(requests, start=MONDAY)
+    assert appointments == []
+    assert [reason for _, reason in unplaced] == [
+        "unknown patient", "no active doctor in department", "invalid earliest_date",
+        "no doctor within max_fee", "invalid max_fee",
+    ]
+    report = app.unplaced_report(unplaced).splitlines()
+    assert report[0] == ",".join(app.BATCH_REPORT_FIELDS)
+    assert report[1].startswith("1,P404,Cardiology,")
+
+def test_max_fee_picks_an_affordable_doctor(clinic):
+    appointments, _ = app.schedule_batch([request(max_fee="150")] * 3, start=MONDAY)
+    assert {appointment["doctor_id"] for appointment in appointments} == {"D002"}
+
+def test_window_runs_horizon_days_from_each_earliest_date(clinic):
+    # Four slots a day on a one-day horizon: the fifth request does not fit
+    appointments, unplaced = app.schedule_batch([request(f"P00{n}") for n in range(1, 6)], start=MONDAY, horizon=1)
+    assert len(appointments) == 4
+    assert [(request["patient_id"], reason) for request, reason in unplaced] == [("P005", "no free slot within 1 days")]
+
+def test_far_future_request_is_placed(clinic):
+    far = MONDAY + timedelta(weeks=20)
+    appointments, unplaced = app.schedule_batch([request(earliest_date=far), request("P002")], start=MONDAY)
+    assert unplaced == []
+    assert placed(appointments) == [("P002", "D002", at(MONDAY, 9)), ("P001", "D002", at(far, 9))]
+
+def test_batches_skip_booked_slots(clinic):
+    app.insert_record("appointments", {"id": "A001", "patient_id": "P005", "doctor_id": "D002",
+                                       "appointment_at": at(MONDAY, 9), "status": "Scheduled"})
+    first, _ = app.schedule_batch([request("P001")], start=MONDAY)
+    second, _ = app.schedule_batch([request("P002")], start=MONDAY)
+    assert placed(first + second) == [("P001", "D001", at(MONDAY, 9)), ("P002", "D002", at(MONDAY, 9, 30))]
+
+def test_csv_and_jsonl_requests_parse_alike():
+    csv_text = "patient_id,department,earliest_date,max_fee\nP001,Cardiology,2030-01-07,150\nP002,neurology,,\n"
+    jsonl_text = ('{"patient_id": "P001", "department": "Cardiology", "earliest_date": "2030-01-07", "max_fee": 150}\n'
+                  '{"patient_id": "P002", "department": "neurology"}\n')
+    requests = app.parse_batch_requests(csv_text)
+    assert requests == app.parse_batch_requests(jsonl_text)
+    assert requests[0] == {"patient_id": "P001", "department": "Cardiology", "earliest_date": "2030-01-07",
+                           "type": "", "max_fee": "150", "notes": "", "row": 1}
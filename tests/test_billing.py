@@ -0,0 +1,110 @@
+from datetime import date
+
+import pytest
+
+import app
+
+DAY = date(2025, 3, 3)
+
+@pytest.fixture
+def day_of_work(seeded):
+    """Two patients discharged on DAY after a four-day stay, each with a completed appointment"""
+    doctor = app.get_record("doctors", "D001")
+    app.insert_records("patients", [
+        {"id": patient_id, "name": f"Patient {patient_id}", "status": "Discharged",
+         "admission_date": "2025-02-27", "discharge_date": DAY.isoformat()}
+        for patient_id in ("P100", "P101")
+    ])
+    app.insert_records("appointments", [
+        {"id": appointment_id, "patient_id": patient_id, "patient_name": f"Patient {patient_id}",
+         "doctor_id": doctor["id"], "doctor_name": doctor["name"], "appointment_date": DAY.isoformat(),
+         "appointment_at": app.appointment_minutes(DAY.isoformat(), "10:00 AM"), "status": "Completed",
+         "type": "Consultation"}
+        for appointment_id, patient_id in (("A100", "P100"), ("A101", "P101"))
+    ])
+    return doctor
+
+def run_bills(day=DAY):
+    return [bill for bill in app.load_data("billing") if bill.get("bill_date") == day.isoformat()]
+
+def test_run_bills_stays_and_consultations(day_of_work):
+    report = app.run_billing(DAY, workers=1)
+    assert report["bills"] == 2
+    assert report["charges"] == 4
+    bill = next(bill for bill in run_bills() if bill["patient_id"] == "P100")
+    assert sorted(bill["sources"]) == ["appointment:A100", f"stay:P100:{DAY.isoformat()}"]
+    fee = day_of_work["consultation_fee"]
+    assert bill["subtotal"] == fee + 4 * app.BILLING_ROOM_RATE
+    assert bill["total"] == pytest.approx(bill["subtotal"] * (1 + app.BILLING_TAX_RATE / 100))
+    assert report["total"] == pytest.approx(sum(bill["total"] for bill in run_bills()))
+
+def test_rerun_is_idempotent(day_of_work):
+    app.run_billing(DAY, workers=1)
+    again = app.run_billing(DAY, workers=1)
+    assert again["bills"] == 0
+    assert again["already_billed"] == 4
+    assert len(run_bills()) == 2
+
+def test_pool_pricing_matches_inline(day_of_work, monkeypatch):
+    monkeypatch.setattr(app, "BILLING_PARALLEL_MIN", 1)
+    report = app.run_billing(DAY, workers=2)
+    assert report["workers"] == 2
+    assert report["bills"] == 2
+    assert app.run_billing(DAY, workers=2)["bills"] == 0
+
+def manual_bill(patient_id, bill_date):
+    app.insert_record("billing", {
+        "id": app.generate_id("billing"), "patient_id": patient_id, "bill_date": bill_date,
+        "items": [], "subtotal": 100, "tax": 10, "discount": 0, "total": 110,
+        "payment_status": "Paid", "payment_method": "Cash",
+    })
+
+def test_manual_bill_covers_appointment_on_its_day(day_of_work):
+    manual_bill("P100", DAY.isoformat())
+    report = app.run_billing(DAY, workers=1)
+    # P100's stay and consultation are both covered by the bill made by hand
+    assert report["already_billed"] == 2
+    assert [bill["patient_id"] for bill in run_bills() if bill.get("sources")] == ["P101"]
+
+def test_manual_bill_during_stay_covers_only_the_stay(day_of_work):
+    manual_bill("P100", "2025-02-28")
+    app.run_billing(DAY, workers=1)
+    bill = next(bill for bill in run_bills() if bill["patient_id"] == "P100")
+    assert bill["sources"] == ["appointment:A100"]
+
+def test_manual_bill_outside_the_window_is_ignored(day_of_work):
+    manual_bill("P100", "2025-02-01")
+    assert app.run_billing(DAY, workers=1)["bills"] == 2
+
+def test_only_the_requested_day_is_billed(day_of_work):
+    assert app.run_billing(date(2025, 3, 4), workers=1)["bills"] == 0
+
+def test_run_does_not_read_every_bill(day_of_work, monkeypatch):
+    app.run_billing(DAY, workers=1)
+    load_data = app.load_data
+
+    def load_data_but_bills(data_type):
+        assert data_type != "billing", "read every bill"
+        return load_data(data_type)
+    monkeypatch.setattr(app, "load_data", load_data_but_bills)
+    monkeypatch.setattr(app, "iter_records", lambda data_type: pytest.fail("read every bill"))
+    assert app.run_billing(DAY, workers=1)["already_billed"] == 4
+
+def test_bills_from_another_process_count(day_of_work, engine):
+    app.run_billing(DAY, workers=1)
+    app.STORAGE_ENGINES[engine]().insert("billing", {
+        "id": "B900", "patient_id": "P100", "bill_date": "2025-03-04", "items": [], "total": 0,
+        "payment_status": "Paid", "payment_method": "Cash", "sources": ["appointment:A102"],
+    })
+    app.insert_record("appointments", {
+        "id": "A102", "patient_id": "P100", "doctor_id": day_of_work["id"], "appointment_date": "2025-03-04",
+        "appointment_at": app.appointment_minutes("2025-03-04", "10:00 AM"), "status": "Completed",
+    })
+    assert app.run_billing(date(2025, 3, 4), workers=1)["already_billed"] == 1
+
+def test_charge_dropped_from_a_bill_is_billed_again(day_of_work):
+    app.run_billing(DAY, workers=1)
+    bill = next(bill for bill in run_bills() if bill["patient_id"] == "P101")
+    app.update_record("billing", dict(bill, sources=[f"stay:P101:{DAY.isoformat()}"]))
+    report = app.run_billing(DAY, workers=1)
+    assert (report["bills"], report["charges"]) == (1, 1)
@@ -0,0 +1,70 @@
+import random
+
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", "gender": "Female", **fields}
+
+def brute_counts(records, field, filters=None):
+    counts = {}
+    for record in records:
+        if all(app.bitmap_value(record.get(key)) == app.bitmap_value(value) for key, value in (filters or {}).items()):
+            value = app.bitmap_value(record.get(field))
+            counts[value] = counts.get(value, 0) + 1
+    return counts
+
+def test_encoded_bitmaps_round_trip():
+    rng = random.Random(7)
+    bitmaps = [0, 1, 0b1011, (1 << 5000) - 1, ((1 << 300) - 1) << 700, app.bitmap_from_slots([3, 64, 65, 9000])]
+    bitmaps += [rng.getrandbits(2000) for _ in range(20)]
+    for bitmap in bitmaps:
+        assert app.decode_bitmap(app.encode_bitmap(bitmap)) == bitmap
+    # Long runs are stored as [start, length] pairs, mixed bits as hex
+    assert app.encode_bitmap(((1 << 300) - 1) << 700) == [700, 300]
+    assert isinstance(app.encode_bitmap(int("10" * 500, 2)), str)
+
+def test_bitmap_slots_and_count():
+    slots = [0, 7, 8, 63, 1000]
+    bitmap = app.bitmap_from_slots(slots)
+    assert app.bitmap_slots(bitmap) == slots
+    assert app.bitmap_count(bitmap) == 5
+    assert app.bitmap_slots(0) == [] and app.bitmap_count(0) == 0
+
+def test_index_counts_follow_writes(engine):
+    records = [patient("P001"), patient("P002", gender="Male"), patient("P003", status="Discharged"), patient("P004", gender=None)]
+    app.insert_records("patients", records)
+    assert app.index_counts("patients", "status") == {"Admitted": 3, "Discharged": 1}
+    assert app.index_counts("patients", "gender") == {"Female": 2, "Male": 1, "Unknown": 1}
+    assert app.index_counts("patients", "gender", {"status": "Admitted"}) == {"Female": 1, "Male": 1, "Unknown": 1}
+
+    app.update_record("patients", patient("P001", status="Discharged"))
+    app.insert_record("patients", patient("P005", gender="Male"))
+    assert app.index_counts("patients", "status") == {"Admitted": 3, "Discharged": 2}
+    assert app.index_counts("patients", "status", {"gender": "Male"}) == {"Admitted": 2}
+
+    app.save_data("patients", [patient("P002", gender="Male"), patient("P005", gender="Male")])
+    assert app.index_counts("patients", "gender") == {"Male": 2}
+    assert app.index_values("patients", "status") == ["Admitted"]
+
+def test_index_counts_match_a_scan(engine):
+    rng = random.Random(11)
+    records = [patient(f"P{n:04d}", status=rng.choice(["Admitted", "Discharged", "Critical"]),
+                       gender=rng.choice(["Female", "Male", ""]), blood_group=rng.choice(["A+", "O-", None]))
+               for n in range(1, 301)]
+    app.insert_records("patients", records)
+    for n in rng.sample(range(300), 40):
+        records[n] = dict(records[n], status=rng.choice(["Admitted", "Discharged"]))
+        app.update_record("patients", records[n])
+    filters = {"status": "Discharged", "blood_group": "O-"}
+    assert app.index_counts("patients", "gender") == brute_counts(records, "gender")
+    assert app.index_counts("patients", "gender", filters) == brute_counts(records, "gender", filters)
+    expected = [record["id"] for record in records if record["status"] == "Discharged" and record["blood_group"] == "O-"]
+    assert [record["id"] for record in app.filter_records("patients", filters)] == expected
+
+    app.rebuild_indexes(["patients"])
+    assert app.index_counts("patients", "blood_group", {"gender": "Male"}) == brute_counts(records, "blood_group", {"gender": "Male"})
+
+def test_filter_records_with_unknown_values(engine):
+    app.insert_records("patients", [patient("P001", gender=""), patient("P002"), patient("P003", gender=None)])
+    assert [record["id"] for record in app.filter_records("patients", {"gender": "Unknown"})] == ["P001", "P003"]
+    assert app.filter_records("patients", {"gender": "Other"}) == []
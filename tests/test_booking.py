@@ -0,0 +1,44 @@
+from datetime import date
+
+import app
+
+DAY = "2030-01-07"
+
+def appointment(record_id, time, doctor_id="D001", **fields):
+    return {"id": record_id, "patient_id": "P001", "doctor_id": doctor_id,
+            "appointment_at": app.appointment_minutes(DAY, time), "status": "Scheduled", **fields}
+
+def test_second_booking_of_a_slot_is_rejected(engine):
+    assert app.book_appointment(appointment("A001", "09:00"))
+    assert not app.book_appointment(appointment("A002", "09:00"))
+    # Same 30-minute slot
+    assert not app.book_appointment(appointment("A003", "09:15"))
+    assert app.book_appointment(appointment("A004", "09:30"))
+    assert app.book_appointment(appointment("A005", "09:00", doctor_id="D002"))
+    assert [record["id"] for record in app.load_data("appointments")] == ["A001", "A004", "A005"]
+
+def test_cancelling_frees_the_slot(engine):
+    app.book_appointment(appointment("A001", "09:00"))
+    app.update_record("appointments", appointment("A001", "09:00", status="Cancelled"))
+    assert app.is_slot_free("D001", app.appointment_minutes(DAY, "09:00"))
+    assert app.book_appointment(appointment("A002", "09:00"))
+
+def test_rescheduling_moves_the_booked_slot(engine):
+    app.book_appointment(appointment("A001", "09:00"))
+    app.update_record("appointments", appointment("A001", "11:00"))
+    day = date.fromisoformat(DAY)
+    assert app.mask_minutes(app.occupied_mask("D001", day)) == [11 * 60]
+
+def test_existing_double_booking_keeps_the_slot_until_both_are_cancelled(engine):
+    app.insert_records("appointments", [appointment("A001", "09:00"), appointment("A002", "09:00")])
+    minutes = app.appointment_minutes(DAY, "09:00")
+    app.update_record("appointments", appointment("A001", "09:00", status="Cancelled"))
+    assert not app.is_slot_free("D001", minutes)
+    app.update_record("appointments", appointment("A002", "09:00", status="Cancelled"))
+    assert app.is_slot_free("D001", minutes)
+
+def test_booking_from_another_process_is_seen_within_the_window(engine):
+    app.book_appointment(appointment("A001", "09:00"))
+    assert app.is_slot_free("D001", app.appointment_minutes(DAY, "10:00"))
+    app.STORAGE_ENGINES[engine]().insert("appointments", appointment("A002", "10:00"))
+    assert not app.book_appointment(appointment("A003", "10:00"))
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import app
+
+DAY = date(2024, 3, 4)
+
+def appointment(record_id, day, time="09:00 AM", **fields):
+    return {"id": record_id, "patient_id": "P001", "doctor_id": "D001",
+            "appointment_at": app.appointment_minutes(day.isoformat(), time), "status": "Scheduled", **fields}
+
+def ids(records):
+    return [record["id"] for record in records]
+
+def test_range_is_inclusive_and_sorted_by_time(engine):
+    app.insert_records("appointments", [
+        appointment("A001", DAY + timedelta(days=1), "08:00 AM"),
+        appointment("A002", DAY, "03:00 PM"),
+        appointment("A003", DAY, "09:30 AM"),
+        appointment("A004", DAY - timedelta(days=1), "11:30 PM"),
+        appointment("A005", DAY + timedelta(days=2)),
+    ])
+    assert ids(app.date_range_records("appointments", DAY, DAY)) == ["A003", "A002"]
+    assert ids(app.date_range_records("appointments", DAY, DAY + timedelta(days=1))) == ["A003", "A002", "A001"]
+    assert ids(app.date_range_records("appointments", None, DAY)) == ["A004", "A003", "A002"]
+    assert ids(app.date_range_records("appointments", DAY + timedelta(days=1), None, limit=1)) == ["A001"]
+    assert app.date_range_count("appointments", DAY, DAY) == 2
+    assert app.date_range_count("appointments") == 5
+    assert app.date_range_count("appointments", DAY + timedelta(days=3), None) == 0
+
+def test_range_with_filters_and_limit(engine):
+    # Enough records to take both the per-slot and the whole-bitmap filter paths
+    records = [appointment(f"A{n:03d}", DAY + timedelta(days=n % 10), status="Completed" if n % 3 else "Scheduled")
+               for n in range(1, 301)]
+    app.insert_records("appointments", records)
+    expected = sorted((record for record in records if record["status"] == "Scheduled"),
+                      key=lambda record: (record["appointment_at"], record["id"]))
+    assert ids(app.date_range_records("appointments", None, None, {"status": "Scheduled"})) == ids(expected)
+    assert ids(app.date_range_records("appointments", DAY, DAY, {"status": "Scheduled"}, limit=3)) == \
+        ids([record for record in expected if record["appointment_at"] // app.MINUTES_PER_DAY == DAY.toordinal()][:3])
+    assert app.date_range_records("appointments", DAY, DAY, {"status": "Cancelled"}) == []
+
+def test_index_follows_reschedules_and_legacy_records(engine):
+    legacy = {"id": "A002", "patient_id": "P001", "doctor_id": "D001", "status": "Scheduled",
+              "appointment_date": DAY.isoformat(), "appointment_time": "10:00 AM"}
+    app.insert_records("appointments", [appointment("A001", DAY), legacy, appointment("A003", DAY, appointment_at=None)])
+    assert ids(app.date_range_records("appointments", DAY, DAY)) == ["A001", "A002"]
+
+    app.update_record("appointments", appointment("A001", DAY + timedelta(days=7)))
+    assert ids(app.date_range_records("appointments", DAY, DAY)) == ["A002"]
+    assert ids(app.date_range_records("appointments", DAY + timedelta(days=7), None)) == ["A001"]
+
+def test_discharge_dates(engine):
+    app.insert_records("patients", [
+        {"id": "P001", "name": "A", "status": "Discharged", "discharge_date": DAY.isoformat()},
+        {"id": "P002", "name": "B", "status": "Admitted"},
+        {"id": "P003", "name": "C", "status": "Discharged", "discharge_date": (DAY - timedelta(days=1)).isoformat()},
+    ])
+    assert ids(app.date_range_records("patients", DAY - timedelta(days=1), DAY, {"status": "Discharged"})) == ["P003", "P001"]
+    assert app.date_range_count("patients") == 2
@@ -0,0 +1,58 @@
+import csv
+import json
+import os
+from datetime import date
+
+import pytest
+
+import app
+
+def bill(record_id, bill_date, total, **fields):
+    return {"id": record_id, "patient_id": "P001", "bill_date": bill_date, "total": total,
+            "items": [{"description": "Consultation", "amount": total}], "payment_status": "Paid", **fields}
+
+BILLS = [bill("B001", "2024-01-05", 100.5), bill("B002", "2024-02-10", 20), bill("B003", "", 5, notes="no date")]
+
+def test_csv_export_with_columns_and_dates(engine):
+    app.insert_records("billing", BILLS)
+    path, count = app.export_dataset("billing", "csv", columns=["id", "total", "items"],
+                                     start=date(2024, 1, 1), end=date(2024, 1, 31))
+    assert path == os.path.join(app.EXPORT_DIR, "billing.csv")
+    assert count == 1
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows == [["id", "total", "items"], ["B001", "100.5", json.dumps(BILLS[0]["items"])]]
+
+def test_jsonl_export_keeps_values_and_default_columns(engine):
+    app.insert_records("billing", BILLS)
+    path, count = app.export_dataset("billing", "jsonl", path="out/bills.jsonl", start=date(2024, 2, 1))
+    assert (path, count) == ("out/bills.jsonl", 1)
+    with open(path) as f:
+        rows = [json.loads(line) for line in f]
+    assert list(rows[0]) == app.RECORD_FIELDS["billing"]
+    assert rows[0]["total"] == 20 and rows[0]["items"] == BILLS[1]["items"]
+    assert rows[0]["discount"] is None
+
+    # Without a date range undated records are exported too
+    assert app.export_dataset("billing", "jsonl", path="out/all.jsonl")[1] == 3
+
+def test_appointments_export_time_labels(engine):
+    app.insert_record("appointments", {"id": "A001", "patient_id": "P001", "doctor_id": "D001", "status": "Scheduled",
+                                       "appointment_date": "2024-03-04", "appointment_time": "02:30 PM"})
+    path, _ = app.export_dataset("appointments", "jsonl", columns=["id", "appointment_time", "appointment_at"])
+    with open(path) as f:
+        assert json.loads(f.readline()) == {"id": "A001", "appointment_time": "02:30 PM",
+                                            "appointment_at": app.appointment_minutes("2024-03-04", "02:30 PM")}
+
+def test_parquet_export_in_batches(engine, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(app, "EXPORT_BATCH_ROWS", 2)
+    app.insert_records("billing", BILLS + [bill("B004", "2024-01-06", None)])
+    path, count = app.export_dataset("billing", "parquet", columns=["id", "bill_date", "total", "items"])
+    assert count == 4
+    table = pq.read_table(path)
+    assert str(table.schema.field("total").type) == "double"
+    assert table.column("id").to_pylist() == ["B001", "B002", "B003", "B004"]
+    assert table.column("total").to_pylist() == [100.5, 20.0, 5.0, None]
+    assert json.loads(table.column("items").to_pylist()[0]) == BILLS[0]["items"]
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
@@ -0,0 +1,25 @@
+import app
+
+def bill(record_id, total, bill_date="2026-03-04", **fields):
+    return {"id": record_id, "patient_id": "P001", "bill_date": bill_date, "total": total,
+            "payment_status": "Paid", "payment_method": "Cash", **fields}
+
+def revenue_figure():
+    return app.cached_figure("monthly_revenue", [(app.get_revenue_rollup_store(), "billing")], app.monthly_revenue_bar)
+
+def test_figure_is_reused_until_the_data_changes(engine):
+    app.insert_record("billing", bill("B001", 100))
+    figure = revenue_figure()
+    assert revenue_figure() is figure
+    app.insert_record("billing", bill("B002", 50))
+    assert list(revenue_figure().data[0].y) == [150]
+
+def test_figure_follows_a_write_from_another_process(engine, monkeypatch):
+    app.insert_record("billing", bill("B001", 100))
+    assert list(revenue_figure().data[0].y) == [100]
+    app.STORAGE_ENGINES[engine]().insert("billing", bill("B050", 25))
+    # The rollup is trusted for the revalidation window, and so is the figure
+    assert list(revenue_figure().data[0].y) == [100]
+
+    monkeypatch.setattr(app, "CACHE_REVALIDATE_SECONDS", 0)
+    assert list(revenue_figure().data[0].y) == [125]
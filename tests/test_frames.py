@@ -0,0 +1,35 @@
+import pytest
+
+import app
+
+def item(record_id, quantity, **fields):
+    return {"id": record_id, "name": f"Item {record_id}", "category": "Medicine", "quantity": quantity,
+            "minimum_stock": 10, "price_per_unit": 2.5, "status": "In Stock", **fields}
+
+def test_frame_has_typed_columns(engine):
+    app.insert_records("inventory", [item("I001", 5), item("I002", "n/a", category="Supplies")])
+    frame = app.dataset_frame("inventory")
+    assert list(frame["id"]) == ["I001", "I002"]
+    assert str(frame["category"].dtype) == "category"
+    assert frame["quantity"].isna().tolist() == [False, True]
+    assert list(app.low_stock_frame()["id"]) == ["I001", "I002"]
+
+def test_frame_follows_writes(engine):
+    app.insert_record("inventory", item("I001", 5))
+    assert len(app.dataset_frame("inventory")) == 1
+    app.update_record("inventory", item("I001", 50))
+    app.insert_record("inventory", item("I002", 1))
+    assert app.dataset_frame("inventory").set_index("id")["quantity"].to_dict() == {"I001": 50, "I002": 1}
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_write_from_another_process_reaches_the_frame(engine, monkeypatch, columnar):
+    monkeypatch.setattr(app, "COLUMNAR_ENABLED", columnar)
+    # Keep the background rewrite out of the test; the copy is written here
+    monkeypatch.setattr(app.ColumnarRefresher, "request", lambda self, data_type: None)
+    app.insert_records("inventory", [item("I001", 5), item("I002", 50)])
+    if columnar:
+        app.convert_to_columnar("inventory")
+    assert len(app.dataset_frame("inventory")) == 2
+    app.STORAGE_ENGINES[engine]().insert("inventory", item("I050", 1))
+
+    assert list(app.dataset_frame("inventory")["id"]) == ["I001", "I002", "I050"]
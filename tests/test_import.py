@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+import app
+
+HEADER = "name,category,quantity,unit,price_per_unit\n"
+
+def inventory_csv(rows, bad_every=0):
+    lines = [HEADER]
+    for n in range(1, rows + 1):
+        quantity = "many" if bad_every and n % bad_every == 0 else str(n)
+        lines.append(f"Item {n},Medicine,{quantity},Tablets,1.5\n")
+    return "".join(lines)
+
+def run_import(text, job="job", **kwargs):
+    return app.import_records("inventory", io.StringIO(text), "csv", job, **kwargs)
+
+class Interrupted(Exception):
+    pass
+
+def test_import_validates_rows(engine):
+    progress = run_import(inventory_csv(20, bad_every=5), chunk_rows=6)
+    assert progress["imported"] == 16
+    assert progress["failed"] == 4
+    assert progress["finished"]
+    with open(app.import_errors_path("job")) as f:
+        assert len(f.read().splitlines()) == 5
+
+def test_import_resumes_after_interruption(engine):
+    text = inventory_csv(25, bad_every=10)
+
+    def stop_after_two_chunks(progress):
+        if progress["chunks"] == 2:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        run_import(text, chunk_rows=5, on_chunk=stop_after_two_chunks)
+    assert len(app.load_data("inventory")) == 9
+
+    progress = run_import(text, chunk_rows=5)
+    names = [item["name"] for item in app.load_data("inventory")]
+    assert len(names) == len(set(names)) == 23
+    assert progress["imported"] == 23
+    assert progress["failed"] == 2
+    with open(app.import_errors_path("job")) as f:
+        assert len(f.read().splitlines()) == 3
+
+def test_import_resumes_after_crash_mid_commit(engine, monkeypatch):
+    text = inventory_csv(12)
+    insert_records = app.insert_records
+    calls = []
+
+    def crash_after_storing_second_chunk(data_type, records):
+        insert_records(data_type, records)
+        calls.append(len(records))
+        if len(calls) == 2:
+            raise Interrupted
+
+    monkeypatch.setattr(app, "insert_records", crash_after_storing_second_chunk)
+    with pytest.raises(Interrupted):
+        run_import(text, chunk_rows=4)
+    monkeypatch.setattr(app, "insert_records", insert_records)
+
+    progress = run_import(text, chunk_rows=4)
+    ids = [item["id"] for item in app.load_data("inventory")]
+    assert len(ids) == len(set(ids)) == 12
+    assert progress["imported"] == 12
+    # The redone chunk replaced its stored copy, so derived counts are not doubled
+    assert app.get_aggregates("inventory")["count"] == 12
+    assert app.index_counts("inventory", "category") == {"Medicine": 12}
+
+def test_restart_imports_again(engine):
+    run_import(inventory_csv(3))
+    run_import(inventory_csv(3), restart=True)
+    assert len(app.load_data("inventory")) == 6
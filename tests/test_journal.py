@@ -0,0 +1,35 @@
+import os
+
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", **fields}
+
+def test_json_journal_replay_after_crash(data_dir):
+    storage = app.JSONStorage(str(data_dir))
+    storage.save("patients", [patient("P001")])
+    storage.insert("patients", patient("P002"))
+    storage.update("patients", patient("P001", status="Discharged"))
+    # A crash in the middle of an append leaves a torn last line
+    with open(storage.journal_path("patients"), "ab") as f:
+        f.write(b'{"op": "upsert", "record": {"id": "P0')
+
+    restarted = app.JSONStorage(str(data_dir))
+    records = restarted.load("patients")
+    assert [(record["id"], record["status"]) for record in records] == [("P001", "Discharged"), ("P002", "Admitted")]
+
+    restarted.insert("patients", patient("P003"))
+    assert [record["id"] for record in app.JSONStorage(str(data_dir)).load("patients")] == ["P001", "P002", "P003"]
+
+    assert restarted.compact("patients") == 3
+    assert not os.path.exists(storage.journal_path("patients"))
+    assert [record["id"] for record in app.JSONStorage(str(data_dir)).load("patients")] == ["P001", "P002", "P003"]
+
+def test_json_journal_refresh_is_incremental(data_dir, monkeypatch):
+    monkeypatch.setattr(app, "STORAGE_ENGINE", "json")
+    app.insert_record("patients", patient("P001"))
+    app.load_data("patients")
+    refreshes = app.get_cache_stats()["refreshes"]
+    app.insert_record("patients", patient("P002"))
+    assert [record["id"] for record in app.load_data("patients")] == ["P001", "P002"]
+    assert app.get_cache_stats()["refreshes"] == refreshes + 1
@@ -0,0 +1,33 @@
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", **fields}
+
+def test_jsonl_append_after_crash(data_dir):
+    storage = app.JSONLStorage(str(data_dir))
+    storage.insert("patients", patient("P001"))
+    with open(storage.path("patients"), "ab") as f:
+        f.write(b'{"id": "P0')
+
+    restarted = app.JSONLStorage(str(data_dir))
+    restarted.insert("patients", patient("P002"))
+    reopened = app.JSONLStorage(str(data_dir))
+    assert [record["id"] for record in reopened.load("patients")] == ["P001", "P002"]
+    assert reopened.get("patients", "P002")["name"] == "Patient P002"
+
+def test_jsonl_insert_reports_replaced_records(data_dir):
+    storage = app.JSONLStorage(str(data_dir))
+    assert storage.insert_many("patients", [patient("P001"), patient("P002")]) == [None, None]
+    replaced = storage.insert_many("patients", [patient("P002", age=5), patient("P003"), patient("P002", age=6)])
+    assert replaced == [patient("P002"), None, patient("P002", age=5)]
+    assert app.JSONLStorage(str(data_dir)).insert("patients", patient("P001", age=7)) == patient("P001")
+    assert [record.get("age") for record in storage.load("patients")] == [7, 6, None]
+
+def test_replayed_append_is_not_counted_twice(data_dir, monkeypatch):
+    monkeypatch.setattr(app, "STORAGE_ENGINE", "jsonl")
+    batch = [patient("P001"), patient("P002", status="Discharged")]
+    app.insert_records("patients", batch)
+    assert app.get_aggregates("patients")["count"] == 2
+    app.insert_records("patients", batch)
+    assert app.get_aggregates("patients") == app.rebuild_aggregates(["patients"])["patients"]
+    assert app.index_counts("patients", "status") == {"Admitted": 1, "Discharged": 1}
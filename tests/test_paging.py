@@ -0,0 +1,33 @@
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", **fields}
+
+def all_pages(sort_by=None, descending=False, page_size=3):
+    total = len(app.load_data("patients"))
+    ids = []
+    for offset in range(0, total, page_size):
+        ids += [record["id"] for record in app.load_page("patients", offset, page_size, sort_by, descending)]
+    return ids
+
+def test_page_ordering_sorts_ids_numerically(engine):
+    ids = ["P1000", "P998", "P5", "P999", "P1001", "P010"]
+    app.insert_records("patients", [patient(record_id) for record_id in ids])
+    assert all_pages("id") == ["P5", "P010", "P998", "P999", "P1000", "P1001"]
+    assert all_pages("id", descending=True) == ["P1001", "P1000", "P999", "P998", "P010", "P5"]
+
+def test_pages_do_not_repeat_rows_with_equal_sort_values(engine):
+    app.insert_records("patients", [patient(f"P{n:03d}", age=30 + n % 2) for n in range(1, 11)])
+    for sort_by in (None, "age", "status"):
+        for descending in (False, True):
+            ids = all_pages(sort_by, descending)
+            assert sorted(ids) == [f"P{n:03d}" for n in range(1, 11)], (sort_by, descending)
+    assert all_pages("age")[:5] == ["P002", "P004", "P006", "P008", "P010"]
+
+def test_sorted_pages_follow_writes(engine):
+    app.insert_records("patients", [patient(f"P{n:03d}", age=n) for n in range(1, 6)])
+    assert all_pages("age", descending=True) == ["P005", "P004", "P003", "P002", "P001"]
+    app.update_record("patients", patient("P001", age=50))
+    app.insert_record("patients", patient("P006", age=0))
+    assert all_pages("age", descending=True) == ["P001", "P005", "P004", "P003", "P002", "P006"]
+    assert [record["id"] for record in app.load_page("patients", 4, 10, "age", True)] == ["P002", "P006"]
@@ -0,0 +1,48 @@
+import app
+
+def bill(record_id, bill_date, total, status="Paid", method="Cash"):
+    return {"id": record_id, "patient_id": "P001", "bill_date": bill_date, "total": total,
+            "payment_status": status, "payment_method": method}
+
+BILLS = [
+    bill("B001", "2024-01-05", 100.10),
+    bill("B002", "2024-01-20", 0.20, method="Card"),
+    bill("B003", "2024-02-01", 50, status="Pending", method="Card"),
+    bill("B004", "", 10),
+]
+
+def test_revenue_cube_by_month_and_day(engine):
+    app.insert_records("billing", BILLS)
+    assert app.revenue_cube() == [
+        ("2024-01", "Paid", "Card", 1, 0.2),
+        ("2024-01", "Paid", "Cash", 1, 100.1),
+        ("2024-02", "Pending", "Card", 1, 50.0),
+        ("Unknown", "Paid", "Cash", 1, 10.0),
+    ]
+    assert [cell[:4] for cell in app.revenue_cube("day")][:2] == [("2024-01-05", "Paid", "Cash", 1), ("2024-01-20", "Paid", "Card", 1)]
+
+def test_revenue_series_and_totals(engine):
+    app.insert_records("billing", BILLS)
+    # Totals are kept in cents, so sums stay exact
+    assert app.revenue_series() == {"2024-01": 100.3, "2024-02": 50.0}
+    assert app.revenue_series("month", by="payment_method") == {"2024-01": {"Cash": 100.1, "Card": 0.2}, "2024-02": {"Card": 50.0}}
+    assert app.revenue_series("day", filters={"payment_status": "Paid"}) == {"2024-01-05": 100.1, "2024-01-20": 0.2}
+    assert app.revenue_total() == 160.3
+    assert app.revenue_total({"payment_method": "Card"}) == 50.2
+
+def test_rollup_follows_updates_and_removals(engine):
+    app.insert_records("billing", BILLS)
+    app.update_record("billing", bill("B003", "2024-02-01", 50, status="Paid", method="Card"))
+    app.update_record("billing", bill("B001", "2024-03-01", 80))
+    assert app.revenue_series("month", by="payment_status") == {"2024-01": {"Paid": 0.2}, "2024-02": {"Paid": 50.0}, "2024-03": {"Paid": 80.0}}
+    app.save_data("billing", [bill("B002", "2024-01-20", 0.20, method="Card")])
+    assert app.revenue_cube() == [("2024-01", "Paid", "Card", 1, 0.2)]
+    assert app.revenue_total() == 0.2
+
+def test_rebuild_after_edits_outside_the_app(engine):
+    app.insert_records("billing", BILLS)
+    assert app.revenue_total() == 160.3
+    # Written straight to storage, so the rollup does not see it until rebuilt
+    app.get_storage().save("billing", [bill("B009", "2024-05-05", 7)])
+    app.rebuild_revenue_rollup()
+    assert app.revenue_cube() == [("2024-05", "Paid", "Cash", 1, 7.0)]
@@ -0,0 +1,74 @@
+import app
+
+def patient(record_id, name, **fields):
+    return {"id": record_id, "name": name, "status": "Admitted", "gender": "Female", **fields}
+
+PATIENTS = [
+    patient("P001", "Maria Anderson"),
+    patient("P002", "Anders Berg", gender="Male"),
+    patient("P003", "Anderson Cooper", status="Discharged", gender="Male"),
+    patient("P004", "Ole Sanders"),
+    patient("P005", "Anders"),
+]
+
+def ids(records):
+    return [record["id"] for record in records]
+
+def test_search_ranks_exact_then_prefix_then_word_then_substring(engine):
+    app.insert_records("patients", PATIENTS)
+    total, records = app.search_records("patients", "anders")
+    assert total == 5
+    assert ids(records) == ["P005", "P002", "P003", "P001", "P004"]
+
+def test_search_is_case_insensitive_and_limited(engine):
+    app.insert_records("patients", PATIENTS)
+    total, records = app.search_records("patients", "  ANDERSON ", limit=1)
+    assert total == 2
+    assert ids(records) == ["P003"]
+    assert app.search_records("patients", "xyz") == (0, [])
+
+def test_search_with_filters(engine):
+    app.insert_records("patients", PATIENTS)
+    total, records = app.search_records("patients", "and", {"gender": "Male", "status": "Admitted"})
+    assert (total, ids(records)) == (1, ["P002"])
+    # Without text every record matching the filters is returned in dataset order
+    assert ids(app.search_records("patients", "", {"gender": "Female"})[1]) == ["P001", "P004", "P005"]
+
+def test_search_text_shorter_than_a_trigram(engine):
+    app.insert_records("patients", PATIENTS)
+    assert ids(app.search_records("patients", "ol")[1]) == ["P004"]
+
+def test_search_follows_updates_and_new_records(engine):
+    app.insert_records("patients", PATIENTS)
+    app.update_record("patients", patient("P004", "Ole Berg"))
+    app.insert_record("patients", patient("P006", "Sandersen"))
+    assert ids(app.search_records("patients", "anders")[1]) == ["P005", "P002", "P003", "P001", "P006"]
+    assert ids(app.search_records("patients", "berg")[1]) == ["P004", "P002"]
+
+def test_write_from_another_process_is_indexed(engine):
+    app.insert_records("patients", PATIENTS[:2])
+    # Warm the dataset cache so load_data would still serve two records
+    assert len(app.load_data("patients")) == 2
+    app.STORAGE_ENGINES[engine]().insert("patients", patient("P050", "Zora Anders"))
+
+    assert ids(app.search_records("patients", "zora")[1]) == ["P050"]
+    assert app.index_counts("patients", "gender") == {"Female": 2, "Male": 1}
+
+def test_indexes_are_trusted_within_the_window(engine, monkeypatch):
+    app.insert_records("patients", PATIENTS)
+    app.search_records("patients", "anders")
+    calls = []
+    monkeypatch.setattr(app.get_storage(), "version", lambda data_type: calls.append(data_type))
+    for _ in range(5):
+        assert app.search_records("patients", "anders")[0] == 5
+        assert app.index_counts("patients", "status") == {"Admitted": 4, "Discharged": 1}
+    assert calls == []
+
+def test_write_from_another_process_is_seen_after_the_window(engine, monkeypatch):
+    app.insert_records("patients", PATIENTS)
+    assert app.search_records("patients", "zora")[0] == 0
+    app.STORAGE_ENGINES[engine]().insert("patients", patient("P050", "Zora Anders"))
+    assert app.search_records("patients", "zora")[0] == 0
+
+    monkeypatch.setattr(app, "CACHE_REVALIDATE_SECONDS", 0)
+    assert ids(app.search_records("patients", "zora")[1]) == ["P050"]
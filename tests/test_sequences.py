@@ -0,0 +1,29 @@
+import json
+
+import app
+
+def test_ids_grow_past_the_configured_width(data_dir):
+    allocator = app.SequenceAllocator(str(data_dir / "sequences.json"))
+    ids = allocator.allocate("patients", 1001)
+    assert ids[0] == "P001"
+    assert ids[998:] == ["P999", "P1000", "P1001"]
+    assert len(set(ids)) == 1001
+    assert allocator.allocate("patients") == ["P1002"]
+
+def test_sequence_starts_after_highest_stored_id(engine):
+    app.insert_records("patients", [{"id": "P999"}, {"id": "P1000"}, {"id": "P007"}])
+    assert app.allocate_ids("patients", 2) == ["P1001", "P1002"]
+    assert app.generate_id("patients") == "P1003"
+
+def test_sequences_survive_a_new_allocator(data_dir):
+    path = str(data_dir / "sequences.json")
+    app.SequenceAllocator(path).allocate("billing", 5)
+    assert app.SequenceAllocator(path).allocate("billing") == ["B006"]
+    with open(path) as f:
+        assert json.load(f)["billing"]["next"] == 7
+
+def test_configure_prefix_and_width(data_dir):
+    allocator = app.SequenceAllocator(str(data_dir / "sequences.json"))
+    allocator.allocate("doctors", 2)
+    allocator.configure("doctors", prefix="DR", width=5)
+    assert allocator.allocate("doctors") == ["DR00003"]
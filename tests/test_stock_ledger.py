@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+import app
+
+@pytest.fixture
+def ledger(seeded, monkeypatch):
+    monkeypatch.setattr(app, "STOCK_SNAPSHOT_INTERVAL", 4)
+    return app.get_stock_ledger()
+
+def test_movements_keep_a_running_balance(ledger):
+    opening = app.get_record("inventory", "M001")["quantity"]
+    app.record_stock_movement("M001", "Receipt", 100)
+    app.record_stock_movement("M001", "Dispense", 30)
+    movement = app.record_stock_movement("M001", "Expiry Write-off", 5)
+    assert movement["balance"] == opening + 65
+    assert app.current_stock("M001") == opening + 65
+    assert app.get_record("inventory", "M001")["quantity"] == opening + 65
+
+    movement = app.record_stock_movement("M001", "Adjustment", 12)
+    assert movement["quantity"] == 12 - (opening + 65)
+    assert app.get_record("inventory", "M001")["status"] == "Low Stock"
+    assert [entry["kind"] for entry in ledger.recent(10)] == [
+        "Adjustment", "Expiry Write-off", "Dispense", "Receipt", "Opening"]
+
+def test_stock_cannot_go_negative(ledger):
+    quantity = app.get_record("inventory", "E001")["quantity"]
+    with pytest.raises(ValueError):
+        app.record_stock_movement("E001", "Dispense", quantity + 1)
+    assert app.get_record("inventory", "E001")["quantity"] == quantity
+
+def test_point_in_time_balances_use_snapshots(ledger):
+    history = []
+    for n in range(1, 11):
+        movement = app.record_stock_movement("M001", "Receipt", n)
+        history.append((movement["at"], movement["balance"]))
+    assert len(ledger.snapshots) >= 2
+
+    restarted = app.StockLedger(app.STOCK_LEDGER_PATH, app.STOCK_SNAPSHOT_DIR, 4)
+    for at, balance in history:
+        assert restarted.balances_at(at)["M001"] == balance
+    assert restarted.balances_at("2000-01-01T00:00:00") == {}
+    assert app.stock_at(datetime.date.today())["M001"] == history[-1][1]
+
+def test_reconcile_records_outside_changes(ledger):
+    app.record_stock_movement("M001", "Receipt", 1)
+    item = app.get_record("inventory", "M001")
+    app.update_record("inventory", {**item, "quantity": 7})
+    movements = app.reconcile_stock()
+    assert {(movement["item_id"], movement["kind"]) for movement in movements} == {
+        ("M001", "Adjustment"), ("E001", "Opening")}
+    assert app.current_stock("M001") == 7
+    assert app.reconcile_stock() == []
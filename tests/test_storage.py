@@ -0,0 +1,45 @@
+import app
+
+def patient(record_id, **fields):
+    return {"id": record_id, "name": f"Patient {record_id}", "status": "Admitted", **fields}
+
+def test_round_trip(engine):
+    app.insert_record("patients", patient("P001", age=40))
+    app.insert_records("patients", [patient("P002"), patient("P003", status="Discharged")])
+    app.update_record("patients", patient("P001", age=41))
+
+    records = app.load_data("patients")
+    assert [record["id"] for record in records] == ["P001", "P002", "P003"]
+    assert records[0]["age"] == 41
+    assert app.get_record("patients", "P003")["status"] == "Discharged"
+    assert app.get_record("patients", "P404") is None
+    assert sorted(record["id"] for record in app.iter_records("patients")) == ["P001", "P002", "P003"]
+
+def test_save_replaces_dataset(engine):
+    app.insert_records("patients", [patient("P001"), patient("P002")])
+    app.save_data("patients", [patient("P009")])
+    assert [record["id"] for record in app.load_data("patients")] == ["P009"]
+
+def test_inserting_a_stored_id_replaces_the_record(engine):
+    app.insert_records("patients", [patient("P001"), patient("P002")])
+    # Derived stores that are already built are updated in place
+    assert app.get_aggregates("patients")["count"] == 2
+    assert app.index_counts("patients", "status") == {"Admitted": 2}
+    app.insert_record("patients", patient("P002", status="Discharged"))
+    app.insert_records("patients", [patient("P001", age=50), patient("P003"), patient("P003", status="Discharged")])
+
+    records = app.load_data("patients")
+    assert [(record["id"], record["status"]) for record in records] == [
+        ("P001", "Admitted"), ("P002", "Discharged"), ("P003", "Discharged")]
+    assert records[0]["age"] == 50
+    counters = app.get_aggregates("patients")
+    assert (counters["count"], counters["status=Discharged"]) == (3, 2)
+    assert counters == app.rebuild_aggregates(["patients"])["patients"]
+    assert app.index_counts("patients", "status") == {"Admitted": 1, "Discharged": 2}
+
+def test_json_without_journal_upserts_too(data_dir):
+    storage = app.JSONStorage(str(data_dir), journal=False)
+    storage.insert_many("patients", [patient("P001"), patient("P002")])
+    storage.insert("patients", patient("P001", status="Discharged"))
+    assert [(record["id"], record["status"]) for record in storage.load("patients")] == [
+        ("P001", "Discharged"), ("P002", "Admitted")]